@@ -0,0 +1,149 @@
+"""Per-worker read caches kept coherent across workers with Postgres LISTEN/NOTIFY.
+
+Triggers on the cached tables publish `{"table": ..., "key": ...}` on the
+`cache_invalidation` channel (see supabase_schema.sql). Every worker holds a
+single listener connection and evicts the matching key when a notification
+arrives. If that connection drops, notifications may have been missed, so all
+caches are cleared before listening again.
+
+A fill (read from the database, then `set`) can straddle a notification:
+the read returns the old row, the eviction lands, and the set puts the old
+row back for a whole TTL. Readers take a `fill_token` before the read and
+pass it to `set`, which drops the value if the key was evicted since.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "cache_invalidation"
+_MISSING = object()
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after `ttl` seconds."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        # key -> token of the latest fill in progress; eviction discards it
+        self._fills: Dict[Hashable, object] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def fill_token(self, key: Hashable) -> object:
+        """Take before reading `key` from its source; hand to `set` with the value read."""
+        token = object()
+        with self._lock:
+            self._fills.pop(key, None)
+            self._fills[key] = token
+            # Reads that failed never come back to set; forget the oldest
+            while len(self._fills) > self.maxsize:
+                del self._fills[next(iter(self._fills))]
+        return token
+
+    def set(self, key: Hashable, value: Any, token: Optional[object] = None) -> None:
+        """Store `value`; with a `token`, only if `key` wasn't evicted or refilled since it was taken."""
+        with self._lock:
+            if token is not None:
+                if self._fills.get(key) is not token:
+                    return
+                del self._fills[key]
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+            self._fills.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._fills.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class FeedCache(TTLCache):
+    """Cache of whole list responses; any row change can alter every cached feed."""
+
+    def pop(self, key: Hashable) -> None:
+        self.clear()
+
+
+class InvalidationBus:
+    def __init__(self, dsn: str, caches: Dict[str, List[TTLCache]], reconnect_delay: float = 5.0):
+        self.dsn = dsn
+        # table name -> caches keyed by that table's notification key
+        self.caches = caches
+        self.reconnect_delay = reconnect_delay
+        self.connected = False
+
+    def handle(self, payload: str) -> None:
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            logger.warning(f"Ignoring malformed invalidation payload: {payload!r}")
+            return
+        if event.get("key") is None:
+            return
+        for cache in self.caches.get(event.get("table"), ()):
+            cache.pop(event["key"])
+
+    def clear_all(self) -> None:
+        for caches in self.caches.values():
+            for cache in caches:
+                cache.clear()
+
+    async def run(self) -> None:
+        """Listen until cancelled, reconnecting (and flushing caches) on connection loss."""
+        try:
+            import asyncpg
+        except ImportError:
+            logger.warning("asyncpg not installed; cross-worker cache invalidation disabled")
+            return
+
+        while True:
+            connection: Optional[Any] = None
+            try:
+                connection = await asyncpg.connect(self.dsn)
+                lost = asyncio.Event()
+                connection.add_termination_listener(lambda _conn: lost.set())
+                await connection.add_listener(CHANNEL, lambda _conn, _pid, _channel, payload: self.handle(payload))
+                # Anything cached before this point may have missed its notification
+                self.clear_all()
+                self.connected = True
+                logger.info("Cache invalidation listener connected")
+                await lost.wait()
+                logger.warning("Cache invalidation listener connection lost")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Cache invalidation listener error: {e}")
+            finally:
+                self.connected = False
+                if connection is not None and not connection.is_closed():
+                    await connection.close()
+            self.clear_all()
+            await asyncio.sleep(self.reconnect_delay)
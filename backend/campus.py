@@ -0,0 +1,144 @@
+"""Campus context and per-campus routing of Supabase queries.
+
+One deployment serves several universities. Each request names its campus
+(X-Campus header or `?campus=`, else the default), which is held in a
+context variable for the request and for any thread it hands work to.
+
+`CampusClient` is a drop-in `LazyClient` that acts on the current campus:
+
+- Campus-owned tables (listings, inspections, saved searches) get a
+  `campus = <current>` filter on every select, update and delete, and the
+  campus stamped on every inserted row, so handlers can't forget it.
+- A campus configured with its own Supabase project is served entirely by
+  that project's client; the other campuses share the default project.
+
+In-memory structures built from one campus's listings (similarity and
+duplicate indexes, saved-search matchers, feed caches) live in `PerCampus`
+maps, so a large campus never makes lookups on a small one slower.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from db import LazyClient
+
+# Tables with a campus column that the API scopes to the request's campus
+CAMPUS_TABLES = frozenset({"properties", "inspections", "saved_searches"})
+
+CAMPUS_HEADER = "X-Campus"
+
+
+class CampusRegistry:
+    def __init__(self, default: str, names: List[str]):
+        self.default = default
+        self.names = [default] + [name for name in dict.fromkeys(names) if name != default]
+        self._current: ContextVar[Optional[str]] = ContextVar("campus", default=None)
+
+    def current(self) -> str:
+        return self._current.get() or self.default
+
+    @contextmanager
+    def use(self, campus: str) -> Iterator[str]:
+        token = self._current.set(campus)
+        try:
+            yield campus
+        finally:
+            self._current.reset(token)
+
+    def resolve(self, value: Optional[str]) -> Optional[str]:
+        """The campus a request asked for, the default if it didn't say, or None if unknown."""
+        if not value:
+            return self.default
+        value = value.strip().lower()
+        return value if value in self.names else None
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __contains__(self, campus: str) -> bool:
+        return campus in self.names
+
+
+class _CampusTable:
+    """Wraps a postgrest request builder so every statement is confined to one campus."""
+
+    def __init__(self, builder, campus: str):
+        self._builder = builder
+        self._campus = campus
+
+    def _stamp(self, payload):
+        if isinstance(payload, list):
+            return [{**row, "campus": self._campus} for row in payload]
+        return {**payload, "campus": self._campus}
+
+    def select(self, *args, **kwargs):
+        return self._builder.select(*args, **kwargs).eq("campus", self._campus)
+
+    def update(self, payload, *args, **kwargs):
+        return self._builder.update(payload, *args, **kwargs).eq("campus", self._campus)
+
+    def delete(self, *args, **kwargs):
+        return self._builder.delete(*args, **kwargs).eq("campus", self._campus)
+
+    def insert(self, payload, *args, **kwargs):
+        return self._builder.insert(self._stamp(payload), *args, **kwargs)
+
+    def upsert(self, payload, *args, **kwargs):
+        return self._builder.upsert(self._stamp(payload), *args, **kwargs)
+
+
+class CampusClient(LazyClient):
+    def __init__(self, url: str, key: str, campuses: CampusRegistry,
+                 databases: Optional[Dict[str, LazyClient]] = None, read_rpcs: Iterable[str] = ()):
+        super().__init__(url, key, read_rpcs=read_rpcs)
+        self.campuses = campuses
+        # campus -> client for its own Supabase project; absent campuses use this one
+        self.databases = databases or {}
+
+    def _routed(self) -> Optional[LazyClient]:
+        return self.databases.get(self.campuses.current())
+
+    def get(self):
+        routed = self._routed()
+        return routed.get() if routed is not None else super().get()
+
+    def table(self, name: str, scoped: bool = True):
+        """Builder for `name` in the current campus's database.
+
+        `scoped=False` skips the campus filter, for system paths that address
+        rows by a globally unique key (payment settlement, trending events).
+        """
+        routed = self._routed()
+        builder = routed.table(name) if routed is not None else super().table(name)
+        if scoped and name in CAMPUS_TABLES:
+            return _CampusTable(builder, self.campuses.current())
+        return builder
+
+    def database_campuses(self) -> List[str]:
+        """One campus per distinct database, for jobs that maintain a whole database."""
+        return [self.campuses.default] + [c for c in self.databases if c != self.campuses.default]
+
+    def close(self) -> None:
+        super().close()
+        for client in self.databases.values():
+            client.close()
+
+
+class PerCampus(dict):
+    """campus -> `factory()`, built on first use."""
+
+    def __init__(self, campuses: CampusRegistry, factory: Callable[[], object]):
+        super().__init__()
+        self.campuses = campuses
+        self.factory = factory
+
+    def __missing__(self, campus: str):
+        value = self[campus] = self.factory()
+        return value
+
+    def current(self):
+        return self[self.campuses.current()]
+
+    def pop(self, campus: str, default=None):
+        # Invalidation by campus: the next use starts from an empty instance
+        return super().pop(campus, default)
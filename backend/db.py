@@ -0,0 +1,157 @@
+"""Supabase client handles and read/write routing.
+
+Importing `supabase` pulls in postgrest, gotrue, storage and realtime, which
+dominates server.py's import time. The handles below defer that import and
+the client construction until a request (or the lifespan warm-up) needs it.
+
+Reads that tolerate staleness can be sent to read replicas through
+`ReplicaRouter.reader()`. Writes always go to the primary, and a request that
+wrote (or a user who wrote within the last few seconds) keeps reading from
+the primary so they see their own changes.
+"""
+import itertools
+import logging
+import threading
+import time
+from contextvars import ContextVar
+from typing import Callable, Iterable, List, Optional
+
+from cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+_WRITE_METHODS = {"insert", "update", "upsert", "delete"}
+
+# Cookie carrying "read from the primary until <epoch seconds>" across workers
+READ_YOUR_WRITES_COOKIE = "db_primary_until"
+
+# Mutable per-request state shared between the middleware and the handler
+_request_state: ContextVar[Optional[dict]] = ContextVar("db_request_state", default=None)
+
+
+class _TrackedTable:
+    """Wraps a postgrest request builder and reports write operations."""
+
+    def __init__(self, builder, on_write: Callable[[], None]):
+        self._builder = builder
+        self._on_write = on_write
+
+    def __getattr__(self, name):
+        if name in _WRITE_METHODS:
+            self._on_write()
+        return getattr(self._builder, name)
+
+
+class LazyClient:
+    def __init__(self, url: str, key: str, on_write: Optional[Callable[[], None]] = None,
+                 read_rpcs: Iterable[str] = ()):
+        self._url = url
+        self._key = key
+        self._client = None
+        self._lock = threading.Lock()
+        self.on_write = on_write
+        # Functions known not to write; any other RPC counts as a write
+        self.read_rpcs = frozenset(read_rpcs)
+
+    @property
+    def configured(self) -> bool:
+        return bool(self._url and self._key)
+
+    @property
+    def initialized(self) -> bool:
+        return self._client is not None
+
+    def get(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from supabase import create_client
+                    self._client = create_client(self._url, self._key)
+        return self._client
+
+    def table(self, name: str):
+        builder = self.get().table(name)
+        return _TrackedTable(builder, self.on_write) if self.on_write else builder
+
+    def rpc(self, name: str, params: Optional[dict] = None):
+        if self.on_write and name not in self.read_rpcs:
+            self.on_write()
+        return self.get().rpc(name, params or {})
+
+    def close(self) -> None:
+        client, self._client = self._client, None
+        if client is None:
+            return
+        for closer in (client.postgrest.session.close, client.auth.close):
+            try:
+                closer()
+            except Exception as e:
+                logger.warning(f"Error closing Supabase client: {e}")
+
+    def __bool__(self) -> bool:
+        return self.configured
+
+    def __getattr__(self, name):
+        # Only reached for attributes not defined above, i.e. the real client's API
+        return getattr(self.get(), name)
+
+
+class ReplicaRouter:
+    def __init__(self, primary: LazyClient, replica_urls: List[str], key: str, read_your_writes_seconds: float,
+                 replica_client: Callable[[str, str], LazyClient] = LazyClient):
+        self.primary = primary
+        self.replicas = [replica_client(url, key) for url in replica_urls]
+        self.healthy = [True] * len(self.replicas)
+        self.read_your_writes_seconds = read_your_writes_seconds
+        self._round_robin = itertools.count()
+        # user id -> True while that user's recent write may not have replicated
+        self._recent_writers = TTLCache(maxsize=50000, ttl=read_your_writes_seconds)
+        primary.on_write = self.mark_write
+
+    def begin_request(self, primary_until: float = 0.0) -> dict:
+        state = {"wrote": False, "user_id": None, "primary_until": primary_until}
+        _request_state.set(state)
+        return state
+
+    def set_user(self, user_id: str) -> None:
+        state = _request_state.get()
+        if state is not None:
+            state["user_id"] = user_id
+
+    def mark_write(self, user_id: Optional[str] = None) -> None:
+        """Record a write so the current request and `user_id` read from the primary for a while."""
+        state = _request_state.get()
+        if state is not None:
+            state["wrote"] = True
+            user_id = user_id or state["user_id"]
+        if user_id:
+            self._recent_writers.set(user_id, True)
+
+    def reader(self, user_id: Optional[str] = None) -> LazyClient:
+        """Client for a read that may be slightly stale, unless read-your-writes requires the primary."""
+        if not self.replicas:
+            return self.primary
+        state = _request_state.get()
+        if state is not None:
+            if state["wrote"] or state["primary_until"] > time.time():
+                return self.primary
+            user_id = user_id or state["user_id"]
+        if user_id and self._recent_writers.get(user_id):
+            return self.primary
+
+        healthy = [r for r, ok in zip(self.replicas, self.healthy) if ok]
+        if not healthy:
+            return self.primary
+        return healthy[next(self._round_robin) % len(healthy)]
+
+    def check_replicas(self) -> None:
+        for i, replica in enumerate(self.replicas):
+            try:
+                replica.table("properties").select("id").limit(1).execute()
+                ok = True
+            except Exception as e:
+                logger.warning(f"Read replica {i} failed health check: {e}")
+                ok = False
+            if ok != self.healthy[i]:
+                logger.info(f"Read replica {i} is now {'healthy' if ok else 'unhealthy'}")
+            self.healthy[i] = ok
@@ -0,0 +1,222 @@
+"""Duplicate and near-duplicate listing detection.
+
+Text: each listing's title, description and location are normalized and cut
+into character shingles, summarized by a MinHash signature and bucketed with
+LSH (BANDS bands of ROWS rows), so a lookup only compares signatures that
+share a band. Candidates whose estimated Jaccard similarity reaches the
+threshold are reported.
+
+Images: each image gets a 64-bit difference hash (dHash). The hash is split
+into IMAGE_BANDS exact-match bands, so any two hashes within
+IMAGE_BANDS - 1 differing bits share at least one band.
+
+Everything lives in memory and is updated incrementally; periodic reloads
+from the database pick up listings created on other workers.
+"""
+import asyncio
+import io
+import logging
+import re
+import threading
+import zlib
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set
+
+import httpx
+import numpy as np
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+SHINGLE_SIZE = 5
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+TEXT_THRESHOLD = 0.7
+
+IMAGE_BANDS = 4
+IMAGE_BAND_BITS = 64 // IMAGE_BANDS
+IMAGE_MAX_DISTANCE = IMAGE_BANDS - 1
+MAX_IMAGE_BYTES = 10 * 1024 * 1024
+
+# Fields the index needs from a listing row
+INDEX_FIELDS = ("id", "title", "description", "location", "image_hashes")
+
+_PRIME = (1 << 31) - 1
+_rng = np.random.default_rng(1675)
+_A = _rng.integers(1, _PRIME, NUM_PERM, dtype=np.uint64)
+_B = _rng.integers(0, _PRIME, NUM_PERM, dtype=np.uint64)
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+
+def shingles(listing: dict) -> Set[str]:
+    text = " ".join(listing.get(field) or "" for field in ("title", "description", "location"))
+    text = _NON_ALNUM.sub(" ", text.lower()).strip()
+    if len(text) <= SHINGLE_SIZE:
+        return {text} if text else set()
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def signature(shingle_set: Iterable[str]) -> np.ndarray:
+    hashes = np.fromiter((zlib.crc32(s.encode()) % _PRIME for s in shingle_set), dtype=np.uint64)
+    # Both factors are below 2**31, so the products fit in uint64
+    return ((hashes[:, None] * _A + _B) % _PRIME).min(axis=0).astype(np.uint32)
+
+
+def dhash(data: bytes) -> str:
+    """64-bit difference hash of an image, as 16 hex digits."""
+    with Image.open(io.BytesIO(data)) as img:
+        pixels = np.asarray(img.convert("L").resize((9, 8), Image.Resampling.LANCZOS), dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return np.packbits(bits).tobytes().hex()
+
+
+def _image_bands(value: int) -> List[int]:
+    mask = (1 << IMAGE_BAND_BITS) - 1
+    return [(value >> (i * IMAGE_BAND_BITS)) & mask for i in range(IMAGE_BANDS)]
+
+
+async def fetch_image_hashes(urls: List[str], timeout: float = 10.0,
+                             transport: Optional[httpx.AsyncBaseTransport] = None) -> List[str]:
+    """dHashes of the images that could be downloaded and decoded; failures are skipped."""
+    if Image is None:
+        logger.warning("Pillow not installed; image duplicate detection disabled")
+        return []
+
+    async def fetch(client: httpx.AsyncClient, url: str) -> Optional[str]:
+        try:
+            response = await client.get(url)
+            response.raise_for_status()
+            if len(response.content) > MAX_IMAGE_BYTES:
+                return None
+            return await asyncio.to_thread(dhash, response.content)
+        except Exception as e:
+            logger.warning(f"Could not hash image {url}: {e}")
+            return None
+
+    async with httpx.AsyncClient(timeout=timeout, transport=transport, follow_redirects=True) as client:
+        hashes = await asyncio.gather(*(fetch(client, url) for url in urls))
+    return [h for h in hashes if h]
+
+
+class DuplicateIndex:
+    def __init__(self, text_threshold: float = TEXT_THRESHOLD):
+        self.text_threshold = text_threshold
+        self._lock = threading.Lock()
+        self._signatures: Dict[str, np.ndarray] = {}
+        self._bands: List[Dict[bytes, Set[str]]] = [defaultdict(set) for _ in range(BANDS)]
+        self._images: Dict[str, List[int]] = {}
+        self._image_bands: List[Dict[int, Set[str]]] = [defaultdict(set) for _ in range(IMAGE_BANDS)]
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    def rebuild(self, listings: List[dict]) -> None:
+        fresh = DuplicateIndex(self.text_threshold)
+        for listing in listings:
+            fresh._add_locked(listing)
+        with self._lock:
+            self._signatures, self._bands = fresh._signatures, fresh._bands
+            self._images, self._image_bands = fresh._images, fresh._image_bands
+
+    def add(self, listing: dict) -> None:
+        with self._lock:
+            self._add_locked(listing)
+
+    def add_images(self, listing_id: str, image_hashes: List[str]) -> None:
+        with self._lock:
+            self._remove_images(listing_id)
+            self._index_images(listing_id, image_hashes)
+
+    def remove(self, listing_id: str) -> None:
+        with self._lock:
+            self._remove_text(listing_id)
+            self._remove_images(listing_id)
+
+    def _add_locked(self, listing: dict) -> None:
+        listing_id = listing["id"]
+        self._remove_text(listing_id)
+        shingle_set = shingles(listing)
+        if shingle_set:
+            sig = signature(shingle_set)
+            self._signatures[listing_id] = sig
+            for band, key in enumerate(self._band_keys(sig)):
+                self._bands[band][key].add(listing_id)
+        if listing.get("image_hashes") is not None:
+            self._remove_images(listing_id)
+            self._index_images(listing_id, listing["image_hashes"])
+
+    def _index_images(self, listing_id: str, image_hashes: List[str]) -> None:
+        values = [int(h, 16) for h in image_hashes]
+        if not values:
+            return
+        self._images[listing_id] = values
+        for value in values:
+            for band, key in enumerate(_image_bands(value)):
+                self._image_bands[band][key].add(listing_id)
+
+    def _remove_text(self, listing_id: str) -> None:
+        sig = self._signatures.pop(listing_id, None)
+        if sig is None:
+            return
+        for band, key in enumerate(self._band_keys(sig)):
+            bucket = self._bands[band].get(key)
+            if bucket is not None:
+                bucket.discard(listing_id)
+                if not bucket:
+                    del self._bands[band][key]
+
+    def _remove_images(self, listing_id: str) -> None:
+        for value in self._images.pop(listing_id, ()):
+            for band, key in enumerate(_image_bands(value)):
+                bucket = self._image_bands[band].get(key)
+                if bucket is not None:
+                    bucket.discard(listing_id)
+                    if not bucket:
+                        del self._image_bands[band][key]
+
+    @staticmethod
+    def _band_keys(sig: np.ndarray) -> List[bytes]:
+        return [sig[band * ROWS:(band + 1) * ROWS].tobytes() for band in range(BANDS)]
+
+    def find_text(self, listing: dict) -> Optional[dict]:
+        """Most similar other listing by text, if its estimated Jaccard similarity reaches the threshold."""
+        shingle_set = shingles(listing)
+        if not shingle_set:
+            return None
+        sig = signature(shingle_set)
+        with self._lock:
+            candidates = set()
+            for band, key in enumerate(self._band_keys(sig)):
+                candidates |= self._bands[band].get(key, set())
+            candidates.discard(listing.get("id"))
+            if not candidates:
+                return None
+            ids = list(candidates)
+            scores = (np.stack([self._signatures[c] for c in ids]) == sig).sum(axis=1)
+        top = int(scores.argmax())
+        best, best_score = ids[top], float(scores[top]) / NUM_PERM
+        if best_score < self.text_threshold:
+            return None
+        return {"duplicate_of": best, "duplicate_score": round(best_score, 3), "duplicate_reason": "text"}
+
+    def find_images(self, listing_id: Optional[str], image_hashes: List[str]) -> Optional[dict]:
+        """Another listing sharing a near-identical image (at most IMAGE_MAX_DISTANCE differing bits)."""
+        best, best_distance = None, IMAGE_MAX_DISTANCE + 1
+        with self._lock:
+            for value in (int(h, 16) for h in image_hashes):
+                candidates = set()
+                for band, key in enumerate(_image_bands(value)):
+                    candidates |= self._image_bands[band].get(key, set())
+                candidates.discard(listing_id)
+                for candidate in candidates:
+                    distance = min(bin(value ^ other).count("1") for other in self._images[candidate])
+                    if distance < best_distance:
+                        best, best_distance = candidate, distance
+        if best is None:
+            return None
+        return {"duplicate_of": best, "duplicate_score": round(1 - best_distance / 64, 3), "duplicate_reason": "images"}
@@ -0,0 +1,79 @@
+"""Per-campus gazetteers and geocoding helpers for property locations."""
+import re
+from typing import Optional, Tuple
+
+# Approximate centroids (latitude, longitude) of common student areas around
+# LAUTECH, Ogbomoso. Keys are normalized aliases as agents tend to type them.
+GAZETTEER = {
+    "lautech main gate": (8.1617, 4.2637),
+    "main gate": (8.1617, 4.2637),
+    "lautech back gate": (8.1702, 4.2689),
+    "back gate": (8.1702, 4.2689),
+    "second gate": (8.1702, 4.2689),
+    "under g": (8.1583, 4.2601),
+    "under-g": (8.1583, 4.2601),
+    "stadium": (8.1552, 4.2563),
+    "adenike": (8.1541, 4.2658),
+    "yoaco": (8.1525, 4.2612),
+    "aroje": (8.1760, 4.2735),
+    "ogbomoso high school": (8.1468, 4.2489),
+    "general gas": (8.1498, 4.2530),
+    "takie": (8.1336, 4.2418),
+    "oja igbo": (8.1384, 4.2443),
+    "sabo": (8.1402, 4.2525),
+    "isale afon": (8.1296, 4.2380),
+    "apake": (8.1460, 4.2592),
+    "caretaker": (8.1590, 4.2672),
+    "odo oba": (8.1265, 4.2280),
+    "randa": (8.1630, 4.2760),
+    "akingbade": (8.1575, 4.2712),
+    "tipper garage": (8.1665, 4.2580),
+}
+
+# Named reference points accepted by `near=` on GET /properties
+CAMPUS_POINTS = {
+    "main-gate": GAZETTEER["lautech main gate"],
+    "back-gate": GAZETTEER["lautech back gate"],
+}
+
+# Campus -> (gazetteer, reference points). Campuses without an entry only get
+# coordinates the agent pinned, and `near=` only accepts `lat,lng` for them.
+CAMPUS_GAZETTEERS = {
+    "lautech": (GAZETTEER, CAMPUS_POINTS),
+}
+
+# Longest aliases first so "lautech main gate" wins over "main gate"
+_ALIASES = {campus: sorted(gazetteer, key=len, reverse=True) for campus, (gazetteer, _) in CAMPUS_GAZETTEERS.items()}
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"[^a-z0-9-]+", " ", text.lower()).strip()
+
+
+def geocode(location: str, campus: str = "lautech") -> Optional[Tuple[float, float]]:
+    """Resolve free-text location to coordinates using the campus's gazetteer."""
+    if not location or campus not in CAMPUS_GAZETTEERS:
+        return None
+    gazetteer = CAMPUS_GAZETTEERS[campus][0]
+    text = f" {_normalize(location)} "
+    for alias in _ALIASES[campus]:
+        if f" {alias} " in text:
+            return gazetteer[alias]
+    return None
+
+
+def parse_near(near: str, campus: str = "lautech") -> Optional[Tuple[float, float]]:
+    """Parse `near=` as a campus point name, a gazetteer area or `lat,lng`."""
+    key = near.strip().lower()
+    points = CAMPUS_GAZETTEERS.get(campus, ({}, {}))[1]
+    if key in points:
+        return points[key]
+    if "," in key:
+        try:
+            lat, lng = (float(part) for part in key.split(",", 1))
+        except ValueError:
+            return None
+        if -90 <= lat <= 90 and -180 <= lng <= 180:
+            return lat, lng
+        return None
+    return geocode(key, campus)
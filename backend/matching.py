@@ -0,0 +1,256 @@
+"""Incremental matching of newly approved listings against users' saved searches.
+
+A saved search is a conjunction of optional filters: property type, a price
+range, location terms and keywords. Rather than testing a listing against
+every saved search, candidates come from three indexes:
+
+- a centered interval tree over price ranges (stabbing query),
+- an inverted index from property type to searches,
+- an inverted index from location term to searches, where a search matches
+  when all of its location terms occur in the listing's location.
+
+Each index can report how many searches it would return before producing
+them (a bisect over sorted endpoints for price, posting-list lengths for the
+others). The two most selective are materialized and intersected, and every
+filter, keywords included, is checked on what remains. Adds go to a small unsorted buffer and removals to a
+tombstone set; the interval tree is rebuilt once either grows past a fraction
+of the indexed searches, so updates stay cheap between periodic full reloads.
+"""
+import bisect
+import math
+import re
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Fields of a saved search that the matcher keeps in memory
+SEARCH_FIELDS = ("id", "user_id", "property_type", "min_price", "max_price", "location", "keywords")
+
+# Rebuild the interval tree once pending changes exceed this share of the index
+REBUILD_FRACTION = 0.05
+MIN_REBUILD_CHANGES = 64
+
+
+def terms(text: Optional[str]) -> Set[str]:
+    return set(_TOKEN_RE.findall((text or "").lower()))
+
+
+class _Node:
+    __slots__ = ("center", "by_start", "by_end", "left", "right")
+
+    def __init__(self, center, by_start, by_end, left, right):
+        self.center = center
+        self.by_start = by_start
+        self.by_end = by_end
+        self.left = left
+        self.right = right
+
+
+def _build(intervals: List[Tuple[float, float, str]]) -> Optional[_Node]:
+    if not intervals:
+        return None
+    endpoints = sorted(x for start, end, _id in intervals for x in (start, end) if math.isfinite(x))
+    if not endpoints:
+        # Every interval is unbounded on both sides
+        return _Node(0.0, intervals, intervals, None, None)
+    center = endpoints[len(endpoints) // 2]
+    here, left, right = [], [], []
+    for interval in intervals:
+        if interval[1] < center:
+            left.append(interval)
+        elif interval[0] > center:
+            right.append(interval)
+        else:
+            here.append(interval)
+    return _Node(
+        center,
+        sorted(here, key=lambda i: i[0]),
+        sorted(here, key=lambda i: i[1], reverse=True),
+        _build(left),
+        _build(right),
+    )
+
+
+class IntervalTree:
+    """Static centered interval tree over closed [start, end] ranges."""
+
+    def __init__(self, intervals: Iterable[Tuple[float, float, str]] = ()):
+        self.root = _build(list(intervals))
+
+    def stab(self, point: float) -> List[str]:
+        hits = []
+        node = self.root
+        while node is not None:
+            if point < node.center:
+                for start, _end, key in node.by_start:
+                    if start > point:
+                        break
+                    hits.append(key)
+                node = node.left
+            elif point > node.center:
+                for _start, end, key in node.by_end:
+                    if end < point:
+                        break
+                    hits.append(key)
+                node = node.right
+            else:
+                hits.extend(key for _start, _end, key in node.by_start)
+                break
+        return hits
+
+
+def _price_range(search: dict) -> Tuple[float, float]:
+    low, high = search.get("min_price"), search.get("max_price")
+    return (-math.inf if low is None else low, math.inf if high is None else high)
+
+
+class SearchMatcher:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._searches: Dict[str, dict] = {}
+        self._tree = IntervalTree()
+        self._tree_ids: Set[str] = set()
+        # Sorted endpoints of the tree's intervals, for counting stab hits without running the query
+        self._starts: List[float] = []
+        self._ends: List[float] = []
+        # Added since the last tree build (scanned linearly), and tree entries that are now stale
+        self._pending: Dict[str, Tuple[float, float]] = {}
+        self._removed: Set[str] = set()
+        self._by_type: Dict[str, Set[str]] = defaultdict(set)
+        self._any_type: Set[str] = set()
+        self._by_location_term: Dict[str, Set[str]] = defaultdict(set)
+        self._any_location: Set[str] = set()
+        self._location_terms: Dict[str, Set[str]] = {}
+        # search id -> (property type, min price, max price, location terms, keywords) for final checks
+        self._filters: Dict[str, tuple] = {}
+
+    def __len__(self) -> int:
+        return len(self._searches)
+
+    def rebuild(self, searches: List[dict]) -> None:
+        fresh = SearchMatcher()
+        for search in searches:
+            fresh._index(search)
+        fresh._rebuild_tree()
+        with self._lock:
+            self.__dict__.update({k: v for k, v in fresh.__dict__.items() if k != "_lock"})
+
+    def add(self, search: dict) -> None:
+        with self._lock:
+            if search["id"] in self._searches:
+                self._unindex(search["id"])
+            self._index(search)
+            self._maybe_rebuild_tree()
+
+    def remove(self, search_id: str) -> None:
+        with self._lock:
+            if search_id in self._searches:
+                self._unindex(search_id)
+                self._maybe_rebuild_tree()
+
+    def _index(self, search: dict) -> None:
+        search = {field: search.get(field) for field in SEARCH_FIELDS}
+        search_id = search["id"]
+        self._searches[search_id] = search
+        self._pending[search_id] = _price_range(search)
+
+        if search["property_type"]:
+            self._by_type[search["property_type"]].add(search_id)
+        else:
+            self._any_type.add(search_id)
+
+        location_terms = terms(search["location"])
+        self._location_terms[search_id] = location_terms
+        if location_terms:
+            for term in location_terms:
+                self._by_location_term[term].add(search_id)
+        else:
+            self._any_location.add(search_id)
+        self._filters[search_id] = (search["property_type"], *_price_range(search), location_terms, terms(search["keywords"]))
+
+    def _unindex(self, search_id: str) -> None:
+        search = self._searches.pop(search_id)
+        self._pending.pop(search_id, None)
+        if search_id in self._tree_ids:
+            self._removed.add(search_id)
+        if search["property_type"]:
+            self._by_type[search["property_type"]].discard(search_id)
+        self._any_type.discard(search_id)
+        for term in self._location_terms.pop(search_id):
+            self._by_location_term[term].discard(search_id)
+        self._any_location.discard(search_id)
+        del self._filters[search_id]
+
+    def _maybe_rebuild_tree(self) -> None:
+        changes = len(self._pending) + len(self._removed)
+        if changes > max(MIN_REBUILD_CHANGES, REBUILD_FRACTION * len(self._searches)):
+            self._rebuild_tree()
+
+    def _rebuild_tree(self) -> None:
+        intervals = [(*_price_range(s), search_id) for search_id, s in self._searches.items()]
+        self._tree = IntervalTree(intervals)
+        self._starts = sorted(start for start, _end, _id in intervals)
+        self._ends = sorted(end for _start, end, _id in intervals)
+        self._tree_ids = set(self._searches)
+        self._pending = {}
+        self._removed = set()
+
+    def _price_estimate(self, price: Optional[float]) -> float:
+        if price is None:
+            return math.inf
+        # Intervals with start <= price minus those ending before it, in O(log n)
+        in_tree = bisect.bisect_right(self._starts, price) - bisect.bisect_left(self._ends, price)
+        return in_tree + len(self._pending)
+
+    def _price_matches(self, price: float) -> Set[str]:
+        hits = set(self._tree.stab(price))
+        if self._removed:
+            hits -= self._removed
+        hits.update(search_id for search_id, (low, high) in self._pending.items() if low <= price <= high)
+        return hits
+
+    def _type_matches(self, property_type: Optional[str]) -> Set[str]:
+        return self._by_type.get(property_type, set()) | self._any_type
+
+    def _location_estimate(self, location_terms: Set[str]) -> int:
+        return sum(len(self._by_location_term.get(term, ())) for term in location_terms) + len(self._any_location)
+
+    def _location_matches(self, location_terms: Set[str]) -> Set[str]:
+        # A search matches when every one of its terms appears in the listing's location
+        seen: Dict[str, int] = defaultdict(int)
+        for term in location_terms:
+            for search_id in self._by_location_term.get(term, ()):
+                seen[search_id] += 1
+        hits = {search_id for search_id, count in seen.items() if count == len(self._location_terms[search_id])}
+        return hits | self._any_location
+
+    def match(self, listing: dict) -> List[dict]:
+        """Saved searches satisfied by `listing`."""
+        listing_type = listing.get("property_type")
+        price = listing.get("price")
+        location_terms = terms(listing.get("location"))
+        text = terms(f"{listing.get('title') or ''} {listing.get('description') or ''}") | location_terms
+
+        with self._lock:
+            sources = sorted([
+                (len(self._by_type.get(listing_type, ())) + len(self._any_type), lambda: self._type_matches(listing_type)),
+                (self._location_estimate(location_terms), lambda: self._location_matches(location_terms)),
+                (self._price_estimate(price), lambda: self._price_matches(price)),
+            ], key=lambda source: source[0])
+            # Intersect the two most selective indexes, then check every filter on the few that remain
+            candidates = sources[0][1]()
+            if candidates:
+                candidates &= sources[1][1]()
+
+            if price is None:
+                price = math.nan
+            matched = []
+            for search_id in candidates:
+                search_type, low, high, search_location, keywords = self._filters[search_id]
+                if ((search_type is None or search_type == listing_type)
+                        and (low <= price <= high or (low == -math.inf and high == math.inf))
+                        and search_location <= location_terms and keywords <= text):
+                    matched.append(dict(self._searches[search_id]))
+            return matched
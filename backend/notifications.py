@@ -0,0 +1,252 @@
+"""Transactional email delivered from the notification outbox.
+
+Triggers write a notification_outbox row in the same transaction as the
+change that causes it (see supabase_schema.sql), so request handlers never
+wait on email. Each worker runs a dispatcher that, per cycle:
+
+1. claims a batch of due rows in one RPC (SKIP LOCKED lets workers share the queue),
+2. coalesces them: rows for the same recipient and kind become one message that
+   keeps only the latest event per subject, so a listing approved and then
+   rejected within one batch is mailed once, with its final status,
+3. sends as many messages as the rate limit allows, and
+4. settles the batch in one RPC. Delivered rows are marked sent, failed ones back
+   off, and rows held back by the rate limit are released without counting an attempt.
+
+Delivery is at least once: if a worker dies between sending and settling, its
+claimed rows come due again when their lease runs out.
+
+Transports are pluggable. SMTPTransport sends a batch over one connection,
+ResendTransport uses Resend's batch endpoint (the provider the frontend's
+receipt function already uses), and LogTransport only logs.
+"""
+import html
+import logging
+import smtplib
+import ssl
+import time
+from email.message import EmailMessage
+from typing import Callable, Dict, List, Optional, Sequence
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+RESEND_BATCH_URL = "https://api.resend.com/emails/batch"
+# Resend accepts at most this many emails per batch call
+RESEND_BATCH_LIMIT = 100
+
+
+# ---- Rendering ----
+
+def _listing_lines(events: List[dict]) -> List[str]:
+    return [f"\"{e['title']}\" was {e['status']}." for e in events]
+
+
+def _verification_lines(events: List[dict]) -> List[str]:
+    if events[-1]["status"] == "approved":
+        return ["Your agent verification was approved. You can now post listings."]
+    return ["Your agent verification was not approved. You can submit a new request from your dashboard."]
+
+
+def _payment_lines(events: List[dict]) -> List[str]:
+    lines = []
+    for e in events:
+        what = f"{e['tokens']} token(s)" if e.get("type") == "token_purchase" else "an inspection fee"
+        lines.append(f"We received NGN {e['amount']:,} for {what}. Reference: {e['reference']}.")
+    return lines
+
+
+def _assigned_lines(events: List[dict]) -> List[str]:
+    return [f"Inspect \"{e['property_title']}\" with {e['student_name']} on {e['inspection_date']}." for e in events]
+
+
+def _scheduled_lines(events: List[dict]) -> List[str]:
+    return [f"{e['agent_name']} will show you \"{e['property_title']}\" on {e['inspection_date']}." for e in events]
+
+
+# kind -> (subject for one event, subject for several, body lines)
+TEMPLATES: Dict[str, tuple] = {
+    "listing_reviewed": ("Your listing was reviewed", "{n} of your listings were reviewed", _listing_lines),
+    "verification_reviewed": ("Your agent verification was reviewed", "Your agent verification was reviewed",
+                              _verification_lines),
+    "payment_completed": ("Payment receipt", "Receipts for {n} payments", _payment_lines),
+    "inspection_assigned": ("New inspection assigned to you", "{n} inspections assigned to you", _assigned_lines),
+    "inspection_scheduled": ("Your inspection has an agent", "Agents assigned to {n} of your inspections",
+                             _scheduled_lines),
+}
+
+
+def render(kind: str, recipient: str, events: List[dict], sender: str) -> EmailMessage:
+    """One email for a recipient's coalesced events of one kind."""
+    one, many, lines = TEMPLATES[kind]
+    paragraphs = [f"Hi {events[-1].get('full_name') or 'there'},", *lines(events), "Thank you for using Rentora."]
+    message = EmailMessage()
+    message["From"] = sender
+    message["To"] = recipient
+    message["Subject"] = one if len(events) == 1 else many.format(n=len(events))
+    message.set_content("\n\n".join(paragraphs))
+    message.add_alternative("".join(f"<p>{html.escape(p)}</p>" for p in paragraphs), subtype="html")
+    return message
+
+
+def coalesce(rows: List[dict], sender: str) -> List[tuple]:
+    """(message, row ids) per (recipient, kind), keeping the latest event per subject."""
+    groups: Dict[tuple, Dict[str, dict]] = {}
+    ids: Dict[tuple, List[int]] = {}
+    for row in sorted(rows, key=lambda row: row["id"]):
+        key = (row["recipient"], row["kind"])
+        latest = groups.setdefault(key, {})
+        # Re-inserting moves a superseded subject to the position of its latest event
+        latest.pop(row["subject_id"], None)
+        latest[row["subject_id"]] = row["payload"]
+        ids.setdefault(key, []).append(row["id"])
+    messages = []
+    for (recipient, kind), latest in groups.items():
+        if kind not in TEMPLATES:
+            logger.warning(f"No template for notification kind {kind!r}; dropping {len(ids[(recipient, kind)])} rows")
+            messages.append((None, ids[(recipient, kind)]))
+            continue
+        messages.append((render(kind, recipient, list(latest.values()), sender), ids[(recipient, kind)]))
+    return messages
+
+
+# ---- Transports ----
+
+class LogTransport:
+    """Logs messages instead of sending them, for development without a mail provider."""
+
+    def send(self, messages: Sequence[EmailMessage]) -> List[Optional[str]]:
+        for message in messages:
+            logger.info(f"Email to {message['To']}: {message['Subject']}")
+        return [None] * len(messages)
+
+
+class SMTPTransport:
+    def __init__(self, host: str, port: int = 587, username: str = "", password: str = "",
+                 starttls: bool = True, timeout: float = 30.0):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+
+    def send(self, messages: Sequence[EmailMessage]) -> List[Optional[str]]:
+        """Send over one connection; a rejected message doesn't stop the rest."""
+        errors: List[Optional[str]] = []
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            if self.starttls:
+                smtp.starttls(context=ssl.create_default_context())
+            if self.username:
+                smtp.login(self.username, self.password)
+            for message in messages:
+                try:
+                    smtp.send_message(message)
+                    errors.append(None)
+                except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError) as e:
+                    errors.append(str(e))
+                    smtp.rset()
+        return errors
+
+
+class ResendTransport:
+    def __init__(self, api_key: str, timeout: float = 30.0, transport: Optional[httpx.BaseTransport] = None):
+        self.api_key = api_key
+        self.timeout = timeout
+        self.transport = transport
+
+    def send(self, messages: Sequence[EmailMessage]) -> List[Optional[str]]:
+        errors: List[Optional[str]] = []
+        with httpx.Client(timeout=self.timeout, transport=self.transport,
+                          headers={"Authorization": f"Bearer {self.api_key}"}) as client:
+            for start in range(0, len(messages), RESEND_BATCH_LIMIT):
+                chunk = messages[start:start + RESEND_BATCH_LIMIT]
+                try:
+                    client.post(RESEND_BATCH_URL, json=[{
+                        "from": message["From"],
+                        "to": [message["To"]],
+                        "subject": message["Subject"],
+                        "text": message.get_body(("plain",)).get_content(),
+                        "html": message.get_body(("html",)).get_content(),
+                    } for message in chunk]).raise_for_status()
+                    errors += [None] * len(chunk)
+                except httpx.HTTPError as e:
+                    # A batch call is all or nothing
+                    errors += [str(e)] * len(chunk)
+        return errors
+
+
+# ---- Dispatch ----
+
+class RateLimiter:
+    """Token bucket allowing `per_minute` sends, with bursts of up to `burst`."""
+
+    def __init__(self, per_minute: float, burst: Optional[int] = None, clock: Callable[[], float] = time.monotonic):
+        self.rate = per_minute / 60
+        self.burst = burst or max(1, int(per_minute))
+        self.clock = clock
+        self._tokens = float(self.burst)
+        self._updated = clock()
+
+    def available(self) -> int:
+        now = self.clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        return int(self._tokens)
+
+    def take(self, wanted: int) -> int:
+        """How many of `wanted` sends may go now (those are consumed)."""
+        granted = min(wanted, self.available())
+        self._tokens -= granted
+        return granted
+
+
+class NotificationDispatcher:
+    def __init__(self, transport, claim: Callable[[int], List[dict]], finish: Callable[..., None],
+                 sender: str, batch_size: int = 100, rate_per_minute: float = 60,
+                 clock: Callable[[], float] = time.monotonic):
+        self.transport = transport
+        # claim(limit) -> rows; finish(sent=, retry=, release=, error=) settles them
+        self.claim = claim
+        self.finish = finish
+        self.sender = sender
+        self.batch_size = batch_size
+        self.limiter = RateLimiter(rate_per_minute, clock=clock)
+
+    def run_once(self) -> Dict[str, int]:
+        stats = {"rows": 0, "sent": 0, "failed": 0, "deferred": 0}
+        # Don't claim rows that would only be released again
+        if not self.limiter.available():
+            return stats
+        rows = self.claim(self.batch_size)
+        stats["rows"] = len(rows)
+        if not rows:
+            return stats
+
+        messages = coalesce(rows, self.sender)
+        # Rows without a template are settled as sent so they don't clog the queue
+        sent = [row_id for message, ids in messages if message is None for row_id in ids]
+        messages = [(message, ids) for message, ids in messages if message is not None]
+        allowed = self.limiter.take(len(messages))
+        now, later = messages[:allowed], messages[allowed:]
+        release = [row_id for _, ids in later for row_id in ids]
+
+        retry, errors = [], []
+        try:
+            results = self.transport.send([message for message, _ in now]) if now else []
+        except Exception as e:
+            results = [str(e)] * len(now)
+        for (message, ids), error in zip(now, results):
+            if error is None:
+                sent += ids
+                stats["sent"] += 1
+            else:
+                retry += ids
+                errors.append(f"{message['To']}: {error}")
+                stats["failed"] += 1
+        stats["deferred"] = len(later)
+
+        self.finish(sent=sent, retry=retry, release=release, error="; ".join(errors)[:1000] or None)
+        if errors:
+            logger.warning(f"{len(errors)} notification emails failed: {errors[0]}")
+        return stats
@@ -0,0 +1,262 @@
+"""On-demand sampling profiler for individual requests.
+
+Nothing is hooked into the interpreter unless a request is being profiled: the
+middleware only looks for a header (and draws a random number when a sample
+rate is configured). While at least one profile is active, a daemon thread
+wakes every `interval` seconds and records each profiled request's stack.
+
+Profiles are wall-clock. A request that is blocked inside a synchronous
+Supabase call is caught in that call, and a request suspended at an `await`
+(`asyncio.to_thread`, a sleep, another future) is recorded at its await point,
+so waiting shows up as time rather than as a gap.
+
+Finished profiles are kept in a bounded per-worker ring and can be exported in
+speedscope's JSON format or as a marshalled pstats file.
+"""
+import asyncio
+import marshal
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+
+PROFILE_HEADER = "x-profile"
+PROFILE_ID_HEADER = "x-profile-id"
+SPEEDSCOPE_SCHEMA = "https://www.speedscope.app/file-format-schema.json"
+
+# (filename, first line, name), the same function key pstats uses
+FrameKey = Tuple[str, int, str]
+AWAIT_FRAME: FrameKey = ("~", 0, "<await>")
+
+
+def _frame_key(frame) -> FrameKey:
+    code = frame.f_code
+    return (code.co_filename, code.co_firstlineno, getattr(code, "co_qualname", code.co_name))
+
+
+def _running_stack(frame, root_frame) -> Optional[List[FrameKey]]:
+    """Outermost-first stack from root_frame to `frame`, or None if root_frame isn't on it."""
+    stack = []
+    while frame is not None:
+        stack.append(_frame_key(frame))
+        if frame is root_frame:
+            stack.reverse()
+            return stack
+        frame = frame.f_back
+    return None
+
+
+def _suspended_stack(coro, root_frame) -> List[FrameKey]:
+    """Outermost-first stack of a suspended coroutine chain, from root_frame to its await point."""
+    stack = []
+    recording = False
+    awaitable = coro
+    while awaitable is not None:
+        frame = getattr(awaitable, "cr_frame", None) or getattr(awaitable, "gi_frame", None)
+        if frame is None:
+            # A future or other native awaitable: the request is waiting on it
+            if recording:
+                stack.append(AWAIT_FRAME)
+            break
+        if frame is root_frame:
+            recording = True
+        if recording:
+            stack.append(_frame_key(frame))
+        awaitable = getattr(awaitable, "cr_await", None) or getattr(awaitable, "gi_yieldfrom", None)
+    return stack
+
+
+class Profile:
+    def __init__(self, name: str, thread_id: int, root_frame, coro, max_samples: int):
+        self.id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.started_at = time.time()
+        self.duration = 0.0
+        self.samples = 0
+        self.max_samples = max_samples
+        self.truncated = False
+        # stack -> [sample count, seconds]
+        self.stacks: Dict[Tuple[FrameKey, ...], list] = {}
+        self._thread_id = thread_id
+        self._root_frame = root_frame
+        self._coro = coro
+        self._started = time.perf_counter()
+        self._last_sample = self._started
+
+    @property
+    def finished(self) -> bool:
+        return self._root_frame is None
+
+    def sample(self, frames: dict, now: float) -> None:
+        root_frame, coro = self._root_frame, self._coro
+        if root_frame is None:
+            return
+        if self.samples >= self.max_samples:
+            self.truncated = True
+            return
+        frame = frames.get(self._thread_id)
+        stack = _running_stack(frame, root_frame) if frame is not None else None
+        if stack is None:
+            stack = _suspended_stack(coro, root_frame)
+        weight, self._last_sample = now - self._last_sample, now
+        if not stack:
+            return
+        entry = self.stacks.setdefault(tuple(stack), [0, 0.0])
+        entry[0] += 1
+        entry[1] += weight
+        self.samples += 1
+
+    def finish(self) -> None:
+        self.duration = time.perf_counter() - self._started
+        # Drop references to the request's frames so they can be freed
+        self._root_frame = self._coro = None
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration * 1000, 2),
+            "samples": self.samples,
+            "truncated": self.truncated
+        }
+
+    def to_speedscope(self) -> dict:
+        index: Dict[FrameKey, int] = {}
+        samples, weights = [], []
+        for stack, (_count, seconds) in self.stacks.items():
+            samples.append([index.setdefault(key, len(index)) for key in stack])
+            weights.append(seconds)
+        return {
+            "$schema": SPEEDSCOPE_SCHEMA,
+            "name": self.name,
+            "shared": {"frames": [{"name": name, "file": file, "line": line} for file, line, name in index]},
+            "profiles": [{
+                "type": "sampled",
+                "name": self.name,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": samples,
+                "weights": weights
+            }]
+        }
+
+    def to_pstats(self) -> bytes:
+        """Marshalled stats dict readable by `pstats.Stats(path)`; call counts are sample counts."""
+        # function -> [primitive calls, calls, own time, cumulative time, {caller: (same four)}]
+        stats: Dict[FrameKey, list] = {}
+        for stack, (count, seconds) in self.stacks.items():
+            seen = set()
+            for depth, func in enumerate(stack):
+                entry = stats.setdefault(func, [0, 0, 0.0, 0.0, {}])
+                leaf = depth == len(stack) - 1
+                if func not in seen:
+                    # Recursive frames only count once towards cumulative time
+                    seen.add(func)
+                    entry[0] += count
+                    entry[1] += count
+                    entry[3] += seconds
+                if leaf:
+                    entry[2] += seconds
+                if depth:
+                    caller = stack[depth - 1]
+                    cc, nc, tt, ct = entry[4].get(caller, (0, 0, 0.0, 0.0))
+                    entry[4][caller] = (cc + count, nc + count, tt + (seconds if leaf else 0.0), ct + seconds)
+        return marshal.dumps({func: tuple(entry) for func, entry in stats.items()})
+
+
+class SamplingProfiler:
+    def __init__(self, interval: float = 0.005, ring_size: int = 20, max_samples: int = 20000):
+        self.interval = interval
+        self.max_samples = max_samples
+        # Most recent finished profiles; the oldest falls off when full
+        self.profiles: deque = deque(maxlen=ring_size)
+        self._active: Dict[str, Profile] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def sampling(self) -> bool:
+        return self._thread is not None
+
+    def start(self, name: str) -> Profile:
+        """Start profiling the calling coroutine; its frame becomes the root of every sample."""
+        task = asyncio.current_task()
+        profile = Profile(name, threading.get_ident(), sys._getframe(1),
+                          task.get_coro() if task else None, self.max_samples)
+        with self._lock:
+            self._active[profile.id] = profile
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+                self._thread.start()
+        return profile
+
+    def stop(self, profile: Profile) -> None:
+        with self._lock:
+            self._active.pop(profile.id, None)
+        profile.finish()
+        self.profiles.append(profile)
+
+    def get(self, profile_id: str) -> Optional[Profile]:
+        for profile in self.profiles:
+            if profile.id == profile_id:
+                return profile
+        return None
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._active:
+                    self._thread = None
+                    return
+                active = list(self._active.values())
+            frames = sys._current_frames()
+            now = time.perf_counter()
+            for profile in active:
+                profile.sample(frames, now)
+
+
+class ProfilingMiddleware:
+    """Profiles requests that carry `X-Profile: 1` from an authorized caller, or a random fraction of all requests.
+
+    Must sit inside any middleware that runs the rest of the app in a separate
+    task (such as `@app.middleware("http")`), so the profiled coroutine is the
+    one that awaits the route.
+    """
+
+    def __init__(self, app, profiler: SamplingProfiler,
+                 authorize: Callable[[Headers], Awaitable[bool]], sample_rate: float = 0.0):
+        self.app = app
+        self.profiler = profiler
+        self.authorize = authorize
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        requested = headers.get(PROFILE_HEADER, "0") not in ("", "0")
+        sampled = self.sample_rate > 0 and random.random() < self.sample_rate
+        if not sampled and not (requested and await self.authorize(headers)):
+            await self.app(scope, receive, send)
+            return
+
+        profile = self.profiler.start(f"{scope['method']} {scope['path']}")
+
+        async def send_with_profile_id(message):
+            if requested and message["type"] == "http.response.start":
+                MutableHeaders(scope=message).append(PROFILE_ID_HEADER, profile.id)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            self.profiler.stop(profile)
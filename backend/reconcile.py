@@ -0,0 +1,75 @@
+"""Korapay charge lookups for reconciling payments whose webhook never arrived."""
+import asyncio
+import logging
+from typing import Dict, Iterable, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+KORAPAY_API_BASE = "https://api.korapay.com/merchant/api/v1"
+
+# Outcomes of classify()
+SUCCESS = "success"
+FAILED = "failed"
+PENDING = "pending"
+MISSING = "missing"
+
+
+class KorapayClient:
+    def __init__(self, secret_key: str, base_url: str = KORAPAY_API_BASE, timeout: float = 10.0,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.secret_key = secret_key
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        # Tests pass an ASGI transport wrapping a fake Korapay app
+        self.transport = transport
+
+    def session(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=self.timeout,
+            transport=self.transport,
+            headers={"Authorization": f"Bearer {self.secret_key}"},
+        )
+
+    async def verify(self, session: httpx.AsyncClient, reference: str) -> Optional[dict]:
+        """Charge data for `reference`, or None when Korapay doesn't know it."""
+        response = await session.get(f"/charges/{reference}")
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.json().get("data") or None
+
+
+def classify(charge: Optional[dict]) -> str:
+    if charge is None:
+        return MISSING
+    status = (charge.get("status") or "").lower()
+    if status == "success":
+        return SUCCESS
+    if status in ("failed", "expired", "cancelled"):
+        return FAILED
+    return PENDING
+
+
+async def verify_many(client: KorapayClient, references: Iterable[str], concurrency: int = 8) -> Dict[str, Optional[dict]]:
+    """Look up many references with at most `concurrency` requests in flight.
+
+    References whose lookup errors are left out of the result so they stay
+    pending and are retried on the next pass.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    results: Dict[str, Optional[dict]] = {}
+
+    async with client.session() as session:
+        async def check(reference: str):
+            async with semaphore:
+                try:
+                    results[reference] = await client.verify(session, reference)
+                except httpx.HTTPError as e:
+                    logger.warning(f"Korapay verify failed for {reference}: {e}")
+
+        await asyncio.gather(*(check(ref) for ref in references))
+
+    return results
@@ -0,0 +1,59 @@
+"""Load-balanced assignment of paid inspections to agents."""
+import heapq
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+# (agent_id, inspection_date) -> inspections already booked that day
+LoadCounts = Dict[Tuple[str, str], int]
+
+
+def plan_assignments(
+    inspections: List[dict],
+    agents: Dict[str, str],
+    load: LoadCounts,
+    daily_cap: int,
+) -> Tuple[List[dict], List[str]]:
+    """Assign each inspection to an agent without exceeding `daily_cap` per day.
+
+    The listing's own agent keeps the inspection while they have room that
+    day; otherwise it goes to the least-loaded eligible agent for that date.
+    Returns the planned assignments and the ids that could not be placed.
+    """
+    load = defaultdict(int, load)
+    # Per-date min-heaps of (load, agent_id), built lazily and refreshed on pop
+    heaps: Dict[str, List[Tuple[int, str]]] = {}
+    assignments, unassigned = [], []
+
+    for inspection in sorted(inspections, key=lambda i: (i['inspection_date'], i.get('created_at') or '')):
+        day = inspection['inspection_date']
+        preferred = inspection.get('agent_id')
+
+        if preferred in agents and load[(preferred, day)] < daily_cap:
+            agent_id = preferred
+        else:
+            heap = heaps.get(day)
+            if heap is None:
+                heap = [(load[(a, day)], a) for a in agents]
+                heapq.heapify(heap)
+                heaps[day] = heap
+            agent_id = None
+            while heap:
+                count, candidate = heap[0]
+                if count != load[(candidate, day)]:
+                    heapq.heapreplace(heap, (load[(candidate, day)], candidate))
+                    continue
+                if count < daily_cap:
+                    agent_id = candidate
+                break
+            if agent_id is None:
+                unassigned.append(inspection['id'])
+                continue
+
+        load[(agent_id, day)] += 1
+        assignments.append({
+            "id": inspection['id'],
+            "agent_id": agent_id,
+            "agent_name": agents[agent_id],
+        })
+
+    return assignments, unassigned
@@ -1,18 +1,41 @@
 from fastapi import FastAPI, APIRouter, HTTPException, Depends, Header, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
+from fastapi.responses import JSONResponse, Response
 from starlette.middleware.cors import CORSMiddleware
-from supabase import create_client, Client
+from contextlib import asynccontextmanager
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, EmailStr
 from typing import List, Optional
 import uuid
-from datetime import datetime, timezone
+from datetime import datetime, timezone, timedelta
 import hmac
+import secrets
 import hashlib
+import base64
 import json
+import asyncio
+import tempfile
+import time
+import httpx
+
+from cache import TTLCache, FeedCache, InvalidationBus
+from compression import CompressedBody, CompressionMiddleware
+from dedupe import DuplicateIndex, INDEX_FIELDS, fetch_image_hashes
+from db import LazyClient, ReplicaRouter, READ_YOUR_WRITES_COOKIE
+from campus import CampusClient, CampusRegistry, PerCampus, CAMPUS_HEADER
+from profiling import SamplingProfiler, ProfilingMiddleware
+from geo import geocode, parse_near
+from matching import SearchMatcher, SEARCH_FIELDS
+from similarity import SimilarityIndex
+from trending import TrendingRanker, timestamp
+from views import ViewCounter
+from notifications import NotificationDispatcher, LogTransport, ResendTransport, SMTPTransport
+from snapshot import CatalogueSnapshot
+from scheduler import plan_assignments
+from reconcile import KorapayClient, KORAPAY_API_BASE, verify_many, classify, SUCCESS, FAILED
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -22,12 +45,75 @@ SUPABASE_URL = os.environ.get('SUPABASE_URL', '')
 SUPABASE_ANON_KEY = os.environ.get('SUPABASE_ANON_KEY', '')
 SUPABASE_SERVICE_KEY = os.environ.get('SUPABASE_SERVICE_KEY', '')
 
-# Create Supabase clients
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_ANON_KEY) if SUPABASE_URL else None
-supabase_admin: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY) if SUPABASE_URL and SUPABASE_SERVICE_KEY else None
+# Campuses served by this deployment; requests pick one with X-Campus or ?campus=
+DEFAULT_CAMPUS = os.environ.get('DEFAULT_CAMPUS', 'lautech')
+# Campuses with their own Supabase project, as JSON:
+# {"<campus>": {"url": ..., "anon_key": ..., "service_key": ..., "database_url": ...}}
+CAMPUS_DATABASES = json.loads(os.environ.get('CAMPUS_DATABASES') or '{}')
+campuses = CampusRegistry(DEFAULT_CAMPUS, [c.strip().lower() for c in os.environ.get('CAMPUSES', '').split(',') if c.strip()]
+                          + list(CAMPUS_DATABASES))
+
+# Supabase clients are built on first use (or by the lifespan warm-up), not at import.
+# Both route to the request's campus database and scope campus-owned tables to it.
+supabase = CampusClient(SUPABASE_URL, SUPABASE_ANON_KEY, campuses, {
+    campus: LazyClient(config['url'], config['anon_key']) for campus, config in CAMPUS_DATABASES.items()
+})
+# Database functions that only read; calling any other one pins the caller to the primary
+READ_ONLY_RPCS = frozenset({
+    'admin_stats', 'agent_inspection_load', 'agent_summary', 'campus_agents', 'inspection_calendar',
+    'payment_by_reference', 'properties_near', 'property_changes', 'search_users', 'wallet_state',
+})
+supabase_admin = CampusClient(SUPABASE_URL, SUPABASE_SERVICE_KEY, campuses, {
+    campus: LazyClient(config['url'], config['service_key']) for campus, config in CAMPUS_DATABASES.items()
+}, read_rpcs=READ_ONLY_RPCS)
+
+# Stale-tolerant reads go through db_router.reader(); writes stay on supabase_admin
+SUPABASE_READ_REPLICA_URLS = [u.strip() for u in os.environ.get('SUPABASE_READ_REPLICA_URLS', '').split(',') if u.strip()]
+READ_YOUR_WRITES_SECONDS = float(os.environ.get('READ_YOUR_WRITES_SECONDS', '10'))
+REPLICA_HEALTH_SECONDS = int(os.environ.get('REPLICA_HEALTH_SECONDS', '15'))
+# Replicas belong to the default project; other campus databases are read from their primary
+db_router = ReplicaRouter(supabase_admin, SUPABASE_READ_REPLICA_URLS, SUPABASE_SERVICE_KEY, READ_YOUR_WRITES_SECONDS,
+                          replica_client=lambda url, key: CampusClient(url, key, campuses, supabase_admin.databases))
+
+# Read caches, invalidated across workers via LISTEN/NOTIFY on a direct Postgres connection.
+# Without DATABASE_URL there is no bus, so entries only live for a short TTL.
+DATABASE_URL = os.environ.get('DATABASE_URL', '')
+CACHE_TTL_SECONDS = int(os.environ.get('CACHE_TTL_SECONDS', '300' if DATABASE_URL else '15'))
+user_cache = TTLCache(maxsize=10000, ttl=CACHE_TTL_SECONDS)
+wallet_cache = TTLCache(maxsize=10000, ttl=CACHE_TTL_SECONDS)
+property_cache = TTLCache(maxsize=5000, ttl=CACHE_TTL_SECONDS)
+# Each user's unlocked property ids as a frozenset, LRU across users. An entry costs
+# ~220 bytes plus ~170 per unlocked id (the id string and its hash slot): ~4 KB for a
+# user with 20 unlocks, so a full cache of 5000 such users holds about 20 MB.
+UNLOCK_CACHE_USERS = int(os.environ.get('UNLOCK_CACHE_USERS', '5000'))
+unlock_cache = TTLCache(maxsize=UNLOCK_CACHE_USERS, ttl=CACHE_TTL_SECONDS)
+# Serialized /properties feeds keyed by query string, with their compressed variants, per
+# campus so one campus's listing churn doesn't evict the others' feeds
+FEED_CACHE_SECONDS = int(os.environ.get('FEED_CACHE_SECONDS', '60'))
+feed_caches = PerCampus(campuses, lambda: FeedCache(maxsize=500, ttl=FEED_CACHE_SECONDS))
+# Listing changes notify twice: by id for property_cache and by campus for feed_caches
+invalidation_targets = {
+    "users": [user_cache],
+    "wallets": [wallet_cache],
+    "unlocks": [unlock_cache],
+    "properties": [property_cache, feed_caches]
+}
+invalidation_bus = InvalidationBus(DATABASE_URL, invalidation_targets)
+# Campus databases notify over their own connections into the same caches
+campus_invalidation_buses = [InvalidationBus(config['database_url'], invalidation_targets)
+                             for config in CAMPUS_DATABASES.values() if config.get('database_url')]
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    start_background_jobs()
+    yield
+    await stop_background_jobs()
+    await flush_view_counts()
+    supabase.close()
+    supabase_admin.close()
 
 # Create the main app
-app = FastAPI(title="LAUTECH Rentals API")
+app = FastAPI(title="LAUTECH Rentals API", lifespan=lifespan)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -36,11 +122,91 @@ api_router = APIRouter(prefix="/api")
 security = HTTPBearer(auto_error=False)
 KORALPAY_SECRET = os.environ.get('KORALPAY_SECRET_KEY', '')
 KORALPAY_WEBHOOK_SECRET = os.environ.get('KORALPAY_WEBHOOK_SECRET', '')
+korapay_client = KorapayClient(KORALPAY_SECRET, os.environ.get('KORAPAY_API_BASE', KORAPAY_API_BASE))
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Background jobs
+SIMILARITY_REBUILD_SECONDS = int(os.environ.get('SIMILARITY_REBUILD_SECONDS', '3600'))
+INSPECTION_SCHEDULE_SECONDS = int(os.environ.get('INSPECTION_SCHEDULE_SECONDS', '300'))
+INSPECTION_DAILY_CAP = int(os.environ.get('INSPECTION_DAILY_CAP', '5'))
+MAX_CALENDAR_DAYS = int(os.environ.get('MAX_CALENDAR_DAYS', '62'))
+RECONCILE_SECONDS = int(os.environ.get('RECONCILE_SECONDS', '600'))
+RECONCILE_MIN_AGE_MINUTES = int(os.environ.get('RECONCILE_MIN_AGE_MINUTES', '30'))
+RECONCILE_ABANDON_HOURS = int(os.environ.get('RECONCILE_ABANDON_HOURS', '24'))
+RECONCILE_CONCURRENCY = int(os.environ.get('RECONCILE_CONCURRENCY', '8'))
+RECONCILE_PAGE_SIZE = 200
+WALLET_COMPACT_SECONDS = int(os.environ.get('WALLET_COMPACT_SECONDS', '300'))
+READINESS_TIMEOUT_SECONDS = float(os.environ.get('READINESS_TIMEOUT_SECONDS', '2'))
+similar_indexes = PerCampus(campuses, SimilarityIndex)
+SAVED_SEARCH_RELOAD_SECONDS = int(os.environ.get('SAVED_SEARCH_RELOAD_SECONDS', '600'))
+MAX_SAVED_SEARCHES = int(os.environ.get('MAX_SAVED_SEARCHES', '20'))
+MAX_USER_PAGE_SIZE = int(os.environ.get('MAX_USER_PAGE_SIZE', '100'))
+MAX_TRANSACTION_PAGE_SIZE = int(os.environ.get('MAX_TRANSACTION_PAGE_SIZE', '200'))
+search_matchers = PerCampus(campuses, SearchMatcher)
+DUPLICATE_RELOAD_SECONDS = int(os.environ.get('DUPLICATE_RELOAD_SECONDS', '3600'))
+MAX_BULK_PROPERTIES = int(os.environ.get('MAX_BULK_PROPERTIES', '100'))
+MAX_BULK_USERS = int(os.environ.get('MAX_BULK_USERS', '500'))
+PROVISION_CONCURRENCY = int(os.environ.get('PROVISION_CONCURRENCY', '8'))
+DUPLICATE_TEXT_THRESHOLD = float(os.environ.get('DUPLICATE_TEXT_THRESHOLD', '0.7'))
+duplicate_indexes = PerCampus(campuses, lambda: DuplicateIndex(DUPLICATE_TEXT_THRESHOLD))
+# Fire-and-forget image hashing jobs, held so they aren't garbage collected mid-flight
+image_hash_tasks: set = set()
+TRENDING_UPDATE_SECONDS = int(os.environ.get('TRENDING_UPDATE_SECONDS', '60'))
+TRENDING_REBUILD_SECONDS = int(os.environ.get('TRENDING_REBUILD_SECONDS', '21600'))
+TRENDING_WINDOW_DAYS = int(os.environ.get('TRENDING_WINDOW_DAYS', '30'))
+trending = TrendingRanker(float(os.environ.get('TRENDING_HALF_LIFE_HOURS', '48')))
+# Newest event timestamp read per (database campus, source table), for incremental trending updates
+trending_watermarks: dict = {}
+SYNC_PAGE_SIZE = int(os.environ.get('SYNC_PAGE_SIZE', '500'))
+SYNC_TOMBSTONE_DAYS = int(os.environ.get('SYNC_TOMBSTONE_DAYS', '30'))
+# Final-page cursors trail the server clock by this much, so rows from transactions
+# that committed late with an earlier updated_at are still picked up next time
+SYNC_OVERLAP_SECONDS = int(os.environ.get('SYNC_OVERLAP_SECONDS', '10'))
+TOMBSTONE_PURGE_SECONDS = int(os.environ.get('TOMBSTONE_PURGE_SECONDS', '86400'))
+# Approved catalogue kept on local disk and served by the public read routes, marked
+# stale, when the database errors or takes longer than the latency budget
+SNAPSHOT_DIR = Path(os.environ.get('SNAPSHOT_DIR') or Path(tempfile.gettempdir()) / 'lautech-rentals')
+SNAPSHOT_REFRESH_SECONDS = int(os.environ.get('SNAPSHOT_REFRESH_SECONDS', '30'))
+SNAPSHOT_LATENCY_BUDGET_SECONDS = float(os.environ.get('SNAPSHOT_LATENCY_BUDGET_SECONDS', '2'))
+catalogue_snapshots = {campus: CatalogueSnapshot(SNAPSHOT_DIR / f'catalogue-{campus}.snap') for campus in campuses}
+# Background revalidations started by a fallback, one per campus at a time
+snapshot_refreshes: dict = {}
+# Months of payments kept in the hot partitions before settled months move to payment_archive
+PAYMENT_RETENTION_MONTHS = int(os.environ.get('PAYMENT_RETENTION_MONTHS', '12'))
+PAYMENT_ARCHIVE_SECONDS = int(os.environ.get('PAYMENT_ARCHIVE_SECONDS', '86400'))
+VIEW_FLUSH_SECONDS = int(os.environ.get('VIEW_FLUSH_SECONDS', '30'))
+VIEW_DEDUPE_WINDOW_SECONDS = int(os.environ.get('VIEW_DEDUPE_WINDOW_SECONDS', '1800'))
+VIEW_DEDUPE_CAPACITY = int(os.environ.get('VIEW_DEDUPE_CAPACITY', '100000'))
+# Per campus, so each campus's views are flushed to its own database
+view_counters = PerCampus(campuses, lambda: ViewCounter(window=VIEW_DEDUPE_WINDOW_SECONDS, capacity=VIEW_DEDUPE_CAPACITY))
+# Outbox email delivery: SMTP if SMTP_HOST is set, else Resend if RESEND_API_KEY is, else only logged
+NOTIFY_DISPATCH_SECONDS = int(os.environ.get('NOTIFY_DISPATCH_SECONDS', '15'))
+NOTIFY_BATCH_SIZE = int(os.environ.get('NOTIFY_BATCH_SIZE', '100'))
+# Per worker; the provider's limit divided by the number of workers
+NOTIFY_RATE_PER_MINUTE = float(os.environ.get('NOTIFY_RATE_PER_MINUTE', '60'))
+NOTIFY_MAX_ATTEMPTS = int(os.environ.get('NOTIFY_MAX_ATTEMPTS', '5'))
+NOTIFY_RETENTION_DAYS = int(os.environ.get('NOTIFY_RETENTION_DAYS', '30'))
+FROM_EMAIL = os.environ.get('FROM_EMAIL', 'Rentora <noreply@rentora.ng>')
+if os.environ.get('SMTP_HOST'):
+    notification_transport = SMTPTransport(
+        os.environ['SMTP_HOST'], int(os.environ.get('SMTP_PORT', '587')),
+        os.environ.get('SMTP_USERNAME', ''), os.environ.get('SMTP_PASSWORD', ''),
+        starttls=os.environ.get('SMTP_STARTTLS', 'true').lower() != 'false')
+elif os.environ.get('RESEND_API_KEY'):
+    notification_transport = ResendTransport(os.environ['RESEND_API_KEY'])
+else:
+    notification_transport = LogTransport()
+# Request profiling: admins send X-Profile: 1, or a fraction of all traffic is sampled
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+profiler = SamplingProfiler(
+    interval=int(os.environ.get('PROFILE_INTERVAL_MS', '5')) / 1000,
+    ring_size=int(os.environ.get('PROFILE_RING_SIZE', '20'))
+)
+background_tasks: List[asyncio.Task] = []
+
 # ============== MODELS ==============
 
 class UserCreate(BaseModel):
@@ -66,6 +232,11 @@ class PropertyCreate(BaseModel):
     images: List[str]
     contact_name: str
     contact_phone: str
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
+
+class PropertyBulkCreate(BaseModel):
+    properties: List[PropertyCreate]
 
 class PropertyUpdate(BaseModel):
     title: Optional[str] = None
@@ -76,6 +247,16 @@ class PropertyUpdate(BaseModel):
     images: Optional[List[str]] = None
     contact_name: Optional[str] = None
     contact_phone: Optional[str] = None
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
+
+class SavedSearchCreate(BaseModel):
+    name: Optional[str] = None
+    property_type: Optional[str] = None
+    min_price: Optional[int] = None
+    max_price: Optional[int] = None
+    location: Optional[str] = None
+    keywords: Optional[str] = None
 
 class TokenPurchaseRequest(BaseModel):
     quantity: int
@@ -92,6 +273,16 @@ class RoleUpdateRequest(BaseModel):
     user_id: str
     role: str
 
+class ProvisionAccount(BaseModel):
+    email: EmailStr
+    full_name: str
+    # Without one, the account gets a random password and the user sets theirs via password reset
+    password: Optional[str] = None
+
+class BulkProvisionRequest(BaseModel):
+    role: str = "user"
+    accounts: List[ProvisionAccount]
+
 class SuspendUserRequest(BaseModel):
     user_id: str
     suspended: bool
@@ -106,7 +297,148 @@ class InspectionUpdateRequest(BaseModel):
 # ============== HELPERS ==============
 
 def generate_reference(prefix: str) -> str:
-    return f"{prefix}-{datetime.now().strftime('%Y%m%d')}-{uuid.uuid4().hex[:8].upper()}"
+    # Carries the campus so Korapay's callbacks, which have no X-Campus, reach the right database
+    return f"{prefix}-{campuses.current().upper()}-{datetime.now().strftime('%Y%m%d')}-{uuid.uuid4().hex[:8].upper()}"
+
+def reference_campus(reference: str) -> str:
+    """Campus a payment reference was issued on; references from before campuses stay on the current one."""
+    parts = reference.split('-')
+    campus = '-'.join(parts[1:-2]).lower()
+    return campus if len(parts) >= 4 and campus in campuses else campuses.current()
+
+def get_user_profile(user_id: str) -> Optional[dict]:
+    profile = user_cache.get(user_id)
+    if profile is None:
+        token = user_cache.fill_token(user_id)
+        result = supabase_admin.table('users').select('*').eq('id', user_id).single().execute()
+        profile = result.data
+        if profile:
+            user_cache.set(user_id, profile, token)
+    return profile
+
+def get_wallet_row(user_id: str) -> Optional[dict]:
+    wallet = wallet_cache.get(user_id)
+    if wallet is None:
+        token = wallet_cache.fill_token(user_id)
+        # Snapshot balance plus any ledger entries not yet compacted into it
+        result = supabase_admin.rpc('wallet_state', {"p_user": user_id}).execute()
+        wallet = result.data
+        if wallet:
+            wallet_cache.set(user_id, wallet, token)
+    return wallet
+
+def get_property_row(property_id: str) -> Optional[dict]:
+    property_doc = property_cache.get(property_id)
+    if property_doc is None:
+        token = property_cache.fill_token(property_id)
+        # maybe_single: a missing listing is None, not an error that looks like an outage
+        result = supabase_admin.table('properties').select('*').eq('id', property_id).maybe_single().execute()
+        property_doc = result.data if result else None
+        if property_doc:
+            property_cache.set(property_id, property_doc, token)
+    # The cache is shared by every campus, but a listing only exists on its own
+    if property_doc and property_doc.get('campus') != campuses.current():
+        return None
+    return property_doc
+
+def get_unlocked_ids(user_id: str) -> frozenset:
+    unlocked = unlock_cache.get(user_id)
+    if unlocked is None:
+        token = unlock_cache.fill_token(user_id)
+        result = supabase_admin.table('unlocks').select('property_id').eq('user_id', user_id).execute()
+        unlocked = frozenset(row['property_id'] for row in result.data)
+        unlock_cache.set(user_id, unlocked, token)
+    return unlocked
+
+def encode_cursor(position: list) -> str:
+    """Opaque pagination cursor for a keyset position."""
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+def decode_cursor(cursor: str, size: int) -> list:
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        position = None
+    if not isinstance(position, list) or len(position) != size:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return position
+
+def sync_cursor(changes: dict) -> list:
+    """Keyset position after a property_changes page: its last row, or the server clock less the overlap."""
+    upserts = changes['upserts']
+    if changes['has_more']:
+        return [upserts[-1]['updated_at'], upserts[-1]['id']]
+    server_time = datetime.fromisoformat(changes['server_time'])
+    return [(server_time - timedelta(seconds=SYNC_OVERLAP_SECONDS)).isoformat(), None]
+
+def after_keyset(query, column: str, cursor: Optional[list], desc: bool = False):
+    """Rows past a [column value, id] keyset position in (column, id) order; `desc` walks it backwards."""
+    if not cursor:
+        return query
+    value, row_id = cursor
+    op = 'lt' if desc else 'gt'
+    if row_id is None:
+        return getattr(query, op)(column, value)
+    return query.or_(f'{column}.{op}."{value}",and({column}.eq."{value}",id.{op}."{row_id}")')
+
+def database_unavailable(error: Exception) -> bool:
+    """Whether `error` means the database couldn't answer, rather than answered with an error."""
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError, httpx.TransportError)):
+        return True
+    # PGRST0xx: PostgREST couldn't connect to Postgres or get a pooled connection in time
+    return type(error).__name__ == 'APIError' and (getattr(error, 'code', None) or '').startswith('PGRST0')
+
+async def within_budget(func, *args):
+    """Run a blocking database call in a thread, giving up after SNAPSHOT_LATENCY_BUDGET_SECONDS."""
+    return await asyncio.wait_for(asyncio.to_thread(func, *args), SNAPSHOT_LATENCY_BUDGET_SECONDS)
+
+def snapshot_headers(snapshot: CatalogueSnapshot) -> dict:
+    return {"X-Snapshot-Age": str(int(snapshot.age())), "Cache-Control": "no-store"}
+
+def parse_calendar_range(start: Optional[str], end: Optional[str]) -> tuple:
+    """Dates from `start` (default today) to `end` (default 30 days on), at most MAX_CALENDAR_DAYS."""
+    try:
+        first = datetime.fromisoformat(start).date() if start else datetime.now(timezone.utc).date()
+        last = datetime.fromisoformat(end).date() if end else first + timedelta(days=29)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Dates must be YYYY-MM-DD")
+    if last < first or (last - first).days >= MAX_CALENDAR_DAYS:
+        raise HTTPException(status_code=400, detail=f"Date range must be 1 to {MAX_CALENDAR_DAYS} days")
+    return first, last
+
+def inspection_calendar(first, last, agent_id: Optional[str], property_id: Optional[str] = None) -> dict:
+    """Booked and available inspections for every day in the range, from the per-day aggregates.
+
+    Availability is the agent's INSPECTION_DAILY_CAP less everything they have booked that day,
+    so a listing's calendar shows its own bookings but its agent's remaining room.
+    """
+    result = supabase_admin.rpc('inspection_calendar', {
+        "p_from": first.isoformat(), "p_to": last.isoformat(),
+        "p_agent_id": agent_id, "p_property_id": property_id
+    }).execute()
+    booked = {row['inspection_date']: row for row in result.data}
+    days = []
+    for offset in range((last - first).days + 1):
+        day = (first + timedelta(days=offset)).isoformat()
+        row = booked.get(day, {})
+        days.append({
+            "date": day,
+            "booked": row.get('booked', 0),
+            "available": max(INSPECTION_DAILY_CAP - row.get('agent_booked', 0), 0)
+        })
+    return {"daily_capacity": INSPECTION_DAILY_CAP, "days": days}
+
+def apply_wallet_delta(user_id: str, delta: int, source_ref: str, reason: str) -> dict:
+    """Append a ledger entry and update the balance atomically; source_ref makes retries no-ops."""
+    result = supabase_admin.rpc('wallet_apply', {
+        "p_user": user_id,
+        "p_delta": delta,
+        "p_source_ref": source_ref,
+        "p_reason": reason
+    }).execute()
+    wallet_cache.pop(user_id)
+    db_router.mark_write(user_id)
+    return result.data
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     if not credentials:
@@ -121,15 +453,16 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         supabase_user = user_response.user
         
         # Get user profile from our users table
-        result = supabase_admin.table('users').select('*').eq('id', supabase_user.id).single().execute()
+        profile = get_user_profile(supabase_user.id)
         
-        if not result.data:
+        if not profile:
             raise HTTPException(status_code=401, detail="User profile not found")
         
-        user = result.data
+        user = dict(profile)
         if user.get('suspended'):
             raise HTTPException(status_code=403, detail="Account suspended")
         
+        db_router.set_user(user['id'])
         return user
     except Exception as e:
         logger.error(f"Auth error: {e}")
@@ -161,25 +494,7 @@ async def register(data: UserCreate):
         
         user_id = auth_response.user.id
         
-        # Create user profile in users table
-        user_profile = {
-            "id": user_id,
-            "email": data.email,
-            "full_name": data.full_name,
-            "role": "user",
-            "suspended": False,
-            "created_at": datetime.now(timezone.utc).isoformat()
-        }
-        supabase_admin.table('users').insert(user_profile).execute()
-        
-        # Create wallet for user
-        wallet = {
-            "user_id": user_id,
-            "token_balance": 0,
-            "created_at": datetime.now(timezone.utc).isoformat()
-        }
-        supabase_admin.table('wallets').insert(wallet).execute()
-        
+        # The handle_new_user trigger created the profile and wallet with the auth user
         return {
             "token": auth_response.session.access_token if auth_response.session else None,
             "user": {
@@ -237,8 +552,8 @@ async def login(data: UserLogin):
 @api_router.get("/auth/me")
 async def get_me(user: dict = Depends(get_current_user)):
     # Get wallet balance
-    wallet_result = supabase_admin.table('wallets').select('token_balance').eq('user_id', user['id']).single().execute()
-    token_balance = wallet_result.data.get('token_balance', 0) if wallet_result.data else 0
+    wallet = get_wallet_row(user['id'])
+    token_balance = wallet.get('token_balance', 0) if wallet else 0
     
     return {
         "id": user['id'],
@@ -316,22 +631,26 @@ async def review_verification(request_id: str, data: ApprovalRequest, user: dict
     # If approved, update user role to agent
     if data.status == "approved":
         supabase_admin.table('users').update({"role": "agent"}).eq('id', verification['user_id']).execute()
+        user_cache.pop(verification['user_id'])
     
     return {"message": f"Verification {data.status}"}
 
 # ============== PROPERTY ROUTES ==============
 
-@api_router.post("/properties")
-async def create_property(data: PropertyCreate, user: dict = Depends(get_current_user)):
-    await require_role(user, ['agent', 'admin'])
+def build_property_doc(data: PropertyCreate, user: dict) -> dict:
+    # Fall back to the local gazetteer when the agent didn't pin coordinates
+    latitude, longitude = data.latitude, data.longitude
+    if latitude is None or longitude is None:
+        latitude, longitude = geocode(data.location, campuses.current()) or (None, None)
     
-    property_id = str(uuid.uuid4())
     property_doc = {
-        "id": property_id,
+        "id": str(uuid.uuid4()),
         "title": data.title,
         "description": data.description,
         "price": data.price,
         "location": data.location,
+        "latitude": latitude,
+        "longitude": longitude,
         "property_type": data.property_type,
         "images": data.images,
         "contact_name": data.contact_name,
@@ -342,17 +661,127 @@ async def create_property(data: PropertyCreate, user: dict = Depends(get_current
         "approved_by_admin_id": None,
         "created_at": datetime.now(timezone.utc).isoformat()
     }
+    # Probable re-posts are still accepted, but flagged for the admin review queue
+    duplicate_index = duplicate_indexes.current()
+    property_doc.update(duplicate_index.find_text(property_doc) or {})
+    duplicate_index.add(property_doc)
+    return property_doc
+
+@api_router.post("/properties")
+async def create_property(data: PropertyCreate, user: dict = Depends(get_current_user)):
+    await require_role(user, ['agent', 'admin'])
+    
+    property_doc = build_property_doc(data, user)
     supabase_admin.table('properties').insert(property_doc).execute()
-    return {"message": "Property created", "property_id": property_id}
+    # Pending feeds (the admin review queue) list new listings straight away
+    feed_caches.pop(campuses.current())
+    schedule_image_hashing([property_doc])
+    return {
+        "message": "Property created",
+        "property_id": property_doc['id'],
+        "possible_duplicate_of": property_doc.get('duplicate_of')
+    }
+
+@api_router.post("/properties/bulk")
+async def bulk_create_properties(data: PropertyBulkCreate, user: dict = Depends(get_current_user)):
+    await require_role(user, ['agent', 'admin'])
+    
+    if not data.properties:
+        raise HTTPException(status_code=400, detail="No properties to import")
+    if len(data.properties) > MAX_BULK_PROPERTIES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BULK_PROPERTIES} properties per import")
+    
+    # Each listing is checked against the index and the rows before it in this batch
+    property_docs = [build_property_doc(item, user) for item in data.properties]
+    supabase_admin.table('properties').insert(property_docs).execute()
+    feed_caches.pop(campuses.current())
+    schedule_image_hashing(property_docs)
+    return {
+        "message": f"{len(property_docs)} properties created",
+        "properties": [{
+            "property_id": doc['id'],
+            "possible_duplicate_of": doc.get('duplicate_of')
+        } for doc in property_docs]
+    }
 
 @api_router.get("/properties")
 async def get_properties(
+    request: Request,
     status: Optional[str] = None,
     property_type: Optional[str] = None,
     min_price: Optional[int] = None,
-    max_price: Optional[int] = None
+    max_price: Optional[int] = None,
+    near: Optional[str] = None,
+    radius: Optional[int] = None,
+    sort: Optional[str] = None
 ):
-    query = supabase_admin.table('properties').select('*')
+    if sort not in (None, 'newest', 'trending'):
+        raise HTTPException(status_code=400, detail="sort must be newest or trending")
+    if radius is not None and not near:
+        raise HTTPException(status_code=400, detail="radius requires near")
+    
+    # Hot feed: serialize and compress once, then serve the cached bytes
+    feed_cache = feed_caches.current()
+    cache_key = str(sorted(request.query_params.multi_items()))
+    cached = feed_cache.get(cache_key)
+    if cached is None:
+        try:
+            data = await within_budget(fetch_properties, status, property_type, min_price, max_price, near, radius)
+        except Exception as e:
+            body = snapshot_feed(status, property_type, min_price, max_price, near, sort) \
+                if database_unavailable(e) else None
+            if body is None:
+                raise
+            logger.warning(f"Serving listings from the catalogue snapshot: {e!r}")
+            revalidate_snapshot()
+            # Not cached: the next request tries the database again
+            return Response(body, media_type='application/json',
+                            headers=snapshot_headers(catalogue_snapshots[campuses.current()]))
+        if sort == 'trending':
+            # Positions come precomputed from the background ranker: one dict lookup per row
+            data = trending.rank(data)
+        cached = CompressedBody(json.dumps(data, separators=(',', ':')).encode())
+        feed_cache.set(cache_key, cached)
+    return cached.response(request.headers.get('accept-encoding'))
+
+def snapshot_feed(status, property_type, min_price, max_price, near, sort) -> Optional[bytes]:
+    """The feed from the campus's snapshot, or None for queries it can't answer."""
+    snapshot = catalogue_snapshots.get(campuses.current())
+    if not snapshot or not snapshot.loaded or near or status not in (None, 'approved'):
+        return None
+    if property_type is None and min_price is None and max_price is None and sort != 'trending':
+        # Already the serialized feed, straight from the mapping
+        return snapshot.feed_body()
+    data = [p for p in snapshot.listings()
+            if (property_type is None or p.get('property_type') == property_type)
+            and (min_price is None or p['price'] >= min_price)
+            and (max_price is None or p['price'] <= max_price)]
+    if sort == 'trending':
+        data = trending.rank(data)
+    return json.dumps(data, separators=(',', ':')).encode()
+
+def fetch_properties(status, property_type, min_price, max_price, near, radius):
+    if near:
+        point = parse_near(near, campuses.current())
+        if not point:
+            raise HTTPException(status_code=400, detail="Unknown location for near")
+        if radius is not None and radius <= 0:
+            raise HTTPException(status_code=400, detail="radius must be positive")
+        
+        # Distance filtering and ordering run in Postgres against the earthdistance GiST index
+        result = db_router.reader().rpc('properties_near', {
+            "lat": point[0],
+            "lng": point[1],
+            "radius_m": radius,
+            "p_status": status or 'approved',
+            "p_property_type": property_type,
+            "p_min_price": min_price,
+            "p_max_price": max_price,
+            "p_campus": campuses.current()
+        }).execute()
+        return result.data
+    
+    query = db_router.reader().table('properties').select('*')
     
     if status:
         query = query.eq('status', status)
@@ -371,6 +800,35 @@ async def get_properties(
     result = query.order('created_at', desc=True).execute()
     return result.data
 
+@api_router.get("/properties/changes")
+async def get_property_changes(since: Optional[str] = None):
+    """Approved-feed changes since a previous sync; without `since`, the whole feed in pages."""
+    since_at, after_id = decode_cursor(since, 2) if since else (None, None)
+    if since_at:
+        try:
+            since_time = datetime.fromisoformat(since_at)
+        except (TypeError, ValueError):
+            since_time = None
+        if since_time is None or since_time.tzinfo is None:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        if since_time < datetime.now(timezone.utc) - timedelta(days=SYNC_TOMBSTONE_DAYS):
+            # Tombstones older than this are purged, so removals could be missed
+            raise HTTPException(status_code=410, detail="Sync cursor expired; fetch the full feed")
+    
+    result = db_router.reader().rpc('property_changes', {
+        "p_since": since_at,
+        "p_after_id": after_id,
+        "p_limit": SYNC_PAGE_SIZE,
+        "p_campus": campuses.current()
+    }).execute()
+    changes = result.data
+    return {
+        "upserts": changes['upserts'],
+        "removals": changes['removals'],
+        "has_more": changes['has_more'],
+        "next_cursor": encode_cursor(sync_cursor(changes))
+    }
+
 @api_router.get("/properties/my-listings")
 async def get_my_listings(user: dict = Depends(get_current_user)):
     await require_role(user, ['agent', 'admin'])
@@ -386,22 +844,23 @@ async def get_pending_properties(user: dict = Depends(get_current_user)):
 @api_router.get("/properties/all")
 async def get_all_properties(user: dict = Depends(get_current_user)):
     await require_role(user, ['admin'])
-    result = supabase_admin.table('properties').select('*').order('created_at', desc=True).execute()
+    result = db_router.reader(user['id']).table('properties').select('*').order('created_at', desc=True).execute()
     return result.data
 
 @api_router.get("/properties/{property_id}")
 async def get_property(property_id: str, user: dict = Depends(get_current_user)):
-    result = supabase_admin.table('properties').select('*').eq('id', property_id).single().execute()
-    if not result.data:
+    property_doc = get_property_row(property_id)
+    if not property_doc:
         raise HTTPException(status_code=404, detail="Property not found")
     
-    property_doc = result.data
-    
     # Check if user has unlocked this property
-    unlock_result = supabase_admin.table('unlocks').select('id').eq('user_id', user['id']).eq('property_id', property_id).execute()
+    unlocked = property_id in get_unlocked_ids(user['id'])
+    
+    if property_doc.get('status') == 'approved' and property_doc.get('uploaded_by_agent_id') != user['id']:
+        view_counters.current().record(property_id, user['id'])
     
     response = dict(property_doc)
-    response['contact_unlocked'] = len(unlock_result.data) > 0
+    response['contact_unlocked'] = unlocked
     
     # Hide contact info if not unlocked (and not agent/admin)
     if not response['contact_unlocked'] and user['role'] == 'user':
@@ -410,15 +869,59 @@ async def get_property(property_id: str, user: dict = Depends(get_current_user))
     return response
 
 @api_router.get("/properties/{property_id}/public")
-async def get_property_public(property_id: str):
-    result = supabase_admin.table('properties').select('*').eq('id', property_id).eq('status', 'approved').single().execute()
-    if not result.data:
+async def get_property_public(property_id: str, request: Request):
+    headers = None
+    try:
+        property_doc = await within_budget(get_property_row, property_id)
+    except Exception as e:
+        snapshot = catalogue_snapshots.get(campuses.current())
+        if not database_unavailable(e) or not snapshot or not snapshot.loaded:
+            raise
+        logger.warning(f"Serving listing {property_id} from the catalogue snapshot: {e!r}")
+        revalidate_snapshot()
+        property_doc = snapshot.get(property_id)
+        headers = snapshot_headers(snapshot)
+    if not property_doc or property_doc.get('status') != 'approved':
         raise HTTPException(status_code=404, detail="Property not found")
     
-    response = dict(result.data)
+    if request.client:
+        view_counters.current().record(property_id, f"ip:{request.client.host}")
+    
+    response = dict(property_doc)
     response['contact_phone'] = "***LOCKED***"
     response['contact_unlocked'] = False
-    return response
+    return JSONResponse(response, headers=headers) if headers else response
+
+@api_router.get("/properties/{property_id}/views")
+async def get_property_views(property_id: str, days: int = 30, user: dict = Depends(get_current_user)):
+    await require_role(user, ['agent', 'admin'])
+    
+    property_doc = get_property_row(property_id)
+    if not property_doc:
+        raise HTTPException(status_code=404, detail="Property not found")
+    if user['role'] == 'agent' and property_doc['uploaded_by_agent_id'] != user['id']:
+        raise HTTPException(status_code=403, detail="Not authorized to view these stats")
+    
+    since = (datetime.now(timezone.utc) - timedelta(days=max(1, min(days, 365)) - 1)).date().isoformat()
+    result = supabase_admin.table('property_view_days').select('day, views') \
+        .eq('property_id', property_id).gte('day', since).order('day').execute()
+    # Views still buffered in workers show up after the next flush
+    return {"total": sum(row['views'] for row in result.data), "daily": result.data}
+
+@api_router.get("/properties/{property_id}/inspection-calendar")
+async def get_property_inspection_calendar(property_id: str, start: Optional[str] = None, end: Optional[str] = None,
+                                           user: dict = Depends(get_current_user)):
+    property_doc = get_property_row(property_id)
+    if not property_doc or property_doc.get('status') != 'approved':
+        raise HTTPException(status_code=404, detail="Property not found")
+    first, last = parse_calendar_range(start, end)
+    return inspection_calendar(first, last, property_doc['uploaded_by_agent_id'], property_id)
+
+@api_router.get("/properties/{property_id}/similar")
+async def get_similar_properties(property_id: str, k: int = 6):
+    # Served entirely from the in-memory index; empty until the first build finishes
+    similar = similar_indexes.current().similar(property_id, max(1, min(k, 20)))
+    return similar or []
 
 @api_router.put("/properties/{property_id}")
 async def update_property(property_id: str, data: PropertyUpdate, user: dict = Depends(get_current_user)):
@@ -433,8 +936,20 @@ async def update_property(property_id: str, data: PropertyUpdate, user: dict = D
         raise HTTPException(status_code=403, detail="Not authorized to edit this property")
     
     update_data = {k: v for k, v in data.model_dump().items() if v is not None}
+    if 'location' in update_data and 'latitude' not in update_data and 'longitude' not in update_data:
+        # A location the gazetteer doesn't know keeps whatever pin the listing already has
+        point = geocode(update_data['location'], campuses.current())
+        if point:
+            update_data['latitude'], update_data['longitude'] = point
     if update_data:
-        supabase_admin.table('properties').update(update_data).eq('id', property_id).execute()
+        updated = supabase_admin.table('properties').update(update_data).eq('id', property_id).execute()
+        property_cache.pop(property_id)
+        feed_caches.pop(campuses.current())
+        if updated.data:
+            similar_indexes.current().upsert(updated.data[0])
+            duplicate_indexes.current().add(updated.data[0])
+            if 'images' in update_data:
+                schedule_image_hashing(updated.data)
     
     return {"message": "Property updated"}
 
@@ -443,25 +958,101 @@ async def delete_property(property_id: str, user: dict = Depends(get_current_use
     await require_role(user, ['admin'])
     
     supabase_admin.table('properties').delete().eq('id', property_id).execute()
+    property_cache.pop(property_id)
+    feed_caches.pop(campuses.current())
+    similar_indexes.current().remove(property_id)
+    duplicate_indexes.current().remove(property_id)
     return {"message": "Property deleted"}
 
 @api_router.post("/properties/{property_id}/approve")
 async def approve_property(property_id: str, data: ApprovalRequest, user: dict = Depends(get_current_user)):
     await require_role(user, ['admin'])
     
-    supabase_admin.table('properties').update({
+    updated = supabase_admin.table('properties').update({
         "status": data.status,
         "approved_by_admin_id": user['id']
     }).eq('id', property_id).execute()
+    property_cache.pop(property_id)
+    feed_caches.pop(campuses.current())
+    if updated.data:
+        similar_indexes.current().upsert(updated.data[0])
+        if data.status == 'approved':
+            notify_saved_searches(updated.data[0])
     
     return {"message": f"Property {data.status}"}
 
+# ============== SAVED SEARCHES ==============
+
+def notify_saved_searches(listing: dict):
+    """Queue a notification for every saved search the newly approved listing satisfies."""
+    matches = search_matchers.current().match(listing)
+    if not matches:
+        return 0
+    
+    notifications = [{
+        "user_id": search['user_id'],
+        "saved_search_id": search['id'],
+        "property_id": listing['id'],
+        "property_title": listing.get('title')
+    } for search in matches]
+    # Re-approving a listing must not notify the same search twice
+    supabase_admin.table('search_notifications').upsert(
+        notifications, on_conflict='saved_search_id,property_id', ignore_duplicates=True
+    ).execute()
+    logger.info(f"Listing {listing['id']} matched {len(matches)} saved searches")
+    return len(matches)
+
+@api_router.post("/saved-searches")
+async def create_saved_search(data: SavedSearchCreate, user: dict = Depends(get_current_user)):
+    if data.min_price is not None and data.max_price is not None and data.min_price > data.max_price:
+        raise HTTPException(status_code=400, detail="min_price cannot exceed max_price")
+    
+    existing = supabase_admin.table('saved_searches').select('id', count='exact').eq('user_id', user['id']).execute()
+    if (existing.count or 0) >= MAX_SAVED_SEARCHES:
+        raise HTTPException(status_code=400, detail=f"You can save at most {MAX_SAVED_SEARCHES} searches")
+    
+    search = {
+        "id": str(uuid.uuid4()),
+        "user_id": user['id'],
+        **data.model_dump(),
+        "created_at": datetime.now(timezone.utc).isoformat()
+    }
+    supabase_admin.table('saved_searches').insert(search).execute()
+    search_matchers.current().add(search)
+    return search
+
+@api_router.get("/saved-searches")
+async def get_my_saved_searches(user: dict = Depends(get_current_user)):
+    result = supabase_admin.table('saved_searches').select('*').eq('user_id', user['id']).order('created_at', desc=True).execute()
+    return result.data
+
+@api_router.delete("/saved-searches/{search_id}")
+async def delete_saved_search(search_id: str, user: dict = Depends(get_current_user)):
+    result = supabase_admin.table('saved_searches').delete().eq('id', search_id).eq('user_id', user['id']).execute()
+    if not result.data:
+        raise HTTPException(status_code=404, detail="Saved search not found")
+    search_matchers.current().remove(search_id)
+    return {"message": "Saved search deleted"}
+
+@api_router.get("/saved-searches/notifications")
+async def get_search_notifications(user: dict = Depends(get_current_user)):
+    result = supabase_admin.table('search_notifications').select('*').eq('user_id', user['id']) \
+        .is_('read_at', 'null').order('created_at', desc=True).limit(100).execute()
+    return result.data
+
+@api_router.post("/saved-searches/notifications/read")
+async def mark_search_notifications_read(user: dict = Depends(get_current_user)):
+    supabase_admin.table('search_notifications').update({
+        "read_at": datetime.now(timezone.utc).isoformat()
+    }).eq('user_id', user['id']).is_('read_at', 'null').execute()
+    return {"message": "Notifications marked as read"}
+
 # ============== WALLET & TOKEN ROUTES ==============
 
 @api_router.get("/wallet")
 async def get_wallet(user: dict = Depends(get_current_user)):
-    result = supabase_admin.table('wallets').select('*').eq('user_id', user['id']).single().execute()
-    if not result.data:
+    wallet = get_wallet_row(user['id'])
+    if not wallet:
         # Create wallet if doesn't exist
         wallet = {
             "user_id": user['id'],
@@ -469,8 +1060,7 @@ async def get_wallet(user: dict = Depends(get_current_user)):
             "created_at": datetime.now(timezone.utc).isoformat()
         }
         supabase_admin.table('wallets').insert(wallet).execute()
-        return wallet
-    return result.data
+    return wallet
 
 @api_router.get("/wallet/{user_id}")
 async def get_user_wallet(user_id: str, user: dict = Depends(get_current_user)):
@@ -509,15 +1099,9 @@ async def initiate_token_purchase(data: TokenPurchaseRequest, user: dict = Depen
 @api_router.post("/properties/{property_id}/unlock")
 async def unlock_property_contact(property_id: str, user: dict = Depends(get_current_user)):
     # Check if already unlocked
-    existing = supabase_admin.table('unlocks').select('id').eq('user_id', user['id']).eq('property_id', property_id).execute()
-    if existing.data:
+    if property_id in get_unlocked_ids(user['id']):
         raise HTTPException(status_code=400, detail="Already unlocked")
     
-    # Check wallet balance
-    wallet_result = supabase_admin.table('wallets').select('token_balance').eq('user_id', user['id']).single().execute()
-    if not wallet_result.data or wallet_result.data.get('token_balance', 0) < 1:
-        raise HTTPException(status_code=400, detail="Insufficient token balance")
-    
     # Check property exists
     property_result = supabase_admin.table('properties').select('*').eq('id', property_id).eq('status', 'approved').single().execute()
     if not property_result.data:
@@ -525,18 +1109,21 @@ async def unlock_property_contact(property_id: str, user: dict = Depends(get_cur
     
     property_doc = property_result.data
     
-    # Deduct token
-    new_balance = wallet_result.data['token_balance'] - 1
-    supabase_admin.table('wallets').update({"token_balance": new_balance}).eq('user_id', user['id']).execute()
+    # Deduct token; keyed per user+property so a retried unlock never charges twice
+    debit = apply_wallet_delta(user['id'], -1, f"unlock:{user['id']}:{property_id}", "unlock")
+    if debit['insufficient']:
+        raise HTTPException(status_code=400, detail="Insufficient token balance")
     
-    # Create unlock record
+    # Create unlock record; a concurrent unlock of the same listing may have written it
+    # first (its debit won and ours came back as a duplicate), which is the same outcome
     unlock = {
         "id": str(uuid.uuid4()),
         "user_id": user['id'],
         "property_id": property_id,
         "unlocked_at": datetime.now(timezone.utc).isoformat()
     }
-    supabase_admin.table('unlocks').insert(unlock).execute()
+    supabase_admin.table('unlocks').upsert(unlock, on_conflict='user_id,property_id', ignore_duplicates=True).execute()
+    unlock_cache.set(user['id'], get_unlocked_ids(user['id']) | {property_id})
     
     return {
         "message": "Contact unlocked",
@@ -546,15 +1133,23 @@ async def unlock_property_contact(property_id: str, user: dict = Depends(get_cur
 
 @api_router.get("/unlocks")
 async def get_my_unlocks(user: dict = Depends(get_current_user)):
-    unlocks_result = supabase_admin.table('unlocks').select('*').eq('user_id', user['id']).execute()
+    db = db_router.reader(user['id'])
+    unlocks_result = db.table('unlocks').select('*').eq('user_id', user['id']).execute()
+    if not unlocks_result.data:
+        return []
+    
+    # One batched lookup for every unlocked property rather than one query per unlock
+    property_ids = list({unlock['property_id'] for unlock in unlocks_result.data})
+    properties_result = db.table('properties').select('*').in_('id', property_ids).execute()
+    properties = {p['id']: p for p in properties_result.data}
     
     result = []
     for unlock in unlocks_result.data:
-        property_result = supabase_admin.table('properties').select('*').eq('id', unlock['property_id']).single().execute()
-        if property_result.data:
+        property_doc = properties.get(unlock['property_id'])
+        if property_doc:
             result.append({
                 **unlock,
-                "property": property_result.data
+                "property": property_doc
             })
     
     return result
@@ -620,15 +1215,34 @@ async def get_my_inspections(user: dict = Depends(get_current_user)):
     return result.data
 
 @api_router.get("/inspections/assigned")
-async def get_assigned_inspections(user: dict = Depends(get_current_user)):
+async def get_assigned_inspections(start: Optional[str] = None, end: Optional[str] = None,
+                                   user: dict = Depends(get_current_user)):
     await require_role(user, ['agent', 'admin'])
-    result = supabase_admin.table('inspections').select('*').eq('agent_id', user['id']).order('created_at', desc=True).execute()
-    return result.data
+    query = supabase_admin.table('inspections').select('*').eq('agent_id', user['id'])
+    if start or end:
+        # One calendar range, served by the (agent_id, inspection_date) index
+        first, last = parse_calendar_range(start, end)
+        query = query.gte('inspection_date', first.isoformat()).lte('inspection_date', last.isoformat()) \
+            .order('inspection_date')
+    else:
+        query = query.order('created_at', desc=True)
+    return query.execute().data
+
+@api_router.get("/inspections/calendar")
+async def get_inspection_calendar(start: Optional[str] = None, end: Optional[str] = None,
+                                  agent_id: Optional[str] = None, user: dict = Depends(get_current_user)):
+    await require_role(user, ['agent', 'admin'])
+    if user['role'] == 'agent':
+        agent_id = user['id']
+    elif not agent_id:
+        raise HTTPException(status_code=400, detail="agent_id is required")
+    first, last = parse_calendar_range(start, end)
+    return inspection_calendar(first, last, agent_id)
 
 @api_router.get("/inspections/all")
 async def get_all_inspections(user: dict = Depends(get_current_user)):
     await require_role(user, ['admin'])
-    result = supabase_admin.table('inspections').select('*').order('created_at', desc=True).execute()
+    result = db_router.reader(user['id']).table('inspections').select('*').order('created_at', desc=True).execute()
     return result.data
 
 @api_router.put("/inspections/{inspection_id}")
@@ -652,12 +1266,19 @@ async def update_inspection(inspection_id: str, data: InspectionUpdateRequest, u
         agent_result = supabase_admin.table('users').select('full_name').eq('id', data.agent_id).single().execute()
         update_data['agent_id'] = data.agent_id
         update_data['agent_name'] = agent_result.data['full_name'] if agent_result.data else ''
+        # Manual placement wins; the scheduler skips anything already scheduled
+        update_data['scheduled_at'] = datetime.now(timezone.utc).isoformat()
     
     if update_data:
         supabase_admin.table('inspections').update(update_data).eq('id', inspection_id).execute()
     
     return {"message": "Inspection updated"}
 
+@api_router.post("/inspections/schedule")
+async def schedule_inspections(user: dict = Depends(get_current_user)):
+    await require_role(user, ['admin'])
+    return await asyncio.to_thread(run_inspection_scheduler)
+
 @api_router.get("/inspections/{inspection_id}/agent-contact")
 async def get_inspection_agent_contact(inspection_id: str, user: dict = Depends(get_current_user)):
     result = supabase_admin.table('inspections').select('*').eq('id', inspection_id).single().execute()
@@ -686,12 +1307,39 @@ async def get_inspection_agent_contact(inspection_id: str, user: dict = Depends(
         "property_title": inspection.get('property_title', '')
     }
 
+# ============== AGENT DASHBOARD ==============
+
+@api_router.get("/agent/summary")
+async def get_agent_summary(user: dict = Depends(get_current_user)):
+    await require_role(user, ['agent', 'admin'])
+    
+    # Counters are maintained by triggers on properties, inspections and unlocks; upcoming
+    # inspections are counted at read time so past-dated ones drop out
+    stats = supabase_admin.rpc('agent_summary', {"p_agent": user['id']}).execute().data or {}
+    
+    listings = {
+        "pending": stats.get('listings_pending', 0),
+        "approved": stats.get('listings_approved', 0),
+        "rejected": stats.get('listings_rejected', 0)
+    }
+    return {
+        "listings": {**listings, "total": sum(listings.values())},
+        "inspections": {
+            "upcoming": stats.get('inspections_upcoming', 0),
+            "completed": stats.get('inspections_completed', 0)
+        },
+        "unlocks": stats.get('unlocks', 0),
+        "views": stats.get('views', 0),
+        "updated_at": stats.get('updated_at')
+    }
+
 # ============== TRANSACTION ROUTES ==============
 
 @api_router.get("/transactions")
 async def get_my_transactions(user: dict = Depends(get_current_user)):
-    token_result = supabase_admin.table('transactions').select('*').eq('user_id', user['id']).order('created_at', desc=True).execute()
-    inspection_result = supabase_admin.table('inspection_transactions').select('*').eq('user_id', user['id']).order('created_at', desc=True).execute()
+    db = db_router.reader(user['id'])
+    token_result = db.table('transactions').select('*').eq('user_id', user['id']).order('created_at', desc=True).execute()
+    inspection_result = db.table('inspection_transactions').select('*').eq('user_id', user['id']).order('created_at', desc=True).execute()
     
     return {
         "token_transactions": token_result.data,
@@ -699,24 +1347,126 @@ async def get_my_transactions(user: dict = Depends(get_current_user)):
     }
 
 @api_router.get("/transactions/all")
-async def get_all_transactions(user: dict = Depends(get_current_user)):
+async def get_all_transactions(
+    days: Optional[int] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    user: dict = Depends(get_current_user)
+):
+    """Every payment, newest first. `days` keeps only recent ones; `limit` pages each list by cursor."""
     await require_role(user, ['admin'])
     
-    token_result = supabase_admin.table('transactions').select('*').order('created_at', desc=True).execute()
-    inspection_result = supabase_admin.table('inspection_transactions').select('*').order('created_at', desc=True).execute()
-    
-    return {
-        "token_transactions": token_result.data,
-        "inspection_transactions": inspection_result.data
+    if limit is not None and not 1 <= limit <= MAX_TRANSACTION_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_TRANSACTION_PAGE_SIZE}")
+    if cursor and limit is None:
+        raise HTTPException(status_code=400, detail="cursor requires limit")
+    # [created_at, id] of the last row sent from each table; a null position means that list is finished
+    positions = decode_cursor(cursor, 4) if cursor else [None] * 4
+    
+    db = db_router.reader(user['id'])
+    pages = {}
+    for table, position in (('transactions', positions[:2]), ('inspection_transactions', positions[2:])):
+        if cursor and position[0] is None:
+            pages[table] = []
+            continue
+        query = db.table(table).select('*').order('created_at', desc=True).order('id', desc=True)
+        if days is not None:
+            # Bounded by created_at so only the recent monthly partitions are scanned
+            query = query.gte('created_at', (datetime.now(timezone.utc) - timedelta(days=max(1, days))).isoformat())
+        if limit is not None:
+            query = query.limit(limit)
+        pages[table] = after_keyset(query, 'created_at', position if cursor else None, desc=True).execute().data
+    
+    response = {
+        "token_transactions": pages['transactions'],
+        "inspection_transactions": pages['inspection_transactions']
     }
+    if limit is not None:
+        ends = []
+        for rows in pages.values():
+            ends += [rows[-1]['created_at'], rows[-1]['id']] if len(rows) == limit else [None, None]
+        response["next_cursor"] = encode_cursor(ends) if any(ends) else None
+    return response
 
 # ============== USER MANAGEMENT (ADMIN) ==============
 
 @api_router.get("/users")
-async def get_all_users(user: dict = Depends(get_current_user)):
+async def get_all_users(
+    q: Optional[str] = None,
+    role: Optional[str] = None,
+    suspended: Optional[bool] = None,
+    cursor: Optional[str] = None,
+    limit: int = 50,
+    user: dict = Depends(get_current_user)
+):
     await require_role(user, ['admin'])
-    result = supabase_admin.table('users').select('id, email, full_name, role, suspended, created_at').order('created_at', desc=True).execute()
-    return result.data
+    
+    if role is not None and role not in ['user', 'agent', 'admin']:
+        raise HTTPException(status_code=400, detail="Invalid role")
+    if not 1 <= limit <= MAX_USER_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_USER_PAGE_SIZE}")
+    after_rank, after_created_at, after_id = decode_cursor(cursor, 3) if cursor else (None, None, None)
+    
+    # Prefix, substring and trigram matching with keyset pagination, all index-backed in Postgres
+    result = db_router.reader(user['id']).rpc('search_users', {
+        "p_query": q,
+        "p_role": role,
+        "p_suspended": suspended,
+        "p_after_rank": after_rank,
+        "p_after_created_at": after_created_at,
+        "p_after_id": after_id,
+        "p_limit": limit
+    }).execute()
+    users = result.data or []
+    return {
+        "users": users,
+        "next_cursor": encode_cursor([users[-1]['match_rank'], users[-1]['created_at'], users[-1]['id']])
+            if len(users) == limit else None
+    }
+
+@api_router.post("/users/bulk")
+async def provision_users(data: BulkProvisionRequest, user: dict = Depends(get_current_user)):
+    await require_role(user, ['admin'])
+    
+    if data.role not in ['user', 'agent']:
+        raise HTTPException(status_code=400, detail="Role must be user or agent")
+    if not data.accounts:
+        raise HTTPException(status_code=400, detail="No accounts to create")
+    if len(data.accounts) > MAX_BULK_USERS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BULK_USERS} accounts per batch")
+    
+    accounts = {}
+    for account in data.accounts:
+        accounts.setdefault(account.email.lower(), account)
+    # One query finds the addresses that already have accounts
+    existing = supabase_admin.table('users').select('email').in_('email', list(accounts)).execute()
+    skipped = sorted({row['email'].lower() for row in existing.data})
+    
+    created, failed = [], []
+    semaphore = asyncio.Semaphore(PROVISION_CONCURRENCY)
+    
+    def create(email: str, account: ProvisionAccount):
+        # GoTrue has no batch create; the trigger adds the profile and wallet with each auth user
+        return supabase_admin.auth.admin.create_user({
+            "email": email,
+            "password": account.password or secrets.token_urlsafe(24),
+            "email_confirm": True,
+            "user_metadata": {"full_name": account.full_name},
+            "app_metadata": {"role": data.role}
+        })
+    
+    async def provision(email: str, account: ProvisionAccount):
+        async with semaphore:
+            try:
+                response = await asyncio.to_thread(create, email, account)
+                created.append({"id": response.user.id, "email": email})
+            except Exception as e:
+                logger.warning(f"Provisioning {email} failed: {e}")
+                failed.append({"email": email, "error": str(e)})
+    
+    await asyncio.gather(*(provision(email, account) for email, account in accounts.items() if email not in skipped))
+    logger.info(f"Provisioned {len(created)} {data.role} accounts ({len(skipped)} existing, {len(failed)} failed)")
+    return {"created": created, "skipped": skipped, "failed": failed}
 
 @api_router.get("/users/{user_id}")
 async def get_user(user_id: str, user: dict = Depends(get_current_user)):
@@ -734,6 +1484,7 @@ async def update_user_role(user_id: str, data: RoleUpdateRequest, user: dict = D
         raise HTTPException(status_code=400, detail="Invalid role")
     
     supabase_admin.table('users').update({"role": data.role}).eq('id', user_id).execute()
+    user_cache.pop(user_id)
     return {"message": f"Role updated to {data.role}"}
 
 @api_router.put("/users/{user_id}/suspend")
@@ -741,6 +1492,7 @@ async def suspend_user(user_id: str, data: SuspendUserRequest, user: dict = Depe
     await require_role(user, ['admin'])
     
     supabase_admin.table('users').update({"suspended": data.suspended}).eq('id', user_id).execute()
+    user_cache.pop(user_id)
     return {"message": f"User {'suspended' if data.suspended else 'unsuspended'}"}
 
 # ============== ADMIN DASHBOARD STATS ==============
@@ -749,34 +1501,23 @@ async def suspend_user(user_id: str, data: SuspendUserRequest, user: dict = Depe
 async def get_admin_stats(user: dict = Depends(get_current_user)):
     await require_role(user, ['admin'])
     
-    # Get counts
-    users_result = supabase_admin.table('users').select('id', count='exact').execute()
-    agents_result = supabase_admin.table('users').select('id', count='exact').eq('role', 'agent').execute()
-    properties_result = supabase_admin.table('properties').select('id', count='exact').execute()
-    approved_result = supabase_admin.table('properties').select('id', count='exact').eq('status', 'approved').execute()
-    pending_props_result = supabase_admin.table('properties').select('id', count='exact').eq('status', 'pending').execute()
-    inspections_result = supabase_admin.table('inspections').select('id', count='exact').execute()
-    pending_insp_result = supabase_admin.table('inspections').select('id', count='exact').eq('status', 'pending').execute()
-    completed_insp_result = supabase_admin.table('inspections').select('id', count='exact').eq('status', 'completed').execute()
-    pending_ver_result = supabase_admin.table('agent_verification_requests').select('id', count='exact').eq('status', 'pending').execute()
-    
-    # Revenue calculations
-    token_txs = supabase_admin.table('transactions').select('amount').eq('status', 'completed').execute()
-    token_revenue = sum(tx.get('amount', 0) for tx in token_txs.data) if token_txs.data else 0
-    
-    insp_txs = supabase_admin.table('inspection_transactions').select('amount').eq('status', 'completed').execute()
-    inspection_revenue = sum(tx.get('amount', 0) for tx in insp_txs.data) if insp_txs.data else 0
+    # Counts and revenue are aggregated in Postgres in a single round trip; listing and
+    # inspection counts are the campus's, accounts and revenue its whole database's
+    result = db_router.reader(user['id']).rpc('admin_stats', {"p_campus": campuses.current()}).execute()
+    stats = result.data or {}
     
+    token_revenue = stats.get('token_revenue', 0)
+    inspection_revenue = stats.get('inspection_revenue', 0)
     return {
-        "total_users": users_result.count or 0,
-        "total_agents": agents_result.count or 0,
-        "total_properties": properties_result.count or 0,
-        "approved_properties": approved_result.count or 0,
-        "pending_properties": pending_props_result.count or 0,
-        "total_inspections": inspections_result.count or 0,
-        "pending_inspections": pending_insp_result.count or 0,
-        "completed_inspections": completed_insp_result.count or 0,
-        "pending_verifications": pending_ver_result.count or 0,
+        "total_users": stats.get('total_users', 0),
+        "total_agents": stats.get('total_agents', 0),
+        "total_properties": stats.get('total_properties', 0),
+        "approved_properties": stats.get('approved_properties', 0),
+        "pending_properties": stats.get('pending_properties', 0),
+        "total_inspections": stats.get('total_inspections', 0),
+        "pending_inspections": stats.get('pending_inspections', 0),
+        "completed_inspections": stats.get('completed_inspections', 0),
+        "pending_verifications": stats.get('pending_verifications', 0),
         "token_revenue": token_revenue,
         "inspection_revenue": inspection_revenue,
         "total_revenue": token_revenue + inspection_revenue
@@ -784,6 +1525,46 @@ async def get_admin_stats(user: dict = Depends(get_current_user)):
 
 # ============== WEBHOOK HANDLERS ==============
 
+def fetch_payment(reference: str) -> Optional[dict]:
+    """Token or inspection payment as {kind, ...row}, read from the one partition holding it."""
+    return supabase_admin.rpc('payment_by_reference', {"p_reference": reference}).execute().data
+
+def settle_successful_payment(reference: str, korapay_reference: Optional[str] = None):
+    # Conditional on not-yet-completed so a late webhook and the reconciler can't both credit
+    payment = supabase_admin.rpc('update_payment_status', {
+        "p_reference": reference,
+        "p_status": "completed",
+        "p_korapay_reference": korapay_reference
+    }).execute().data
+    if not payment:
+        return
+    
+    if payment['kind'] == 'token':
+        # Add tokens to wallet
+        apply_wallet_delta(payment['user_id'], payment['tokens_added'], reference, "token_purchase")
+        logger.info(f"Token purchase completed: {reference}")
+    else:
+        # Older references don't name their campus; the inspection id alone identifies the row
+        supabase_admin.table('inspections', scoped=False).update({
+            "payment_status": "completed",
+            "status": "assigned"
+        }).eq('id', payment['inspection_id']).execute()
+        db_router.mark_write(payment['user_id'])
+        logger.info(f"Inspection payment completed: {reference}")
+
+def close_pending_payments(table: str, rows: List[dict], status: str):
+    """Mark many pending payments failed/expired in one update per table."""
+    references = [row['reference'] for row in rows]
+    created = [row['created_at'] for row in rows]
+    # The created_at bounds confine the update to the partitions these rows live in
+    supabase_admin.table(table).update({"status": status}).in_('reference', references).eq('status', 'pending') \
+        .gte('created_at', min(created)).lte('created_at', max(created)).execute()
+    if table == 'inspection_transactions':
+        supabase_admin.table('inspections', scoped=False).update({
+            "payment_status": "failed",
+            "status": "cancelled"
+        }).in_('payment_reference', references).eq('payment_status', 'pending').execute()
+
 @api_router.post("/webhooks/koralpay")
 async def handle_koralpay_webhook(request: Request):
     body = await request.body()
@@ -810,97 +1591,54 @@ async def handle_koralpay_webhook(request: Request):
     
     logger.info(f"Webhook received: {event} for {reference}")
     
-    if event == "charge.success":
-        # Check if token transaction
-        token_result = supabase_admin.table('transactions').select('*').eq('reference', reference).single().execute()
-        if token_result.data:
-            token_tx = token_result.data
-            supabase_admin.table('transactions').update({
-                "status": "completed",
-                "koralpay_reference": data.get("korapay_reference")
-            }).eq('reference', reference).execute()
-            
-            # Add tokens to wallet
-            wallet_result = supabase_admin.table('wallets').select('token_balance').eq('user_id', token_tx['user_id']).single().execute()
-            new_balance = (wallet_result.data.get('token_balance', 0) if wallet_result.data else 0) + token_tx['tokens_added']
-            supabase_admin.table('wallets').update({"token_balance": new_balance}).eq('user_id', token_tx['user_id']).execute()
-            logger.info(f"Token purchase completed: {reference}")
+    with campuses.use(reference_campus(reference)):
+        if event == "charge.success":
+            settle_successful_payment(reference, data.get("korapay_reference"))
         
-        # Check if inspection transaction
-        insp_result = supabase_admin.table('inspection_transactions').select('*').eq('reference', reference).single().execute()
-        if insp_result.data:
-            insp_tx = insp_result.data
-            supabase_admin.table('inspection_transactions').update({
-                "status": "completed",
-                "koralpay_reference": data.get("korapay_reference")
-            }).eq('reference', reference).execute()
-            
-            # Update inspection payment status
-            supabase_admin.table('inspections').update({
-                "payment_status": "completed",
-                "status": "assigned"
-            }).eq('id', insp_tx['inspection_id']).execute()
-            logger.info(f"Inspection payment completed: {reference}")
-    
-    elif event == "charge.failed":
-        supabase_admin.table('transactions').update({"status": "failed"}).eq('reference', reference).execute()
-        supabase_admin.table('inspection_transactions').update({"status": "failed"}).eq('reference', reference).execute()
+        elif event == "charge.failed":
+            supabase_admin.rpc('update_payment_status', {"p_reference": reference, "p_status": "failed"}).execute()
     
     return {"status": "success"}
 
 @api_router.post("/payments/verify/{reference}")
 async def verify_payment(reference: str, user: dict = Depends(get_current_user)):
-    # Check token transaction
-    token_result = supabase_admin.table('transactions').select('*').eq('reference', reference).single().execute()
-    if token_result.data:
-        return {
-            "type": "token_purchase",
-            "status": token_result.data['status'],
-            "amount": token_result.data['amount'],
-            "tokens": token_result.data['tokens_added']
-        }
+    with campuses.use(reference_campus(reference)):
+        payment = fetch_payment(reference)
+    if not payment:
+        raise HTTPException(status_code=404, detail="Transaction not found")
     
-    # Check inspection transaction
-    insp_result = supabase_admin.table('inspection_transactions').select('*').eq('reference', reference).single().execute()
-    if insp_result.data:
+    if payment['kind'] == 'token':
         return {
-            "type": "inspection",
-            "status": insp_result.data['status'],
-            "amount": insp_result.data['amount'],
-            "inspection_id": insp_result.data['inspection_id']
+            "type": "token_purchase",
+            "status": payment['status'],
+            "amount": payment['amount'],
+            "tokens": payment['tokens_added']
         }
-    
-    raise HTTPException(status_code=404, detail="Transaction not found")
+    return {
+        "type": "inspection",
+        "status": payment['status'],
+        "amount": payment['amount'],
+        "inspection_id": payment['inspection_id']
+    }
+
+@api_router.post("/payments/reconcile")
+async def run_payment_reconciliation(user: dict = Depends(get_current_user)):
+    await require_role(user, ['admin'])
+    return await reconcile_pending_payments()
 
 # Simulate payment completion (for testing without KoralPay)
 @api_router.post("/payments/simulate/{reference}")
 async def simulate_payment(reference: str):
-    # Check token transaction
-    token_result = supabase_admin.table('transactions').select('*').eq('reference', reference).single().execute()
-    if token_result.data:
-        token_tx = token_result.data
-        supabase_admin.table('transactions').update({"status": "completed"}).eq('reference', reference).execute()
+    with campuses.use(reference_campus(reference)):
+        payment = fetch_payment(reference)
+        if not payment:
+            raise HTTPException(status_code=404, detail="Transaction not found")
         
-        # Add tokens to wallet
-        wallet_result = supabase_admin.table('wallets').select('token_balance').eq('user_id', token_tx['user_id']).single().execute()
-        new_balance = (wallet_result.data.get('token_balance', 0) if wallet_result.data else 0) + token_tx['tokens_added']
-        supabase_admin.table('wallets').update({"token_balance": new_balance}).eq('user_id', token_tx['user_id']).execute()
-        
-        return {"message": "Token payment simulated", "tokens_added": token_tx['tokens_added']}
-    
-    # Check inspection transaction
-    insp_result = supabase_admin.table('inspection_transactions').select('*').eq('reference', reference).single().execute()
-    if insp_result.data:
-        insp_tx = insp_result.data
-        supabase_admin.table('inspection_transactions').update({"status": "completed"}).eq('reference', reference).execute()
-        supabase_admin.table('inspections').update({
-            "payment_status": "completed",
-            "status": "assigned"
-        }).eq('id', insp_tx['inspection_id']).execute()
-        
-        return {"message": "Inspection payment simulated"}
-    
-    raise HTTPException(status_code=404, detail="Transaction not found")
+        # Same path as the webhook, so a simulated payment is only ever credited once
+        settle_successful_payment(reference)
+    if payment['kind'] == 'token':
+        return {"message": "Token payment simulated", "tokens_added": payment['tokens_added']}
+    return {"message": "Inspection payment simulated"}
 
 # ============== STORAGE ROUTES ==============
 
@@ -916,19 +1654,528 @@ async def get_upload_url(user: dict = Depends(get_current_user)):
         "file_path": file_name
     }
 
+# ============== BACKGROUND JOBS ==============
+
+def load_approved_properties():
+    result = supabase_admin.table('properties').select('*').eq('status', 'approved').execute()
+    return result.data or []
+
+def rebuild_similarity_index():
+    # Full rebuild refits IDF/price scaling; approvals and edits upsert in between
+    similar_index = similar_indexes.current()
+    snapshot = catalogue_snapshots.get(campuses.current())
+    if not len(similar_index) and snapshot and snapshot.loaded:
+        # Cold start: build from the local snapshot; later rebuilds read the database
+        similar_index.rebuild(snapshot.listings())
+    else:
+        similar_index.rebuild(load_approved_properties())
+    logger.info(f"Similarity index for {campuses.current()} rebuilt with {len(similar_index)} listings")
+
+async def hash_listing_images(listings: List[dict]):
+    """Hash each listing's images, index them and flag image duplicates in one batched update."""
+    try:
+        duplicate_index = duplicate_indexes.current()
+        rows = []
+        for listing in listings:
+            image_hashes = await fetch_image_hashes(listing.get('images') or [])
+            match = None if listing.get('duplicate_of') else duplicate_index.find_images(listing['id'], image_hashes)
+            duplicate_index.add_images(listing['id'], image_hashes)
+            rows.append({"id": listing['id'], "image_hashes": image_hashes, **(match or {})})
+        await asyncio.to_thread(supabase_admin.rpc('set_listing_image_hashes', {"p_rows": rows}).execute)
+    except Exception as e:
+        logger.error(f"Image hashing failed: {e}")
+
+def schedule_image_hashing(listings: List[dict]):
+    listings = [listing for listing in listings if listing.get('images')]
+    if not listings:
+        return
+    task = asyncio.create_task(hash_listing_images(listings))
+    image_hash_tasks.add(task)
+    task.add_done_callback(image_hash_tasks.discard)
+
+def reload_duplicate_index():
+    listings = []
+    page_size = 1000
+    while True:
+        batch = supabase_admin.table('properties').select(', '.join(INDEX_FIELDS)) \
+            .order('id').range(len(listings), len(listings) + page_size - 1).execute()
+        listings.extend(batch.data)
+        if len(batch.data) < page_size:
+            break
+    duplicate_index = duplicate_indexes.current()
+    duplicate_index.rebuild(listings)
+    logger.info(f"Duplicate index for {campuses.current()} loaded {len(duplicate_index)} listings")
+
+TRENDING_SOURCES = (('unlocks', 'unlocked_at', 'unlock'), ('inspections', 'created_at', 'inspection'))
+
+def load_trending_events(source: tuple, since: list) -> list:
+    """Events after the [timestamp, id] position `since`, advancing the table's watermark."""
+    table, column, kind = source
+    rows = []
+    page_size = 1000
+    cursor = since
+    while True:
+        # Scores are per listing id, so every campus in the database is read in one pass
+        query = supabase_admin.table(table, scoped=False).select(f'id, property_id, {column}') \
+            .order(column).order('id').limit(page_size)
+        batch = after_keyset(query, column, cursor).execute()
+        rows.extend(batch.data)
+        if batch.data:
+            cursor = [batch.data[-1][column], batch.data[-1]['id']]
+        if len(batch.data) < page_size:
+            break
+    trending_watermarks[(campuses.current(), table)] = cursor
+    return [(row['property_id'], kind, timestamp(row[column]), 1) for row in rows]
+
+def load_view_days(since: str) -> list:
+    rows = []
+    page_size = 1000
+    while True:
+        batch = supabase_admin.table('property_view_days').select('property_id, day, views').gte('day', since) \
+            .order('day').order('property_id').range(len(rows), len(rows) + page_size - 1).execute()
+        rows.extend(batch.data)
+        if len(batch.data) < page_size:
+            break
+    return rows
+
+def refresh_trending():
+    # Incremental between periodic full rebuilds, which also drop deleted events
+    now = time.time()
+    rebuild = now - trending.rebuilt_at >= TRENDING_REBUILD_SECONDS
+    window_start = datetime.fromtimestamp(now, timezone.utc) - timedelta(days=TRENDING_WINDOW_DAYS)
+    if rebuild:
+        trending_watermarks.clear()
+    # Daily view buckets are small; updates only need the two that can still grow
+    view_since = window_start if rebuild else datetime.fromtimestamp(now, timezone.utc) - timedelta(days=1)
+    events, view_days = [], []
+    # One ranker for every campus: rank() only orders the rows of the feed it is given
+    for campus in supabase_admin.database_campuses():
+        with campuses.use(campus):
+            for source in TRENDING_SOURCES:
+                events += load_trending_events(
+                    source, trending_watermarks.get((campus, source[0]), [window_start.isoformat(), None]))
+            view_days += load_view_days(view_since.date().isoformat())
+    if rebuild:
+        trending.rebuild(events, view_days, now)
+        logger.info(f"Trending ranking rebuilt with {len(trending)} listings")
+    else:
+        trending.update(events, view_days, now)
+
+def refresh_catalogue_snapshot():
+    """Apply approved-feed changes since the snapshot's cursor, rewriting the file only if there were any."""
+    snapshot = catalogue_snapshots[campuses.current()]
+    cursor = snapshot.cursor
+    if cursor and datetime.fromisoformat(cursor[0]) < datetime.now(timezone.utc) - timedelta(days=SYNC_TOMBSTONE_DAYS):
+        # Removals this old are purged, so start again from a full sync
+        cursor = None
+    full = cursor is None
+    upserts, removals = {}, set()
+    while True:
+        changes = supabase_admin.rpc('property_changes', {
+            "p_since": cursor[0] if cursor else None,
+            "p_after_id": cursor[1] if cursor else None,
+            "p_limit": SYNC_PAGE_SIZE,
+            "p_campus": campuses.current()
+        }).execute().data
+        for row in changes['upserts']:
+            upserts[row['id']] = row
+            removals.discard(row['id'])
+        for property_id in changes['removals']:
+            upserts.pop(property_id, None)
+            removals.add(property_id)
+        cursor = sync_cursor(changes)
+        if not changes['has_more']:
+            break
+    
+    if not full and not upserts and not removals:
+        snapshot.mark_current(cursor)
+        return
+    listings = {} if full else {p['id']: p for p in snapshot.listings() if p['id'] not in removals}
+    listings.update(upserts)
+    snapshot.write(sorted(listings.values(), key=lambda p: p.get('created_at') or '', reverse=True), cursor)
+    logger.info(f"Catalogue snapshot for {campuses.current()} written with {len(listings)} listings")
+
+def revalidate_snapshot():
+    """Refresh the current campus's snapshot in the background after serving from it."""
+    campus = campuses.current()
+    task = snapshot_refreshes.get(campus)
+    if campus not in catalogue_snapshots or (task and not task.done()):
+        return
+    
+    async def revalidate():
+        try:
+            await asyncio.to_thread(refresh_catalogue_snapshot)
+        except Exception as e:
+            logger.warning(f"Catalogue snapshot revalidation for {campus} failed: {e!r}")
+    
+    snapshot_refreshes[campus] = asyncio.create_task(revalidate())
+
+def load_catalogue_snapshots():
+    for campus, snapshot in catalogue_snapshots.items():
+        if snapshot.load():
+            logger.info(f"Loaded catalogue snapshot for {campus} with {len(snapshot)} listings, "
+                        f"{int(snapshot.age())}s old")
+
+def archive_payment_history():
+    # Also creates the partitions for the coming months
+    archived = supabase_admin.rpc('archive_payment_partitions', {
+        "p_retention_months": PAYMENT_RETENTION_MONTHS
+    }).execute().data
+    if archived:
+        logger.info(f"Archived {archived} monthly payment partitions")
+
+def purge_tombstones():
+    cutoff = datetime.now(timezone.utc) - timedelta(days=SYNC_TOMBSTONE_DAYS)
+    supabase_admin.table('property_tombstones').delete().lt('removed_at', cutoff.isoformat()).execute()
+
+def claim_notifications(limit: int) -> List[dict]:
+    return supabase_admin.rpc('claim_notifications', {"p_limit": limit}).execute().data or []
+
+def finish_notifications(sent: List[int], retry: List[int], release: List[int], error: Optional[str]):
+    supabase_admin.rpc('finish_notifications', {
+        "p_sent": sent, "p_retry": retry, "p_release": release,
+        "p_error": error, "p_max_attempts": NOTIFY_MAX_ATTEMPTS
+    }).execute()
+
+notification_dispatcher = NotificationDispatcher(
+    notification_transport, claim_notifications, finish_notifications, FROM_EMAIL,
+    batch_size=NOTIFY_BATCH_SIZE, rate_per_minute=NOTIFY_RATE_PER_MINUTE
+)
+
+def dispatch_notifications():
+    # Keep claiming while full batches come back and the rate limit isn't holding rows back
+    while True:
+        stats = notification_dispatcher.run_once()
+        if stats['sent'] or stats['failed']:
+            logger.info(f"Notification dispatch: {stats}")
+        if stats['rows'] < NOTIFY_BATCH_SIZE or stats['deferred']:
+            return
+
+def purge_notifications():
+    cutoff = datetime.now(timezone.utc) - timedelta(days=NOTIFY_RETENTION_DAYS)
+    supabase_admin.table('notification_outbox').delete().in_('status', ['sent', 'failed']) \
+        .lt('created_at', cutoff.isoformat()).execute()
+
+def write_view_counts(counts: dict):
+    rows = [{"property_id": property_id, "views": views} for property_id, views in counts.items()]
+    supabase_admin.rpc('record_property_views', {"p_rows": rows}).execute()
+
+async def flush_view_counts():
+    for campus, view_counter in list(view_counters.items()):
+        with campuses.use(campus):
+            try:
+                flushed = await view_counter.flush(write_view_counts)
+                if flushed:
+                    logger.info(f"Flushed {flushed} listing views for {campus}")
+            except Exception as e:
+                # Counts stay buffered for the next attempt; only a failure at shutdown loses them
+                logger.error(f"View count flush for {campus} failed, {view_counter.pending} views pending: {e}")
+
+def reload_saved_searches():
+    # Picks up searches created or deleted on other workers since the last load
+    searches = []
+    page_size = 1000
+    while True:
+        batch = supabase_admin.table('saved_searches').select(', '.join(SEARCH_FIELDS)) \
+            .order('id').range(len(searches), len(searches) + page_size - 1).execute()
+        searches.extend(batch.data)
+        if len(batch.data) < page_size:
+            break
+    search_matcher = search_matchers.current()
+    search_matcher.rebuild(searches)
+    logger.info(f"Saved search matcher for {campuses.current()} loaded {len(search_matcher)} searches")
+
+def run_inspection_scheduler():
+    today = datetime.now(timezone.utc).date().isoformat()
+    
+    # Paid inspections that neither the scheduler nor an admin has placed yet
+    inspections = []
+    page_size = 1000
+    while True:
+        batch = supabase_admin.table('inspections').select('id, agent_id, inspection_date, created_at') \
+            .eq('payment_status', 'completed').in_('status', ['pending', 'assigned']) \
+            .is_('scheduled_at', 'null').gte('inspection_date', today) \
+            .order('inspection_date').order('id').range(len(inspections), len(inspections) + page_size - 1).execute()
+        inspections.extend(batch.data)
+        if len(batch.data) < page_size:
+            break
+    
+    if not inspections:
+        return {"assigned": 0, "unassigned": 0}
+    
+    # Every active agent listing on this campus, including idle ones that can take overflow
+    agents_result = supabase_admin.rpc('campus_agents', {"p_campus": campuses.current()}).execute()
+    agents = {a['id']: a['full_name'] for a in agents_result.data}
+    
+    # Per-agent per-day counts for the whole window in one grouped, indexed query
+    last_day = max(i['inspection_date'] for i in inspections)
+    load_result = supabase_admin.rpc('agent_inspection_load', {"p_from": today, "p_to": last_day}).execute()
+    load = {(r['agent_id'], r['inspection_date']): r['total'] for r in load_result.data}
+    
+    assignments, unassigned = plan_assignments(inspections, agents, load, INSPECTION_DAILY_CAP)
+    if assignments:
+        supabase_admin.rpc('assign_inspections', {"assignments": assignments}).execute()
+    
+    if unassigned:
+        logger.warning(f"Inspection scheduler could not place {len(unassigned)} inspections")
+    return {"assigned": len(assignments), "unassigned": len(unassigned)}
+
+async def reconcile_pending_payments():
+    """Settle or close payments left pending because their webhook never arrived."""
+    now = datetime.now(timezone.utc)
+    stale_before = now - timedelta(minutes=RECONCILE_MIN_AGE_MINUTES)
+    abandon_before = now - timedelta(hours=RECONCILE_ABANDON_HOURS)
+    summary = {"settled": 0, "failed": 0, "expired": 0}
+    
+    for table in ('transactions', 'inspection_transactions'):
+        cursor = None
+        while True:
+            query = supabase_admin.table(table).select('id, reference, created_at').eq('status', 'pending') \
+                .lt('created_at', stale_before.isoformat()).order('created_at').order('id').limit(RECONCILE_PAGE_SIZE)
+            page = (await asyncio.to_thread(after_keyset(query, 'created_at', cursor).execute)).data
+            if not page:
+                break
+            cursor = [page[-1]['created_at'], page[-1]['id']]
+            
+            charges = await verify_many(korapay_client, [row['reference'] for row in page], RECONCILE_CONCURRENCY)
+            failed, expired = [], []
+            for row in page:
+                reference = row['reference']
+                if reference not in charges:
+                    # Lookup errored; leave pending for the next pass
+                    continue
+                outcome = classify(charges[reference])
+                if outcome == SUCCESS:
+                    await asyncio.to_thread(settle_successful_payment, reference, charges[reference].get('payment_reference'))
+                    summary['settled'] += 1
+                elif outcome == FAILED:
+                    failed.append(row)
+                elif datetime.fromisoformat(row['created_at']) < abandon_before:
+                    expired.append(row)
+            
+            if failed:
+                await asyncio.to_thread(close_pending_payments, table, failed, 'failed')
+                summary['failed'] += len(failed)
+            if expired:
+                await asyncio.to_thread(close_pending_payments, table, expired, 'expired')
+                summary['expired'] += len(expired)
+            if len(page) < RECONCILE_PAGE_SIZE:
+                break
+    
+    logger.info(f"Payment reconciliation: {summary}")
+    return summary
+
+def compact_wallet_ledger():
+    folded = supabase_admin.rpc('wallet_compact', {}).execute().data
+    if folded:
+        logger.info(f"Compacted ledger entries into {folded} wallet snapshots")
+
+def across(job, campus_names):
+    """`job` run once for each campus in `campus_names()`, as the current campus.
+
+    Campus jobs (indexes, scheduling) pass every campus; jobs that maintain a
+    whole database (ledgers, payments, outbox) pass one campus per database.
+    """
+    async def run():
+        for campus in campus_names():
+            with campuses.use(campus):
+                try:
+                    if asyncio.iscoroutinefunction(job):
+                        await job()
+                    else:
+                        await asyncio.to_thread(job)
+                except Exception as e:
+                    # One campus failing doesn't hold the others back
+                    logger.error(f"{job.__name__} failed for {campus}: {e}")
+    return run
+
+def every_campus():
+    return campuses.names
+
+async def run_periodic(name: str, job, interval: int):
+    while True:
+        try:
+            if asyncio.iscoroutinefunction(job):
+                await job()
+            else:
+                await asyncio.to_thread(job)
+        except Exception as e:
+            logger.error(f"{name} error: {e}")
+        await asyncio.sleep(interval)
+
+def warm_clients():
+    for client in (supabase, supabase_admin):
+        if client:
+            client.get()
+            for routed in client.databases.values():
+                routed.get()
+
+def start_background_jobs():
+    # Mapping the snapshots only reads their headers, so fallbacks work from the first request
+    load_catalogue_snapshots()
+    # Build clients off the event loop so startup returns immediately
+    background_tasks.append(asyncio.create_task(asyncio.to_thread(warm_clients)))
+    if supabase_admin:
+        databases = supabase_admin.database_campuses
+        background_tasks.append(asyncio.create_task(run_periodic(
+            "Catalogue snapshot", across(refresh_catalogue_snapshot, every_campus), SNAPSHOT_REFRESH_SECONDS)))
+        background_tasks.append(asyncio.create_task(run_periodic(
+            "Similarity index rebuild", across(rebuild_similarity_index, every_campus), SIMILARITY_REBUILD_SECONDS)))
+        background_tasks.append(asyncio.create_task(run_periodic(
+            "Inspection scheduler", across(run_inspection_scheduler, every_campus), INSPECTION_SCHEDULE_SECONDS)))
+        background_tasks.append(asyncio.create_task(run_periodic(
+            "Saved search reload", across(reload_saved_searches, every_campus), SAVED_SEARCH_RELOAD_SECONDS)))
+        background_tasks.append(asyncio.create_task(run_periodic(
+            "Duplicate index reload", across(reload_duplicate_index, every_campus), DUPLICATE_RELOAD_SECONDS)))
+        background_tasks.append(asyncio.create_task(run_periodic(
+            "Wallet ledger compaction", across(compact_wallet_ledger, databases), WALLET_COMPACT_SECONDS)))
+        background_tasks.append(asyncio.create_task(run_periodic(
+            "Payment archival", across(archive_payment_history, databases), PAYMENT_ARCHIVE_SECONDS)))
+        background_tasks.append(asyncio.create_task(run_periodic(
+            "Tombstone purge", across(purge_tombstones, databases), TOMBSTONE_PURGE_SECONDS)))
+        background_tasks.append(asyncio.create_task(run_periodic(
+            "Notification dispatch", across(dispatch_notifications, databases), NOTIFY_DISPATCH_SECONDS)))
+        background_tasks.append(asyncio.create_task(run_periodic(
+            "Notification purge", across(purge_notifications, databases), TOMBSTONE_PURGE_SECONDS)))
+        background_tasks.append(asyncio.create_task(
+            run_periodic("Trending ranking", refresh_trending, TRENDING_UPDATE_SECONDS)))
+        background_tasks.append(asyncio.create_task(
+            run_periodic("View count flush", flush_view_counts, VIEW_FLUSH_SECONDS)))
+        if DATABASE_URL:
+            background_tasks.append(asyncio.create_task(invalidation_bus.run()))
+        for bus in campus_invalidation_buses:
+            background_tasks.append(asyncio.create_task(bus.run()))
+        if db_router.replicas:
+            background_tasks.append(asyncio.create_task(
+                run_periodic("Replica health check", db_router.check_replicas, REPLICA_HEALTH_SECONDS)))
+        if KORALPAY_SECRET:
+            background_tasks.append(asyncio.create_task(run_periodic(
+                "Payment reconciliation", across(reconcile_pending_payments, databases), RECONCILE_SECONDS)))
+
+async def stop_background_jobs():
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+
 # ============== HEALTH CHECK ==============
 
 @api_router.get("/")
 async def root():
     return {"message": "LAUTECH Rentals API", "version": "1.0.0", "database": "Supabase"}
 
+@api_router.get("/campuses")
+async def list_campuses():
+    return {"default": campuses.default, "campuses": campuses.names}
+
 @api_router.get("/health")
 async def health():
-    return {"status": "healthy", "supabase_connected": supabase is not None}
+    return {"status": "healthy", "supabase_connected": supabase_admin.initialized}
+
+def check_database():
+    supabase_admin.table('properties').select('id').limit(1).execute()
+
+@api_router.get("/health/live")
+async def liveness():
+    # Process is up and serving; says nothing about dependencies
+    return {"status": "alive"}
+
+@api_router.get("/health/ready")
+async def readiness():
+    checks = {
+        "supabase_configured": supabase_admin.configured,
+        "supabase_initialized": supabase_admin.initialized,
+        "database": False
+    }
+    if supabase_admin:
+        try:
+            await asyncio.wait_for(asyncio.to_thread(check_database), READINESS_TIMEOUT_SECONDS)
+            checks['database'] = True
+        except Exception as e:
+            logger.warning(f"Readiness check failed: {e}")
+    
+    ready = checks['supabase_configured'] and checks['database']
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "not_ready", "checks": checks}
+    )
+
+# ============== REQUEST PROFILING (ADMIN) ==============
+
+async def authorize_profiling(headers) -> bool:
+    scheme, _, token = headers.get('authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not token:
+        return False
+    try:
+        user = await get_current_user(HTTPAuthorizationCredentials(scheme=scheme, credentials=token))
+    except HTTPException:
+        return False
+    return user['role'] == 'admin'
+
+@api_router.get("/admin/profiles")
+async def list_profiles(user: dict = Depends(get_current_user)):
+    await require_role(user, ['admin'])
+    # Profiles live in this worker's memory only
+    return [profile.summary() for profile in reversed(profiler.profiles)]
+
+@api_router.get("/admin/profiles/{profile_id}")
+async def download_profile(profile_id: str, format: str = 'speedscope', user: dict = Depends(get_current_user)):
+    await require_role(user, ['admin'])
+    
+    profile = profiler.get(profile_id)
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    
+    if format == 'speedscope':
+        return Response(
+            json.dumps(profile.to_speedscope()), media_type='application/json',
+            headers={"Content-Disposition": f'attachment; filename="{profile_id}.speedscope.json"'}
+        )
+    if format == 'pstats':
+        return Response(
+            profile.to_pstats(), media_type='application/octet-stream',
+            headers={"Content-Disposition": f'attachment; filename="{profile_id}.prof"'}
+        )
+    raise HTTPException(status_code=400, detail="format must be 'speedscope' or 'pstats'")
+
+# Registered before read_your_writes below, so it runs inside that middleware in the route's own task
+app.add_middleware(ProfilingMiddleware, profiler=profiler, authorize=authorize_profiling, sample_rate=PROFILE_SAMPLE_RATE)
+
+# ============== READ ROUTING ==============
+
+@app.middleware("http")
+async def read_your_writes(request: Request, call_next):
+    # A recent write by this client pins its reads to the primary, whichever worker serves them
+    try:
+        primary_until = float(request.cookies.get(READ_YOUR_WRITES_COOKIE, 0))
+    except ValueError:
+        primary_until = 0.0
+    state = db_router.begin_request(primary_until)
+    response = await call_next(request)
+    if state['wrote'] and db_router.replicas:
+        response.set_cookie(
+            READ_YOUR_WRITES_COOKIE, str(time.time() + READ_YOUR_WRITES_SECONDS),
+            max_age=int(READ_YOUR_WRITES_SECONDS) + 1, httponly=True, samesite='lax'
+        )
+    return response
+
+# ============== CAMPUS ==============
+
+# Added after read_your_writes, so it wraps it and the campus is set for everything inside
+@app.middleware("http")
+async def campus_context(request: Request, call_next):
+    # Every query the request makes is routed to this campus's database and filtered to it
+    campus = campuses.resolve(request.headers.get(CAMPUS_HEADER) or request.query_params.get('campus'))
+    if campus is None:
+        return JSONResponse(status_code=400, content={"detail": "Unknown campus"})
+    with campuses.use(campus):
+        return await call_next(request)
 
 # Include the router
 app.include_router(api_router)
 
+app.add_middleware(CompressionMiddleware, minimum_size=int(os.environ.get('COMPRESSION_MIN_BYTES', '1024')))
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -0,0 +1,180 @@
+"""In-memory "similar listings" index over approved properties.
+
+Each listing becomes one L2-normalized row built from four blocks: log price,
+property type, hashed location tokens and hashed TF-IDF of title/description.
+Cosine similarity against every row is then a single matrix-vector product.
+IDF weights and price scaling are fitted on full rebuilds; incremental upserts
+between rebuilds reuse the last fitted values.
+"""
+import re
+import threading
+import zlib
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = {
+    "a", "an", "and", "are", "at", "for", "in", "is", "it", "near", "of",
+    "on", "or", "the", "to", "with", "very", "this", "room", "rooms",
+}
+
+TYPE_DIM = 8
+LOCATION_DIM = 128
+TEXT_DIM = 512
+
+# Relative weight of each block in the final vector
+PRICE_WEIGHT = 0.6
+TYPE_WEIGHT = 0.5
+LOCATION_WEIGHT = 0.8
+TEXT_WEIGHT = 1.0
+
+# Listing fields kept in memory and served by the similar-listings endpoint
+SUMMARY_FIELDS = (
+    "id", "title", "price", "location", "property_type", "images",
+    "latitude", "longitude", "created_at",
+)
+
+
+def _tokens(text: Optional[str]) -> List[str]:
+    return [t for t in _TOKEN_RE.findall((text or "").lower()) if len(t) > 1 and t not in _STOPWORDS]
+
+
+def _bucket(token: str, dim: int) -> int:
+    return zlib.crc32(token.encode()) % dim
+
+
+def _hashed_counts(tokens: Iterable[str], dim: int) -> np.ndarray:
+    vec = np.zeros(dim, dtype=np.float32)
+    for token in tokens:
+        vec[_bucket(token, dim)] += 1.0
+    return vec
+
+
+def _unit(vec: np.ndarray) -> np.ndarray:
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else vec
+
+
+class SimilarityIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._summaries: Dict[str, dict] = {}
+        self._matrix = np.zeros((0, self.dim), dtype=np.float32)
+        self._idf = np.ones(TEXT_DIM, dtype=np.float32)
+        self._price_mean = 0.0
+        self._price_std = 1.0
+        # Upserts that arrive while a rebuild is running, replayed after the swap
+        self._pending: Optional[List[dict]] = None
+
+    @property
+    def dim(self) -> int:
+        return 1 + TYPE_DIM + LOCATION_DIM + TEXT_DIM
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def _vector(self, listing: dict, idf: np.ndarray, price_mean: float, price_std: float) -> np.ndarray:
+        price = np.float32((np.log1p(max(listing.get("price") or 0, 0)) - price_mean) / price_std)
+        type_block = _hashed_counts([listing.get("property_type") or ""], TYPE_DIM)
+        location_block = np.minimum(_hashed_counts(_tokens(listing.get("location")), LOCATION_DIM), 1.0)
+        text = f"{listing.get('title') or ''} {listing.get('description') or ''}"
+        text_block = np.log1p(_hashed_counts(_tokens(text), TEXT_DIM)) * idf
+        vec = np.concatenate([
+            np.array([PRICE_WEIGHT * np.tanh(price)], dtype=np.float32),
+            TYPE_WEIGHT * _unit(type_block),
+            LOCATION_WEIGHT * _unit(location_block),
+            TEXT_WEIGHT * _unit(text_block),
+        ])
+        return _unit(vec).astype(np.float32)
+
+    def rebuild(self, listings: List[dict]) -> None:
+        """Refit IDF and price scaling on all approved listings and swap the index in."""
+        with self._lock:
+            self._pending = []
+        listings = [l for l in listings if l.get("status", "approved") == "approved"]
+
+        n = len(listings)
+        if n:
+            doc_freq = np.zeros(TEXT_DIM, dtype=np.float32)
+            for listing in listings:
+                text = f"{listing.get('title') or ''} {listing.get('description') or ''}"
+                doc_freq[list({_bucket(t, TEXT_DIM) for t in _tokens(text)})] += 1.0
+            idf = (np.log((1.0 + n) / (1.0 + doc_freq)) + 1.0).astype(np.float32)
+            log_prices = np.log1p(np.array([max(l.get("price") or 0, 0) for l in listings], dtype=np.float64))
+            price_mean = float(log_prices.mean())
+            price_std = float(log_prices.std()) or 1.0
+        else:
+            idf = np.ones(TEXT_DIM, dtype=np.float32)
+            price_mean, price_std = 0.0, 1.0
+
+        matrix = np.zeros((n, self.dim), dtype=np.float32)
+        for row, listing in enumerate(listings):
+            matrix[row] = self._vector(listing, idf, price_mean, price_std)
+
+        with self._lock:
+            self._ids = [l["id"] for l in listings]
+            self._rows = {pid: row for row, pid in enumerate(self._ids)}
+            self._summaries = {l["id"]: {k: l.get(k) for k in SUMMARY_FIELDS} for l in listings}
+            self._matrix = matrix
+            self._idf, self._price_mean, self._price_std = idf, price_mean, price_std
+            pending, self._pending = self._pending, None
+            for listing in pending:
+                self._upsert_locked(listing)
+
+    def upsert(self, listing: dict) -> None:
+        """Add or refresh one listing; non-approved listings are dropped from the index."""
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append(listing)
+            self._upsert_locked(listing)
+
+    def remove(self, property_id: str) -> None:
+        self.upsert({"id": property_id, "status": "deleted"})
+
+    def _upsert_locked(self, listing: dict) -> None:
+        pid = listing["id"]
+        row = self._rows.get(pid)
+        if listing.get("status") != "approved":
+            if row is None:
+                return
+            # Move the last row into the hole so the matrix stays dense
+            last = len(self._ids) - 1
+            last_id = self._ids[last]
+            self._matrix[row] = self._matrix[last]
+            self._ids[row] = last_id
+            self._rows[last_id] = row
+            self._ids.pop()
+            del self._rows[pid]
+            del self._summaries[pid]
+            self._matrix = self._matrix[:last]
+            return
+
+        vec = self._vector(listing, self._idf, self._price_mean, self._price_std)
+        if row is None:
+            self._rows[pid] = len(self._ids)
+            self._ids.append(pid)
+            self._matrix = np.vstack([self._matrix, vec[None, :]])
+        else:
+            self._matrix[row] = vec
+        self._summaries[pid] = {k: listing.get(k) for k in SUMMARY_FIELDS}
+
+    def similar(self, property_id: str, k: int = 6) -> Optional[List[dict]]:
+        """Top-k most similar approved listings, or None if the listing isn't indexed."""
+        with self._lock:
+            row = self._rows.get(property_id)
+            if row is None:
+                return None
+            scores = self._matrix @ self._matrix[row]
+            scores[row] = -np.inf
+            k = min(k, len(scores) - 1)
+            if k <= 0:
+                return []
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [
+                {**self._summaries[self._ids[i]], "similarity": round(float(scores[i]), 4)}
+                for i in top
+            ]
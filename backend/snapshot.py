@@ -0,0 +1,127 @@
+"""On-disk snapshot of a campus's approved catalogue, for when the database can't answer.
+
+The file is one JSON header line followed by the feed body: the listings as
+a compact JSON array in feed order (newest first), byte-for-byte what GET
+/properties returns. The header holds the sync cursor the snapshot is
+current to and each listing's byte range in the body, so the unfiltered
+feed is a single slice of the memory-mapped file and one listing is a
+slice plus one small `json.loads`. Loading parses only the header, whose
+index has one short entry per listing; the listings themselves are not
+decoded until a request needs them.
+
+The server still asks the database first, including at cold start, and
+answers from the snapshot only when that query fails or exceeds its
+latency budget.
+
+Writes go to a temporary file that replaces the old one atomically; readers
+holding the previous mapping keep a consistent view until they drop it.
+"""
+import json
+import logging
+import mmap
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+
+
+class _Mapped:
+    """One immutable mapping of a snapshot file."""
+
+    def __init__(self, path: Path):
+        with open(path, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        newline = self.data.find(b"\n")
+        header = json.loads(self.data[:newline])
+        if header.get("version") != FORMAT_VERSION:
+            raise ValueError(f"unsupported snapshot version {header.get('version')}")
+        self.taken_at: float = header["taken_at"]
+        self.cursor: Optional[list] = header["cursor"]
+        self.body_start = newline + 1
+        # property id -> (start, end) within the body
+        self.index: Dict[str, Tuple[int, int]] = {key: tuple(span) for key, span in header["index"].items()}
+
+
+class CatalogueSnapshot:
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._mapped: Optional[_Mapped] = None
+        # Cursor and time of the last refresh that confirmed the snapshot is current,
+        # which moves on without rewriting the file when nothing changed
+        self.cursor: Optional[list] = None
+        self.current_at = 0.0
+
+    @property
+    def loaded(self) -> bool:
+        return self._mapped is not None
+
+    def __len__(self) -> int:
+        mapped = self._mapped
+        return len(mapped.index) if mapped else 0
+
+    def age(self, now: Optional[float] = None) -> float:
+        """Seconds since the snapshot was last known to match the database."""
+        return max(0.0, (now or time.time()) - self.current_at)
+
+    def load(self) -> bool:
+        """Map the snapshot file if there is a readable one; False leaves the snapshot empty."""
+        try:
+            mapped = _Mapped(self.path)
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable catalogue snapshot {self.path}: {e}")
+            return False
+        self._mapped = mapped
+        self.cursor = mapped.cursor
+        self.current_at = mapped.taken_at
+        return True
+
+    def feed_body(self) -> Optional[bytes]:
+        mapped = self._mapped
+        return mapped.data[mapped.body_start:] if mapped else None
+
+    def listings(self) -> List[dict]:
+        body = self.feed_body()
+        return json.loads(body) if body else []
+
+    def get(self, property_id: str) -> Optional[dict]:
+        mapped = self._mapped
+        span = mapped.index.get(property_id) if mapped else None
+        if span is None:
+            return None
+        return json.loads(mapped.data[mapped.body_start + span[0]:mapped.body_start + span[1]])
+
+    def mark_current(self, cursor: list) -> None:
+        self.cursor = cursor
+        self.current_at = time.time()
+
+    def write(self, listings: List[dict], cursor: Optional[list]) -> None:
+        """Replace the snapshot with `listings`, already in feed order, and map the new file."""
+        taken_at = time.time()
+        index, parts, offset = {}, [], 1
+        for listing in listings:
+            part = json.dumps(listing, separators=(",", ":")).encode()
+            index[listing["id"]] = (offset, offset + len(part))
+            parts.append(part)
+            offset += len(part) + 1
+        header = json.dumps({"version": FORMAT_VERSION, "taken_at": taken_at, "cursor": cursor, "index": index},
+                            separators=(",", ":")).encode()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.path.parent, prefix=f".{self.path.name}.")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(header + b"\n[" + b",".join(parts) + b"]")
+            os.replace(tmp, self.path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        self._mapped = _Mapped(self.path)
+        self.cursor = cursor
+        self.current_at = taken_at
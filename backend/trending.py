@@ -0,0 +1,132 @@
+"""Time-decayed "trending" ranking of listings.
+
+A listing's score is the sum over its recent events (unlocks, inspection
+bookings, views) of weight * 2 ** (-age / half_life). Because the decay is
+exponential, scores can be advanced in place: every update multiplies the
+whole score vector by the decay since the last one and adds the new events,
+all as NumPy array operations. A full rebuild from the event tables every
+so often corrects for rows that arrived late or were deleted.
+
+After each update the ranking is materialized once as an id -> position
+map, so ordering a result set costs a dict lookup per row.
+"""
+import math
+import threading
+import time
+from datetime import date, datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+WEIGHTS = {"unlock": 5.0, "inspection": 8.0, "view": 1.0}
+# Scores below this are dropped at rebuild so long-dead listings don't accumulate
+MIN_SCORE = 1e-3
+
+# (property_id, kind, unix timestamp, count)
+Event = Tuple[str, str, float, float]
+
+
+def timestamp(value: str) -> float:
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+class TrendingRanker:
+    def __init__(self, half_life_hours: float = 48, weights: Optional[Dict[str, float]] = None):
+        self.half_life_hours = half_life_hours
+        self.decay_rate = math.log(2) / (half_life_hours * 3600)
+        self.weights = weights or WEIGHTS
+        self._lock = threading.Lock()
+        self._slots: Dict[str, int] = {}
+        self._ids: List[str] = []
+        self._scores = np.zeros(0)
+        self._as_of: Optional[float] = None
+        # Last seen total per (property_id, day) view bucket, so updates only add the growth
+        self._view_totals: Dict[Tuple[str, str], int] = {}
+        self._positions: Dict[str, int] = {}
+        self.rebuilt_at = 0.0
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def rebuild(self, events: Iterable[Event], view_days: Iterable[dict] = (), now: Optional[float] = None) -> None:
+        now = time.time() if now is None else now
+        fresh = TrendingRanker(self.half_life_hours, self.weights)
+        fresh._add(list(events) + fresh._view_events(view_days, now, rebuild=True), now)
+        keep = fresh._scores >= MIN_SCORE
+        fresh._ids = [property_id for property_id, kept in zip(fresh._ids, keep) if kept]
+        fresh._slots = {property_id: slot for slot, property_id in enumerate(fresh._ids)}
+        fresh._scores = fresh._scores[keep]
+        with self._lock:
+            self._slots, self._ids, self._scores = fresh._slots, fresh._ids, fresh._scores
+            self._view_totals, self._as_of = fresh._view_totals, now
+            self._publish()
+            self.rebuilt_at = now
+
+    def update(self, events: Iterable[Event], view_days: Iterable[dict] = (), now: Optional[float] = None) -> None:
+        now = time.time() if now is None else now
+        with self._lock:
+            if self._as_of is not None and now > self._as_of:
+                self._scores *= math.exp(-self.decay_rate * (now - self._as_of))
+            self._as_of = max(now, self._as_of or now)
+            self._add(list(events) + self._view_events(view_days, now), now)
+            self._publish()
+
+    def _view_events(self, view_days: Iterable[dict], now: float, rebuild: bool = False) -> List[Event]:
+        """Turn daily view buckets into events for the views added since they were last read."""
+        today = datetime.fromtimestamp(now, timezone.utc).date().isoformat()
+        events = []
+        for row in view_days:
+            key = (row["property_id"], row["day"])
+            added = row["views"] - self._view_totals.get(key, 0)
+            self._view_totals[key] = row["views"]
+            if added > 0:
+                # Bucket growth seen on an update happened since the last one; at rebuild, a
+                # past day's views are dated to its midday
+                if rebuild and row["day"] != today:
+                    day = date.fromisoformat(row["day"])
+                    at = datetime(day.year, day.month, day.day, 12, tzinfo=timezone.utc).timestamp()
+                else:
+                    at = now
+                events.append((row["property_id"], "view", at, added))
+        # Only today's and yesterday's buckets can still grow
+        for key in [key for key in self._view_totals if key[1] < self._yesterday(now)]:
+            del self._view_totals[key]
+        return events
+
+    @staticmethod
+    def _yesterday(now: float) -> str:
+        return datetime.fromtimestamp(now - 86400, timezone.utc).date().isoformat()
+
+    def _add(self, events: List[Event], now: float) -> None:
+        if not events:
+            return
+        for property_id, *_ in events:
+            if property_id not in self._slots:
+                self._slots[property_id] = len(self._ids)
+                self._ids.append(property_id)
+        if len(self._ids) > len(self._scores):
+            grown = np.zeros(max(len(self._ids), 2 * len(self._scores)))
+            grown[:len(self._scores)] = self._scores
+            self._scores = grown
+        slots = np.fromiter((self._slots[e[0]] for e in events), dtype=np.int64, count=len(events))
+        weights = np.fromiter((self.weights[e[1]] * e[3] for e in events), dtype=np.float64, count=len(events))
+        ages = np.maximum(now - np.fromiter((e[2] for e in events), dtype=np.float64, count=len(events)), 0)
+        np.add.at(self._scores, slots, weights * np.exp(-self.decay_rate * ages))
+
+    def _publish(self) -> None:
+        scores = self._scores[:len(self._ids)]
+        order = np.argsort(-scores, kind="stable")
+        # Replaced wholesale, never mutated, so readers need no lock
+        self._positions = {self._ids[slot]: position for position, slot in enumerate(order.tolist()) if scores[slot] > 0}
+
+    def scores(self, now: Optional[float] = None) -> Dict[str, float]:
+        now = time.time() if now is None else now
+        with self._lock:
+            factor = math.exp(-self.decay_rate * max(now - (self._as_of or now), 0))
+            return {property_id: float(self._scores[slot]) * factor for property_id, slot in self._slots.items()}
+
+    def rank(self, rows: List[dict]) -> List[dict]:
+        """`rows` by trending position; listings without recent activity keep their order at the end."""
+        positions = self._positions
+        unranked = len(positions)
+        return sorted(rows, key=lambda row: positions.get(row["id"], unranked))
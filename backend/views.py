@@ -0,0 +1,110 @@
+"""Listing view counters that cost no database write per view.
+
+Each worker tallies views in a plain dict. Handlers call `record()` on the
+event loop without awaiting in between, so increments never interleave and
+need no lock. A periodic job swaps the dict out and writes it as one batched
+upsert; if that write fails the counts are merged back for the next flush,
+and the last flush runs at shutdown.
+
+Repeat views of a listing by the same viewer are dropped with two Bloom
+filters: `current` collects keys seen since the last rotation and `previous`
+the window before it. A repeat within `window` seconds is always caught and
+one up to 2 * `window` apart may be. False positives only ever drop a real
+view, at roughly `error_rate`. Each filter takes about
+-capacity * ln(error_rate) / ln(2)^2 bits (~120 KB for 100k viewer/listing
+pairs at 1%), and `current` rotates early once it holds `capacity` keys.
+"""
+import asyncio
+import hashlib
+import math
+import time
+from typing import Callable, Dict
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.size = max(64, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        # Kirsch-Mitzenmacher: k positions from two halves of one digest
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(key))
+
+    def add(self, key: str) -> bool:
+        """Add `key`; True if it was (probably) already present."""
+        present = True
+        for p in self._positions(key):
+            mask = 1 << (p & 7)
+            if not self.bits[p >> 3] & mask:
+                present = False
+                self.bits[p >> 3] |= mask
+        if not present:
+            self.count += 1
+        return present
+
+
+class ViewCounter:
+    def __init__(self, window: float = 1800, capacity: int = 100_000, error_rate: float = 0.01,
+                 clock: Callable[[], float] = time.monotonic):
+        self.window = window
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.clock = clock
+        self._counts: Dict[str, int] = {}
+        self._current = BloomFilter(capacity, error_rate)
+        self._previous = BloomFilter(capacity, error_rate)
+        self._rotated_at = clock()
+
+    @property
+    def pending(self) -> int:
+        return sum(self._counts.values())
+
+    def _maybe_rotate(self) -> None:
+        now = self.clock()
+        if now - self._rotated_at >= 2 * self.window:
+            # Idle for two windows: nothing remembered is recent enough to matter
+            self._previous = BloomFilter(self.capacity, self.error_rate)
+        elif now - self._rotated_at < self.window and self._current.count < self.capacity:
+            return
+        else:
+            self._previous = self._current
+        self._current = BloomFilter(self.capacity, self.error_rate)
+        self._rotated_at = now
+
+    def record(self, property_id: str, viewer: str) -> bool:
+        """Count a view unless `viewer` already viewed `property_id` recently."""
+        self._maybe_rotate()
+        key = f"{viewer}:{property_id}"
+        if key in self._previous or self._current.add(key):
+            return False
+        self._counts[property_id] = self._counts.get(property_id, 0) + 1
+        return True
+
+    def drain(self) -> Dict[str, int]:
+        counts, self._counts = self._counts, {}
+        return counts
+
+    def restore(self, counts: Dict[str, int]) -> None:
+        for property_id, views in counts.items():
+            self._counts[property_id] = self._counts.get(property_id, 0) + views
+
+    async def flush(self, write: Callable[[Dict[str, int]], None]) -> int:
+        """Hand pending counts to `write` (run in a thread); they are kept if it raises."""
+        counts = self.drain()
+        if not counts:
+            return 0
+        try:
+            await asyncio.to_thread(write, counts)
+        except BaseException:
+            self.restore(counts)
+            raise
+        return sum(counts.values())
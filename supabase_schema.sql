@@ -141,6 +141,9 @@ $$ LANGUAGE sql SECURITY DEFINER STABLE;
 -- AUTO-CREATE PROFILE TRIGGER
 -- ============================================
 
+-- The only place profiles and wallets are created: sign-up and admin provisioning make the
+-- auth call and nothing else. The role comes from app metadata, which only the service
+-- role can set (user metadata is client-controlled), and can't grant admin.
 CREATE OR REPLACE FUNCTION public.handle_new_user()
 RETURNS TRIGGER AS $$
 BEGIN
@@ -148,9 +151,12 @@ BEGIN
     VALUES (
         NEW.id, NEW.email,
         COALESCE(NEW.raw_user_meta_data->>'full_name', split_part(NEW.email, '@', 1)),
-        'user', false
-    );
-    INSERT INTO public.wallets (user_id, token_balance) VALUES (NEW.id, 0);
+        CASE WHEN NEW.raw_app_meta_data->>'role' = 'agent' THEN 'agent' ELSE 'user' END,
+        false
+    )
+    ON CONFLICT (id) DO NOTHING;
+    INSERT INTO public.wallets (user_id, token_balance) VALUES (NEW.id, 0)
+    ON CONFLICT (user_id) DO NOTHING;
     RETURN NEW;
 END;
 $$ LANGUAGE plpgsql SECURITY DEFINER;
@@ -221,6 +227,1515 @@ CREATE POLICY "verification_select_admin" ON public.agent_verification_requests
 CREATE POLICY "verification_insert_own" ON public.agent_verification_requests FOR INSERT WITH CHECK (auth.uid() = user_id);
 CREATE POLICY "verification_update_admin" ON public.agent_verification_requests FOR UPDATE USING (public.is_admin());
 
+-- ============================================
+-- GEOSPATIAL (distance to campus)
+-- ============================================
+
+CREATE EXTENSION IF NOT EXISTS cube;
+CREATE EXTENSION IF NOT EXISTS earthdistance;
+
+ALTER TABLE public.properties ADD COLUMN IF NOT EXISTS latitude DOUBLE PRECISION;
+ALTER TABLE public.properties ADD COLUMN IF NOT EXISTS longitude DOUBLE PRECISION;
+
+CREATE INDEX IF NOT EXISTS idx_properties_earth ON public.properties
+    USING gist (ll_to_earth(latitude, longitude))
+    WHERE latitude IS NOT NULL AND longitude IS NOT NULL;
+
+-- Listings sorted by distance from a point, optionally within radius_m metres.
+-- earth_box prunes through the GiST index; <-> gives index-ordered KNN.
+CREATE OR REPLACE FUNCTION public.properties_near(
+    lat DOUBLE PRECISION,
+    lng DOUBLE PRECISION,
+    radius_m DOUBLE PRECISION DEFAULT NULL,
+    p_status TEXT DEFAULT 'approved',
+    p_property_type TEXT DEFAULT NULL,
+    p_min_price INTEGER DEFAULT NULL,
+    p_max_price INTEGER DEFAULT NULL
+)
+RETURNS SETOF JSONB AS $$
+    SELECT to_jsonb(p) || jsonb_build_object(
+        'distance_m', round(earth_distance(ll_to_earth(lat, lng), ll_to_earth(p.latitude, p.longitude)))
+    )
+    FROM public.properties p
+    WHERE p.latitude IS NOT NULL AND p.longitude IS NOT NULL
+      AND p.status = p_status
+      AND (p_property_type IS NULL OR p.property_type = p_property_type)
+      AND (p_min_price IS NULL OR p.price >= p_min_price)
+      AND (p_max_price IS NULL OR p.price <= p_max_price)
+      AND (radius_m IS NULL OR (
+          earth_box(ll_to_earth(lat, lng), radius_m) @> ll_to_earth(p.latitude, p.longitude)
+          AND earth_distance(ll_to_earth(lat, lng), ll_to_earth(p.latitude, p.longitude)) <= radius_m
+      ))
+    ORDER BY ll_to_earth(p.latitude, p.longitude) <-> ll_to_earth(lat, lng)
+$$ LANGUAGE sql STABLE;
+
+-- ============================================
+-- INSPECTION SCHEDULER
+-- ============================================
+
+-- Set when the scheduler or an admin places an inspection; NULL means unplaced
+ALTER TABLE public.inspections ADD COLUMN IF NOT EXISTS scheduled_at TIMESTAMPTZ;
+
+CREATE INDEX IF NOT EXISTS idx_inspections_day_load ON public.inspections(inspection_date, agent_id)
+    WHERE status = 'assigned' AND scheduled_at IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_inspections_unscheduled ON public.inspections(inspection_date)
+    WHERE scheduled_at IS NULL AND payment_status = 'completed';
+
+-- Requests still awaiting payment sit with the listing's agent until placed
+CREATE INDEX IF NOT EXISTS idx_inspections_default_load ON public.inspections(inspection_date, agent_id)
+    WHERE scheduled_at IS NULL AND payment_status = 'pending';
+
+-- Counts placed inspections and unpaid ones held by their listing's agent; paid
+-- unplaced ones are the scheduler's own batch and are counted as it plans them
+CREATE OR REPLACE FUNCTION public.agent_inspection_load(p_from DATE, p_to DATE)
+RETURNS TABLE(agent_id UUID, inspection_date DATE, total INTEGER) AS $$
+    SELECT i.agent_id, i.inspection_date, count(*)::int
+    FROM public.inspections i
+    WHERE i.inspection_date BETWEEN p_from AND p_to
+      AND i.agent_id IS NOT NULL
+      AND ((i.status = 'assigned' AND i.scheduled_at IS NOT NULL)
+        OR (i.status IN ('pending', 'assigned') AND i.scheduled_at IS NULL AND i.payment_status = 'pending'))
+    GROUP BY i.agent_id, i.inspection_date
+$$ LANGUAGE sql STABLE;
+
+-- Apply a batch of [{id, agent_id, agent_name}] in one statement
+CREATE OR REPLACE FUNCTION public.assign_inspections(assignments JSONB)
+RETURNS INTEGER AS $$
+    WITH updated AS (
+        UPDATE public.inspections i
+        SET agent_id = a.agent_id, agent_name = a.agent_name, status = 'assigned', scheduled_at = NOW()
+        FROM jsonb_to_recordset(assignments) AS a(id UUID, agent_id UUID, agent_name TEXT)
+        WHERE i.id = a.id AND i.scheduled_at IS NULL
+        RETURNING 1
+    )
+    SELECT count(*)::int FROM updated
+$$ LANGUAGE sql;
+
+-- ============================================
+-- PAYMENT RECONCILIATION
+-- ============================================
+
+-- Abandoned checkouts are closed as 'expired' by the reconciliation job
+ALTER TABLE public.transactions DROP CONSTRAINT IF EXISTS transactions_status_check;
+ALTER TABLE public.transactions ADD CONSTRAINT transactions_status_check
+    CHECK (status IN ('pending', 'completed', 'failed', 'expired'));
+ALTER TABLE public.inspection_transactions DROP CONSTRAINT IF EXISTS inspection_transactions_status_check;
+ALTER TABLE public.inspection_transactions ADD CONSTRAINT inspection_transactions_status_check
+    CHECK (status IN ('pending', 'completed', 'failed', 'expired'));
+
+CREATE INDEX IF NOT EXISTS idx_transactions_pending ON public.transactions(created_at) WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS idx_insp_tx_pending ON public.inspection_transactions(created_at) WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS idx_insp_tx_reference ON public.inspection_transactions(reference);
+CREATE INDEX IF NOT EXISTS idx_inspections_payment_reference ON public.inspections(payment_reference);
+
+-- ============================================
+-- CACHE INVALIDATION (LISTEN/NOTIFY)
+-- ============================================
+
+-- Publishes {"table": ..., "key": ...} so every API worker can evict its cached copy.
+-- TG_ARGV[0] names the column the API caches the table by.
+CREATE OR REPLACE FUNCTION public.notify_cache_invalidation()
+RETURNS TRIGGER AS $$
+DECLARE
+    row_data JSONB;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        row_data := to_jsonb(OLD);
+    ELSE
+        row_data := to_jsonb(NEW);
+    END IF;
+    PERFORM pg_notify('cache_invalidation', json_build_object(
+        'table', TG_TABLE_NAME,
+        'key', row_data ->> TG_ARGV[0]
+    )::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS properties_cache_invalidation ON public.properties;
+CREATE TRIGGER properties_cache_invalidation
+    AFTER INSERT OR UPDATE OR DELETE ON public.properties
+    FOR EACH ROW EXECUTE FUNCTION public.notify_cache_invalidation('id');
+
+DROP TRIGGER IF EXISTS users_cache_invalidation ON public.users;
+CREATE TRIGGER users_cache_invalidation
+    AFTER UPDATE OR DELETE ON public.users
+    FOR EACH ROW EXECUTE FUNCTION public.notify_cache_invalidation('id');
+
+DROP TRIGGER IF EXISTS wallets_cache_invalidation ON public.wallets;
+CREATE TRIGGER wallets_cache_invalidation
+    AFTER INSERT OR UPDATE OR DELETE ON public.wallets
+    FOR EACH ROW EXECUTE FUNCTION public.notify_cache_invalidation('user_id');
+
+-- The API caches each user's set of unlocked property ids
+DROP TRIGGER IF EXISTS unlocks_cache_invalidation ON public.unlocks;
+CREATE TRIGGER unlocks_cache_invalidation
+    AFTER INSERT OR UPDATE OR DELETE ON public.unlocks
+    FOR EACH ROW EXECUTE FUNCTION public.notify_cache_invalidation('user_id');
+
+-- ============================================
+-- AGENT DASHBOARD COUNTERS
+-- ============================================
+
+-- One row per agent, kept current by the triggers below so the dashboard
+-- summary is a single primary-key lookup
+CREATE TABLE IF NOT EXISTS public.agent_stats (
+    agent_id UUID PRIMARY KEY REFERENCES public.users(id) ON DELETE CASCADE,
+    listings_pending INTEGER NOT NULL DEFAULT 0,
+    listings_approved INTEGER NOT NULL DEFAULT 0,
+    listings_rejected INTEGER NOT NULL DEFAULT 0,
+    inspections_completed INTEGER NOT NULL DEFAULT 0,
+    unlocks INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- Upcoming inspections depend on the date, so agent_summary counts them at read time
+ALTER TABLE public.agent_stats DROP COLUMN IF EXISTS inspections_upcoming;
+
+ALTER TABLE public.agent_stats ENABLE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS "agent_stats_select_own" ON public.agent_stats;
+CREATE POLICY "agent_stats_select_own" ON public.agent_stats FOR SELECT USING (auth.uid() = agent_id);
+DROP POLICY IF EXISTS "agent_stats_select_admin" ON public.agent_stats;
+CREATE POLICY "agent_stats_select_admin" ON public.agent_stats FOR SELECT USING (public.is_admin());
+
+CREATE OR REPLACE FUNCTION public.bump_agent_stat(p_agent UUID, p_column TEXT, p_delta INTEGER)
+RETURNS VOID AS $$
+BEGIN
+    IF p_agent IS NULL OR p_column IS NULL OR p_delta = 0 THEN
+        RETURN;
+    END IF;
+    EXECUTE format(
+        'INSERT INTO public.agent_stats (agent_id, %1$I) VALUES ($1, GREATEST($2, 0))
+         ON CONFLICT (agent_id) DO UPDATE
+         SET %1$I = public.agent_stats.%1$I + $2, updated_at = NOW()',
+        p_column
+    ) USING p_agent, p_delta;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+CREATE OR REPLACE FUNCTION public.inspection_stat_column(p_status TEXT)
+RETURNS TEXT AS $$
+    SELECT CASE WHEN p_status = 'completed' THEN 'inspections_completed' END
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION public.track_agent_listing_stats()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM public.bump_agent_stat(OLD.uploaded_by_agent_id, 'listings_' || OLD.status, -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM public.bump_agent_stat(NEW.uploaded_by_agent_id, 'listings_' || NEW.status, 1);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Runs BEFORE the delete so the listing's unlocks are still there to count;
+-- the cascaded unlock deletes then find no property and don't decrement again
+CREATE OR REPLACE FUNCTION public.track_agent_listing_unlocks_removed()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM public.bump_agent_stat(
+        OLD.uploaded_by_agent_id, 'unlocks',
+        -(SELECT count(*)::int FROM public.unlocks WHERE property_id = OLD.id)
+    );
+    RETURN OLD;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+CREATE OR REPLACE FUNCTION public.track_agent_inspection_stats()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM public.bump_agent_stat(OLD.agent_id, public.inspection_stat_column(OLD.status), -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM public.bump_agent_stat(NEW.agent_id, public.inspection_stat_column(NEW.status), 1);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+CREATE OR REPLACE FUNCTION public.track_agent_unlock_stats()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM public.bump_agent_stat(
+            (SELECT uploaded_by_agent_id FROM public.properties WHERE id = NEW.property_id), 'unlocks', 1);
+    ELSE
+        PERFORM public.bump_agent_stat(
+            (SELECT uploaded_by_agent_id FROM public.properties WHERE id = OLD.property_id), 'unlocks', -1);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+DROP TRIGGER IF EXISTS agent_listing_stats ON public.properties;
+CREATE TRIGGER agent_listing_stats
+    AFTER INSERT OR DELETE OR UPDATE OF status, uploaded_by_agent_id ON public.properties
+    FOR EACH ROW EXECUTE FUNCTION public.track_agent_listing_stats();
+
+DROP TRIGGER IF EXISTS agent_listing_unlocks_removed ON public.properties;
+CREATE TRIGGER agent_listing_unlocks_removed
+    BEFORE DELETE ON public.properties
+    FOR EACH ROW EXECUTE FUNCTION public.track_agent_listing_unlocks_removed();
+
+DROP TRIGGER IF EXISTS agent_inspection_stats ON public.inspections;
+CREATE TRIGGER agent_inspection_stats
+    AFTER INSERT OR DELETE OR UPDATE OF status, agent_id ON public.inspections
+    FOR EACH ROW EXECUTE FUNCTION public.track_agent_inspection_stats();
+
+DROP TRIGGER IF EXISTS agent_unlock_stats ON public.unlocks;
+CREATE TRIGGER agent_unlock_stats
+    AFTER INSERT OR DELETE ON public.unlocks
+    FOR EACH ROW EXECUTE FUNCTION public.track_agent_unlock_stats();
+
+-- Backfill/recompute from current data; safe to re-run
+INSERT INTO public.agent_stats (agent_id, listings_pending, listings_approved, listings_rejected,
+                                inspections_completed, unlocks)
+SELECT u.id,
+    (SELECT count(*) FROM public.properties p WHERE p.uploaded_by_agent_id = u.id AND p.status = 'pending'),
+    (SELECT count(*) FROM public.properties p WHERE p.uploaded_by_agent_id = u.id AND p.status = 'approved'),
+    (SELECT count(*) FROM public.properties p WHERE p.uploaded_by_agent_id = u.id AND p.status = 'rejected'),
+    (SELECT count(*) FROM public.inspections i WHERE i.agent_id = u.id AND i.status = 'completed'),
+    (SELECT count(*) FROM public.unlocks ul JOIN public.properties p ON p.id = ul.property_id
+        WHERE p.uploaded_by_agent_id = u.id)
+FROM public.users u
+WHERE u.role IN ('agent', 'admin')
+ON CONFLICT (agent_id) DO UPDATE SET
+    listings_pending = EXCLUDED.listings_pending,
+    listings_approved = EXCLUDED.listings_approved,
+    listings_rejected = EXCLUDED.listings_rejected,
+    inspections_completed = EXCLUDED.inspections_completed,
+    unlocks = EXCLUDED.unlocks,
+    updated_at = NOW();
+
+CREATE INDEX IF NOT EXISTS idx_inspections_agent_upcoming ON public.inspections(agent_id, inspection_date)
+    WHERE status IN ('pending', 'assigned');
+
+-- The agent's counters plus inspections still to come; past-dated ones that were never
+-- completed or cancelled fall out as the date passes. Reads only the agent's future rows.
+CREATE OR REPLACE FUNCTION public.agent_summary(p_agent UUID)
+RETURNS JSONB AS $$
+    SELECT COALESCE(to_jsonb(s), '{}'::jsonb) || jsonb_build_object('inspections_upcoming', (
+        SELECT count(*) FROM public.inspections i
+        WHERE i.agent_id = p_agent AND i.status IN ('pending', 'assigned') AND i.inspection_date >= CURRENT_DATE))
+    FROM (SELECT 1) AS one
+    LEFT JOIN public.agent_stats s ON s.agent_id = p_agent
+$$ LANGUAGE sql STABLE;
+
+-- ============================================
+-- WALLET LEDGER
+-- ============================================
+
+-- Append-only record of every balance change. source_ref is the idempotency
+-- key (payment reference, "unlock:<user>:<property>", ...).
+CREATE TABLE IF NOT EXISTS public.wallet_ledger (
+    id BIGSERIAL PRIMARY KEY,
+    user_id UUID NOT NULL REFERENCES public.users(id) ON DELETE CASCADE,
+    delta INTEGER NOT NULL CHECK (delta <> 0),
+    source_ref TEXT UNIQUE NOT NULL,
+    reason TEXT NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_wallet_ledger_user ON public.wallet_ledger(user_id, id);
+
+ALTER TABLE public.wallet_ledger ENABLE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS "wallet_ledger_select_own" ON public.wallet_ledger;
+CREATE POLICY "wallet_ledger_select_own" ON public.wallet_ledger FOR SELECT USING (auth.uid() = user_id);
+DROP POLICY IF EXISTS "wallet_ledger_select_admin" ON public.wallet_ledger;
+CREATE POLICY "wallet_ledger_select_admin" ON public.wallet_ledger FOR SELECT USING (public.is_admin());
+
+-- wallets.token_balance is the snapshot of all ledger entries up to ledger_seq
+ALTER TABLE public.wallets ADD COLUMN IF NOT EXISTS ledger_seq BIGINT NOT NULL DEFAULT 0;
+
+-- Opening entries for balances that predate the ledger. Only wallets that have never had
+-- a ledger entry qualify: once entries are folded into token_balance, re-running this
+-- would otherwise book the folded total again as an opening balance.
+INSERT INTO public.wallet_ledger (user_id, delta, source_ref, reason)
+SELECT w.user_id, w.token_balance, 'opening:' || w.user_id, 'opening_balance'
+FROM public.wallets w
+WHERE w.token_balance <> 0 AND w.ledger_seq = 0
+  AND NOT EXISTS (SELECT 1 FROM public.wallet_ledger l WHERE l.user_id = w.user_id)
+ON CONFLICT (source_ref) DO NOTHING;
+UPDATE public.wallets w SET ledger_seq = l.id
+FROM public.wallet_ledger l
+WHERE l.source_ref = 'opening:' || w.user_id AND w.ledger_seq < l.id;
+
+-- Fold unsnapshotted entries into the wallet row; caller holds the row lock
+CREATE OR REPLACE FUNCTION public.wallet_fold(p_user UUID)
+RETURNS VOID AS $$
+    UPDATE public.wallets w
+    SET token_balance = w.token_balance + d.total, ledger_seq = d.last_id
+    FROM (
+        SELECT sum(l.delta)::int AS total, max(l.id) AS last_id
+        FROM public.wallet_ledger l, public.wallets cur
+        WHERE cur.user_id = p_user AND l.user_id = p_user AND l.id > cur.ledger_seq
+    ) d
+    WHERE w.user_id = p_user AND d.last_id IS NOT NULL
+$$ LANGUAGE sql SECURITY DEFINER;
+
+-- Apply one signed change. The wallet row lock serializes changes per user, so
+-- concurrent credits/debits can't lose updates and debits can't overdraw.
+CREATE OR REPLACE FUNCTION public.wallet_apply(p_user UUID, p_delta INTEGER, p_source_ref TEXT, p_reason TEXT)
+RETURNS JSONB AS $$
+DECLARE
+    v_balance INTEGER;
+    v_id BIGINT;
+BEGIN
+    INSERT INTO public.wallets (user_id, token_balance) VALUES (p_user, 0) ON CONFLICT (user_id) DO NOTHING;
+    PERFORM 1 FROM public.wallets WHERE user_id = p_user FOR UPDATE;
+    PERFORM public.wallet_fold(p_user);
+    SELECT token_balance INTO v_balance FROM public.wallets WHERE user_id = p_user;
+
+    IF EXISTS (SELECT 1 FROM public.wallet_ledger WHERE source_ref = p_source_ref) THEN
+        RETURN jsonb_build_object('applied', false, 'duplicate', true, 'insufficient', false, 'balance', v_balance);
+    END IF;
+    IF v_balance + p_delta < 0 THEN
+        RETURN jsonb_build_object('applied', false, 'duplicate', false, 'insufficient', true, 'balance', v_balance);
+    END IF;
+
+    INSERT INTO public.wallet_ledger (user_id, delta, source_ref, reason)
+    VALUES (p_user, p_delta, p_source_ref, p_reason)
+    RETURNING id INTO v_id;
+    UPDATE public.wallets SET token_balance = v_balance + p_delta, ledger_seq = v_id WHERE user_id = p_user;
+
+    RETURN jsonb_build_object('applied', true, 'duplicate', false, 'insufficient', false, 'balance', v_balance + p_delta);
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Wallet row with balance = snapshot + entries since ledger_seq (one indexed range)
+CREATE OR REPLACE FUNCTION public.wallet_state(p_user UUID)
+RETURNS JSONB AS $$
+    SELECT to_jsonb(w) || jsonb_build_object('token_balance', w.token_balance + COALESCE((
+        SELECT sum(l.delta)::int FROM public.wallet_ledger l
+        WHERE l.user_id = w.user_id AND l.id > w.ledger_seq
+    ), 0))
+    FROM public.wallets w
+    WHERE w.user_id = p_user
+$$ LANGUAGE sql STABLE SECURITY DEFINER;
+
+-- Periodic compaction: fold entries written outside wallet_apply (bulk grants, manual fixes)
+CREATE OR REPLACE FUNCTION public.wallet_compact()
+RETURNS INTEGER AS $$
+DECLARE
+    v_user UUID;
+    v_count INTEGER := 0;
+BEGIN
+    FOR v_user IN
+        SELECT w.user_id FROM public.wallets w
+        WHERE EXISTS (SELECT 1 FROM public.wallet_ledger l WHERE l.user_id = w.user_id AND l.id > w.ledger_seq)
+        FOR UPDATE OF w SKIP LOCKED
+    LOOP
+        PERFORM public.wallet_fold(v_user);
+        v_count := v_count + 1;
+    END LOOP;
+    RETURN v_count;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- ============================================
+-- ADMIN DASHBOARD STATS
+-- ============================================
+
+-- Every dashboard count and revenue total in one round trip. Runs with the caller's
+-- rights, so only the service role (which bypasses RLS) sees global totals.
+CREATE OR REPLACE FUNCTION public.admin_stats()
+RETURNS JSONB AS $$
+    SELECT jsonb_build_object(
+        'total_users', u.total, 'total_agents', u.agents,
+        'total_properties', p.total, 'approved_properties', p.approved, 'pending_properties', p.pending,
+        'total_inspections', i.total, 'pending_inspections', i.pending, 'completed_inspections', i.completed,
+        'pending_verifications', v.pending,
+        'token_revenue', t.revenue, 'inspection_revenue', it.revenue
+    )
+    FROM (SELECT count(*) AS total, count(*) FILTER (WHERE role = 'agent') AS agents FROM public.users) u,
+         (SELECT count(*) AS total,
+                 count(*) FILTER (WHERE status = 'approved') AS approved,
+                 count(*) FILTER (WHERE status = 'pending') AS pending
+          FROM public.properties) p,
+         (SELECT count(*) AS total,
+                 count(*) FILTER (WHERE status = 'pending') AS pending,
+                 count(*) FILTER (WHERE status = 'completed') AS completed
+          FROM public.inspections) i,
+         (SELECT count(*) AS pending FROM public.agent_verification_requests WHERE status = 'pending') v,
+         (SELECT COALESCE(sum(amount), 0)::int AS revenue FROM public.transactions WHERE status = 'completed') t,
+         (SELECT COALESCE(sum(amount), 0)::int AS revenue FROM public.inspection_transactions WHERE status = 'completed') it
+$$ LANGUAGE sql STABLE;
+
+-- ============================================
+-- SAVED SEARCHES
+-- ============================================
+
+-- Filter sets matched against listings as they are approved (see backend/matching.py)
+CREATE TABLE IF NOT EXISTS public.saved_searches (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    user_id UUID NOT NULL REFERENCES public.users(id) ON DELETE CASCADE,
+    name TEXT,
+    property_type TEXT,
+    min_price INTEGER,
+    max_price INTEGER,
+    location TEXT,
+    keywords TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    CHECK (min_price IS NULL OR max_price IS NULL OR min_price <= max_price)
+);
+
+CREATE INDEX IF NOT EXISTS idx_saved_searches_user ON public.saved_searches(user_id);
+
+-- Queue of "a listing matching your search was approved" notifications
+CREATE TABLE IF NOT EXISTS public.search_notifications (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    user_id UUID NOT NULL REFERENCES public.users(id) ON DELETE CASCADE,
+    saved_search_id UUID NOT NULL REFERENCES public.saved_searches(id) ON DELETE CASCADE,
+    property_id UUID NOT NULL REFERENCES public.properties(id) ON DELETE CASCADE,
+    property_title TEXT,
+    read_at TIMESTAMPTZ,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    UNIQUE (saved_search_id, property_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_search_notifications_unread ON public.search_notifications(user_id, created_at DESC)
+    WHERE read_at IS NULL;
+
+ALTER TABLE public.saved_searches ENABLE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS "saved_searches_own" ON public.saved_searches;
+CREATE POLICY "saved_searches_own" ON public.saved_searches FOR ALL USING (auth.uid() = user_id);
+
+ALTER TABLE public.search_notifications ENABLE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS "search_notifications_own" ON public.search_notifications;
+CREATE POLICY "search_notifications_own" ON public.search_notifications FOR ALL USING (auth.uid() = user_id);
+
+-- ============================================
+-- DUPLICATE LISTING DETECTION
+-- ============================================
+
+-- Set at submission when a listing looks like a re-post (see backend/dedupe.py)
+ALTER TABLE public.properties ADD COLUMN IF NOT EXISTS duplicate_of UUID REFERENCES public.properties(id) ON DELETE SET NULL;
+ALTER TABLE public.properties ADD COLUMN IF NOT EXISTS duplicate_score REAL;
+ALTER TABLE public.properties ADD COLUMN IF NOT EXISTS duplicate_reason TEXT;
+-- 64-bit dHashes of the listing's images as hex, so index reloads never re-download images
+ALTER TABLE public.properties ADD COLUMN IF NOT EXISTS image_hashes TEXT[];
+
+CREATE INDEX IF NOT EXISTS idx_properties_duplicate_of ON public.properties(duplicate_of)
+    WHERE duplicate_of IS NOT NULL;
+
+-- Store image hashes for a batch of [{id, image_hashes, duplicate_of?, duplicate_score?, duplicate_reason?}];
+-- an existing duplicate flag (e.g. from the text check) is kept
+CREATE OR REPLACE FUNCTION public.set_listing_image_hashes(p_rows JSONB)
+RETURNS INTEGER AS $$
+    WITH updated AS (
+        UPDATE public.properties p
+        SET image_hashes = r.image_hashes,
+            duplicate_of = COALESCE(p.duplicate_of, r.duplicate_of),
+            duplicate_score = CASE WHEN p.duplicate_of IS NULL THEN r.duplicate_score ELSE p.duplicate_score END,
+            duplicate_reason = CASE WHEN p.duplicate_of IS NULL THEN r.duplicate_reason ELSE p.duplicate_reason END
+        FROM jsonb_to_recordset(p_rows) AS r(id UUID, image_hashes TEXT[], duplicate_of UUID, duplicate_score REAL, duplicate_reason TEXT)
+        WHERE p.id = r.id
+        RETURNING 1
+    )
+    SELECT count(*)::int FROM updated
+$$ LANGUAGE sql;
+
+-- ============================================
+-- ADMIN USER SEARCH
+-- ============================================
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- Prefix matches use the pattern_ops btrees; substring and fuzzy matches use the trigram GIN indexes
+CREATE INDEX IF NOT EXISTS idx_users_email_prefix ON public.users (lower(email) text_pattern_ops);
+CREATE INDEX IF NOT EXISTS idx_users_name_prefix ON public.users (lower(full_name) text_pattern_ops);
+CREATE INDEX IF NOT EXISTS idx_users_email_trgm ON public.users USING gin (lower(email) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_users_name_trgm ON public.users USING gin (lower(full_name) gin_trgm_ops);
+-- Keyset order for browsing without a query, overall, by role and for the few suspended accounts
+CREATE INDEX IF NOT EXISTS idx_users_created ON public.users (created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_users_role_created ON public.users (role, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_users_suspended_created ON public.users (created_at DESC, id DESC) WHERE suspended;
+
+-- Matches come in tiers: 0 = email or name starts with the query, 1 = contains it,
+-- 2 = fuzzy (trigram word similarity); newest first within a tier. Tiers run one
+-- at a time until the page is full, so a common substring is never scanned when
+-- prefix matches already fill it. Queries shorter than 3 characters only use tier 0.
+-- Pagination resumes after (p_after_rank, p_after_created_at, p_after_id).
+-- EXECUTE plans with the actual values, so the LIKE prefix can use the btrees.
+CREATE OR REPLACE FUNCTION public.search_users(
+    p_query TEXT DEFAULT NULL,
+    p_role TEXT DEFAULT NULL,
+    p_suspended BOOLEAN DEFAULT NULL,
+    p_after_rank INTEGER DEFAULT NULL,
+    p_after_created_at TIMESTAMPTZ DEFAULT NULL,
+    p_after_id UUID DEFAULT NULL,
+    p_limit INTEGER DEFAULT 50
+)
+RETURNS TABLE(id UUID, email TEXT, full_name TEXT, role TEXT, suspended BOOLEAN, created_at TIMESTAMPTZ, match_rank INTEGER) AS $$
+DECLARE
+    q TEXT := lower(btrim(COALESCE(p_query, '')));
+    pattern TEXT := replace(replace(replace(lower(btrim(COALESCE(p_query, ''))), '\', '\\'), '%', '\%'), '_', '\_');
+    prefix_match TEXT := '(lower(u.email) LIKE $1 || ''%'' OR lower(u.full_name) LIKE $1 || ''%'')';
+    substring_match TEXT := '(lower(u.email) LIKE ''%'' || $1 || ''%'' OR lower(u.full_name) LIKE ''%'' || $1 || ''%'')';
+    fuzzy_match TEXT := '($2 <% lower(u.email) OR $2 <% lower(u.full_name))';
+    remaining INTEGER := p_limit;
+    matched INTEGER;
+    tier_match TEXT;
+BEGIN
+    FOR tier IN 0..2 LOOP
+        EXIT WHEN remaining <= 0 OR (tier > 0 AND length(q) < 3);
+        CONTINUE WHEN tier < COALESCE(p_after_rank, 0);
+        tier_match := CASE
+            WHEN q = '' THEN 'TRUE'
+            WHEN tier = 0 THEN prefix_match
+            WHEN tier = 1 THEN substring_match || ' AND NOT ' || prefix_match
+            ELSE fuzzy_match || ' AND NOT ' || substring_match
+        END;
+        RETURN QUERY EXECUTE format(
+            'SELECT u.id, u.email, u.full_name, u.role, u.suspended, u.created_at, %s
+             FROM public.users u
+             WHERE %s
+               AND ($3::text IS NULL OR u.role = $3)
+               AND ($4::boolean IS NULL OR u.suspended = $4)
+               %s
+             ORDER BY u.created_at DESC, u.id DESC
+             LIMIT $7',
+            tier, tier_match,
+            CASE WHEN tier = p_after_rank AND p_after_id IS NOT NULL THEN 'AND (u.created_at, u.id) < ($5, $6)' ELSE '' END)
+        USING pattern, q, p_role, p_suspended, p_after_created_at, p_after_id, remaining;
+        GET DIAGNOSTICS matched = ROW_COUNT;
+        remaining := remaining - matched;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+-- ============================================
+-- LISTING VIEW COUNTS
+-- ============================================
+
+-- Daily buckets so ranking can weight recent views; written only by batched worker flushes
+CREATE TABLE IF NOT EXISTS public.property_view_days (
+    property_id UUID NOT NULL REFERENCES public.properties(id) ON DELETE CASCADE,
+    day DATE NOT NULL,
+    views BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (property_id, day)
+);
+
+CREATE INDEX IF NOT EXISTS idx_property_view_days_day ON public.property_view_days(day);
+
+ALTER TABLE public.property_view_days ENABLE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS "property_view_days_select_admin" ON public.property_view_days;
+CREATE POLICY "property_view_days_select_admin" ON public.property_view_days FOR SELECT USING (public.is_admin());
+
+ALTER TABLE public.agent_stats ADD COLUMN IF NOT EXISTS views BIGINT NOT NULL DEFAULT 0;
+
+-- Add a worker's buffered [{property_id, views}] to today's buckets and the agents' totals.
+-- Rows are upserted in key order so concurrent flushes from several workers can't deadlock;
+-- views of listings deleted since they were counted are dropped.
+CREATE OR REPLACE FUNCTION public.record_property_views(p_rows JSONB)
+RETURNS INTEGER AS $$
+    WITH pending AS (
+        SELECT p.id AS property_id, p.uploaded_by_agent_id AS agent_id, sum(r.views) AS views
+        FROM jsonb_to_recordset(p_rows) AS r(property_id UUID, views INTEGER)
+        JOIN public.properties p ON p.id = r.property_id
+        GROUP BY p.id, p.uploaded_by_agent_id
+    ), by_day AS (
+        INSERT INTO public.property_view_days (property_id, day, views)
+        SELECT property_id, CURRENT_DATE, views FROM pending ORDER BY property_id
+        ON CONFLICT (property_id, day) DO UPDATE SET views = public.property_view_days.views + EXCLUDED.views
+    ), by_agent AS (
+        INSERT INTO public.agent_stats (agent_id, views)
+        SELECT agent_id, sum(views) FROM pending WHERE agent_id IS NOT NULL GROUP BY agent_id ORDER BY agent_id
+        ON CONFLICT (agent_id) DO UPDATE SET views = public.agent_stats.views + EXCLUDED.views, updated_at = NOW()
+    )
+    SELECT COALESCE(sum(views), 0)::int FROM pending
+$$ LANGUAGE sql;
+
+-- ============================================
+-- TRENDING RANKING
+-- ============================================
+
+-- The background ranker reads events past its last (timestamp, id) watermark
+DROP INDEX IF EXISTS public.idx_unlocks_unlocked_at;
+DROP INDEX IF EXISTS public.idx_inspections_created_at;
+CREATE INDEX IF NOT EXISTS idx_unlocks_unlocked_at_id ON public.unlocks(unlocked_at, id);
+CREATE INDEX IF NOT EXISTS idx_inspections_created_at_id ON public.inspections(created_at, id);
+
+-- ============================================
+-- DELTA SYNC
+-- ============================================
+
+ALTER TABLE public.properties ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW();
+
+CREATE INDEX IF NOT EXISTS idx_properties_approved_updated ON public.properties(updated_at, id)
+    WHERE status = 'approved';
+
+CREATE OR REPLACE FUNCTION public.touch_property()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.updated_at := NOW();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS properties_touch ON public.properties;
+CREATE TRIGGER properties_touch
+    BEFORE UPDATE ON public.properties
+    FOR EACH ROW EXECUTE FUNCTION public.touch_property();
+
+-- Listings that left the approved feed (deleted or moved to another status), so
+-- syncing clients can drop them. Re-approval removes the tombstone and the row
+-- comes back as an upsert instead.
+CREATE TABLE IF NOT EXISTS public.property_tombstones (
+    property_id UUID PRIMARY KEY,
+    removed_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_property_tombstones_removed ON public.property_tombstones(removed_at);
+
+ALTER TABLE public.property_tombstones ENABLE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS "property_tombstones_select_all" ON public.property_tombstones;
+CREATE POLICY "property_tombstones_select_all" ON public.property_tombstones FOR SELECT USING (true);
+
+CREATE OR REPLACE FUNCTION public.track_property_removal()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        IF OLD.status = 'approved' THEN
+            INSERT INTO public.property_tombstones (property_id) VALUES (OLD.id)
+            ON CONFLICT (property_id) DO UPDATE SET removed_at = NOW();
+        END IF;
+        RETURN OLD;
+    END IF;
+    IF OLD.status = 'approved' AND NEW.status <> 'approved' THEN
+        INSERT INTO public.property_tombstones (property_id) VALUES (NEW.id)
+        ON CONFLICT (property_id) DO UPDATE SET removed_at = NOW();
+    ELSIF NEW.status = 'approved' AND OLD.status <> 'approved' THEN
+        DELETE FROM public.property_tombstones WHERE property_id = NEW.id;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+DROP TRIGGER IF EXISTS properties_track_removal ON public.properties;
+CREATE TRIGGER properties_track_removal
+    AFTER UPDATE OF status OR DELETE ON public.properties
+    FOR EACH ROW EXECUTE FUNCTION public.track_property_removal();
+
+-- One page of changes to the approved feed after the keyset position (p_since, p_after_id):
+-- up to p_limit approved rows in (updated_at, id) order, plus the ids removed in the same
+-- time span. With no p_since this is the initial full sync and there is nothing to remove.
+CREATE OR REPLACE FUNCTION public.property_changes(
+    p_since TIMESTAMPTZ DEFAULT NULL,
+    p_after_id UUID DEFAULT NULL,
+    p_limit INTEGER DEFAULT 500
+)
+RETURNS JSONB AS $$
+    WITH candidates AS (
+        SELECT p.*
+        FROM public.properties p
+        WHERE p.status = 'approved'
+          AND (p_since IS NULL
+               OR (p.updated_at, p.id) > (p_since, COALESCE(p_after_id, '00000000-0000-0000-0000-000000000000'::uuid)))
+        ORDER BY p.updated_at, p.id
+        LIMIT p_limit + 1
+    ), page AS (
+        SELECT * FROM candidates ORDER BY updated_at, id LIMIT p_limit
+    ), bounds AS (
+        SELECT (SELECT count(*) FROM candidates) > p_limit AS has_more,
+               (SELECT max(updated_at) FROM page) AS page_end
+    )
+    SELECT jsonb_build_object(
+        'upserts', COALESCE((SELECT jsonb_agg(to_jsonb(page) ORDER BY page.updated_at, page.id) FROM page), '[]'::jsonb),
+        'removals', COALESCE((
+            SELECT jsonb_agg(t.property_id ORDER BY t.removed_at)
+            FROM public.property_tombstones t, bounds b
+            WHERE p_since IS NOT NULL AND t.removed_at > p_since
+              AND (NOT b.has_more OR t.removed_at <= b.page_end)
+        ), '[]'::jsonb),
+        'has_more', (SELECT has_more FROM bounds),
+        'server_time', NOW()
+    )
+$$ LANGUAGE sql STABLE;
+
+-- ============================================
+-- PAYMENT PARTITIONING AND ARCHIVAL
+-- ============================================
+
+-- transactions and inspection_transactions are range-partitioned by month on created_at.
+-- A unique index can't span partitions without the partition key, so global reference
+-- uniqueness and reference -> partition routing live in this small lookup table.
+CREATE TABLE IF NOT EXISTS public.payment_references (
+    reference TEXT PRIMARY KEY,
+    kind TEXT NOT NULL CHECK (kind IN ('token', 'inspection')),
+    created_at TIMESTAMPTZ NOT NULL
+);
+
+ALTER TABLE public.payment_references ENABLE ROW LEVEL SECURITY;
+
+-- Settled months moved out of the hot tables, one row per table and month. The rows
+-- column is a single large JSONB array, which TOAST stores compressed.
+CREATE TABLE IF NOT EXISTS public.payment_archive (
+    kind TEXT NOT NULL CHECK (kind IN ('token', 'inspection')),
+    month DATE NOT NULL,
+    row_count INTEGER NOT NULL,
+    completed_amount BIGINT NOT NULL,
+    rows JSONB NOT NULL,
+    archived_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (kind, month)
+);
+
+ALTER TABLE public.payment_archive ENABLE ROW LEVEL SECURITY;
+
+CREATE OR REPLACE FUNCTION public.register_payment_reference()
+RETURNS TRIGGER AS $$
+BEGIN
+    -- A duplicate reference fails here and rolls back the payment insert
+    INSERT INTO public.payment_references (reference, kind, created_at)
+    VALUES (NEW.reference, TG_ARGV[0], NEW.created_at);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Create monthly partitions of p_table from p_from through p_months_ahead months from now.
+-- Rows that fell into the default partition because a month was missing are moved into
+-- the new partition before it is attached.
+CREATE OR REPLACE FUNCTION public.ensure_payment_partitions(p_table TEXT, p_from DATE DEFAULT NULL, p_months_ahead INTEGER DEFAULT 3)
+RETURNS INTEGER AS $$
+DECLARE
+    v_month DATE := date_trunc('month', COALESCE(p_from, NOW()))::date;
+    v_last DATE := (date_trunc('month', NOW()) + make_interval(months => p_months_ahead))::date;
+    v_default TEXT := p_table || '_default';
+    v_name TEXT;
+    v_created INTEGER := 0;
+    v_stray BOOLEAN;
+BEGIN
+    IF to_regclass('public.' || v_default) IS NULL THEN
+        EXECUTE format('CREATE TABLE public.%I PARTITION OF public.%I DEFAULT', v_default, p_table);
+        EXECUTE format('ALTER TABLE public.%I ENABLE ROW LEVEL SECURITY', v_default);
+    END IF;
+    WHILE v_month <= v_last LOOP
+        v_name := p_table || '_' || to_char(v_month, 'YYYY_MM');
+        IF to_regclass('public.' || v_name) IS NULL
+           AND NOT EXISTS (SELECT 1 FROM public.payment_archive a
+                           WHERE a.month = v_month
+                             AND a.kind = CASE p_table WHEN 'transactions' THEN 'token' ELSE 'inspection' END) THEN
+            EXECUTE format('SELECT EXISTS (SELECT 1 FROM public.%I WHERE created_at >= $1 AND created_at < $2)', v_default)
+                INTO v_stray USING v_month, v_month + interval '1 month';
+            IF v_stray THEN
+                EXECUTE format('CREATE TABLE public.%I (LIKE public.%I INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', v_name, p_table);
+                EXECUTE format(
+                    'WITH moved AS (DELETE FROM public.%I WHERE created_at >= $1 AND created_at < $2 RETURNING *)
+                     INSERT INTO public.%I SELECT * FROM moved', v_default, v_name)
+                    USING v_month, v_month + interval '1 month';
+                EXECUTE format('ALTER TABLE public.%I ATTACH PARTITION public.%I FOR VALUES FROM (%L) TO (%L)',
+                               p_table, v_name, v_month, v_month + interval '1 month');
+            ELSE
+                EXECUTE format('CREATE TABLE public.%I PARTITION OF public.%I FOR VALUES FROM (%L) TO (%L)',
+                               v_name, p_table, v_month, v_month + interval '1 month');
+            END IF;
+            -- Partitions are tables in the API schema too; without RLS they would bypass the parent's policies
+            EXECUTE format('ALTER TABLE public.%I ENABLE ROW LEVEL SECURITY', v_name);
+            v_created := v_created + 1;
+        END IF;
+        v_month := (v_month + interval '1 month')::date;
+    END LOOP;
+    RETURN v_created;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- One-time conversion of a plain payment table into the partitioned layout. Foreign keys
+-- and policies are carried over; no-op once the table is partitioned.
+CREATE OR REPLACE FUNCTION public.partition_payment_table(p_table TEXT, p_kind TEXT)
+RETURNS VOID AS $$
+DECLARE
+    v_old TEXT := p_table || '_unpartitioned';
+    v_from DATE;
+    r RECORD;
+BEGIN
+    IF (SELECT c.relkind FROM pg_class c WHERE c.oid = ('public.' || p_table)::regclass) = 'p' THEN
+        RETURN;
+    END IF;
+    EXECUTE format('LOCK TABLE public.%I IN ACCESS EXCLUSIVE MODE', p_table);
+    EXECUTE format('ALTER TABLE public.%I RENAME TO %I', p_table, v_old);
+    EXECUTE format('CREATE TABLE public.%I (LIKE public.%I INCLUDING DEFAULTS INCLUDING CONSTRAINTS) PARTITION BY RANGE (created_at)',
+                   p_table, v_old);
+    EXECUTE format('SELECT min(created_at)::date FROM public.%I', v_old) INTO v_from;
+    PERFORM public.ensure_payment_partitions(p_table, v_from);
+    EXECUTE format('INSERT INTO public.%I SELECT * FROM public.%I', p_table, v_old);
+    EXECUTE format('INSERT INTO public.payment_references (reference, kind, created_at)
+                    SELECT reference, %L, created_at FROM public.%I ON CONFLICT (reference) DO NOTHING', p_kind, v_old);
+
+    FOR r IN SELECT conname, pg_get_constraintdef(oid) AS def FROM pg_constraint
+             WHERE conrelid = ('public.' || v_old)::regclass AND contype = 'f' LOOP
+        EXECUTE format('ALTER TABLE public.%I ADD CONSTRAINT %I %s', p_table, r.conname || '_p', r.def);
+    END LOOP;
+    FOR r IN SELECT * FROM pg_policies WHERE schemaname = 'public' AND tablename = v_old LOOP
+        EXECUTE format('CREATE POLICY %I ON public.%I AS %s FOR %s TO %s%s%s',
+                       r.policyname || '_p', p_table, r.permissive, r.cmd, array_to_string(r.roles, ', '),
+                       COALESCE(' USING (' || r.qual || ')', ''), COALESCE(' WITH CHECK (' || r.with_check || ')', ''));
+    END LOOP;
+
+    EXECUTE format('DROP TABLE public.%I', v_old);
+    EXECUTE format('ALTER TABLE public.%I ADD PRIMARY KEY (id, created_at)', p_table);
+    EXECUTE format('ALTER TABLE public.%I ENABLE ROW LEVEL SECURITY', p_table);
+    -- Restore the original constraint and policy names now that the old table is gone
+    FOR r IN SELECT conname FROM pg_constraint WHERE conrelid = ('public.' || p_table)::regclass
+             AND contype = 'f' AND conname LIKE '%\_p' LOOP
+        EXECUTE format('ALTER TABLE public.%I RENAME CONSTRAINT %I TO %I', p_table, r.conname, left(r.conname, -2));
+    END LOOP;
+    FOR r IN SELECT policyname FROM pg_policies WHERE schemaname = 'public' AND tablename = p_table
+             AND policyname LIKE '%\_p' LOOP
+        EXECUTE format('ALTER POLICY %I ON public.%I RENAME TO %I', r.policyname, p_table, left(r.policyname, -2));
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT public.partition_payment_table('transactions', 'token');
+SELECT public.partition_payment_table('inspection_transactions', 'inspection');
+
+CREATE INDEX IF NOT EXISTS idx_transactions_user ON public.transactions(user_id);
+CREATE INDEX IF NOT EXISTS idx_transactions_reference ON public.transactions(reference);
+CREATE INDEX IF NOT EXISTS idx_transactions_created ON public.transactions(created_at);
+CREATE INDEX IF NOT EXISTS idx_transactions_pending ON public.transactions(created_at) WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS idx_insp_tx_user ON public.inspection_transactions(user_id);
+CREATE INDEX IF NOT EXISTS idx_insp_tx_reference ON public.inspection_transactions(reference);
+CREATE INDEX IF NOT EXISTS idx_insp_tx_created ON public.inspection_transactions(created_at);
+CREATE INDEX IF NOT EXISTS idx_insp_tx_pending ON public.inspection_transactions(created_at) WHERE status = 'pending';
+
+DROP TRIGGER IF EXISTS transactions_reference ON public.transactions;
+CREATE TRIGGER transactions_reference
+    AFTER INSERT ON public.transactions
+    FOR EACH ROW EXECUTE FUNCTION public.register_payment_reference('token');
+
+DROP TRIGGER IF EXISTS inspection_transactions_reference ON public.inspection_transactions;
+CREATE TRIGGER inspection_transactions_reference
+    AFTER INSERT ON public.inspection_transactions
+    FOR EACH ROW EXECUTE FUNCTION public.register_payment_reference('inspection');
+
+-- The payment with this reference as {kind, ...row}, from the one hot partition the lookup
+-- points at, or from its archived month
+CREATE OR REPLACE FUNCTION public.payment_by_reference(p_reference TEXT)
+RETURNS JSONB AS $$
+DECLARE
+    v_ref public.payment_references%ROWTYPE;
+    v_row JSONB;
+BEGIN
+    SELECT * INTO v_ref FROM public.payment_references WHERE reference = p_reference;
+    IF NOT FOUND THEN
+        RETURN NULL;
+    END IF;
+    IF v_ref.kind = 'token' THEN
+        SELECT to_jsonb(t) INTO v_row FROM public.transactions t
+        WHERE t.created_at = v_ref.created_at AND t.reference = p_reference;
+    ELSE
+        SELECT to_jsonb(t) INTO v_row FROM public.inspection_transactions t
+        WHERE t.created_at = v_ref.created_at AND t.reference = p_reference;
+    END IF;
+    IF v_row IS NULL THEN
+        SELECT r INTO v_row
+        FROM public.payment_archive a, jsonb_array_elements(a.rows) r
+        WHERE a.kind = v_ref.kind AND a.month = date_trunc('month', v_ref.created_at)::date
+          AND r->>'reference' = p_reference;
+    END IF;
+    RETURN v_row || jsonb_build_object('kind', v_ref.kind);
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+-- Move a pending payment to failed/expired, or any unsettled one to completed, routed
+-- through the lookup; returns the updated {kind, ...row}, or NULL if nothing changed
+CREATE OR REPLACE FUNCTION public.update_payment_status(p_reference TEXT, p_status TEXT, p_korapay_reference TEXT DEFAULT NULL)
+RETURNS JSONB AS $$
+DECLARE
+    v_ref public.payment_references%ROWTYPE;
+    v_row JSONB;
+BEGIN
+    SELECT * INTO v_ref FROM public.payment_references WHERE reference = p_reference;
+    IF NOT FOUND THEN
+        RETURN NULL;
+    END IF;
+    IF v_ref.kind = 'token' THEN
+        UPDATE public.transactions t
+        SET status = p_status, koralpay_reference = COALESCE(p_korapay_reference, t.koralpay_reference)
+        WHERE t.created_at = v_ref.created_at AND t.reference = p_reference
+          AND (CASE WHEN p_status = 'completed' THEN t.status <> 'completed' ELSE t.status = 'pending' END)
+        RETURNING to_jsonb(t) INTO v_row;
+    ELSE
+        UPDATE public.inspection_transactions t
+        SET status = p_status, koralpay_reference = COALESCE(p_korapay_reference, t.koralpay_reference)
+        WHERE t.created_at = v_ref.created_at AND t.reference = p_reference
+          AND (CASE WHEN p_status = 'completed' THEN t.status <> 'completed' ELSE t.status = 'pending' END)
+        RETURNING to_jsonb(t) INTO v_row;
+    END IF;
+    RETURN v_row || jsonb_build_object('kind', v_ref.kind);
+END;
+$$ LANGUAGE plpgsql;
+
+-- Archive every month older than p_retention_months whose payments are all settled,
+-- then make sure partitions exist for the months ahead. Returns the months archived.
+CREATE OR REPLACE FUNCTION public.archive_payment_partitions(p_retention_months INTEGER DEFAULT 12, p_months_ahead INTEGER DEFAULT 3)
+RETURNS INTEGER AS $$
+DECLARE
+    v_cutoff DATE := (date_trunc('month', NOW()) - make_interval(months => p_retention_months))::date;
+    v_archived INTEGER := 0;
+    v_month DATE;
+    v_pending BOOLEAN;
+    r RECORD;
+BEGIN
+    FOR r IN
+        SELECT parent.relname AS parent, child.relname AS name,
+               CASE parent.relname WHEN 'transactions' THEN 'token' ELSE 'inspection' END AS kind
+        FROM pg_inherits i
+        JOIN pg_class parent ON parent.oid = i.inhparent
+        JOIN pg_class child ON child.oid = i.inhrelid
+        JOIN pg_namespace n ON n.oid = parent.relnamespace
+        WHERE n.nspname = 'public' AND parent.relname IN ('transactions', 'inspection_transactions')
+          AND child.relname ~ '_\d{4}_\d{2}$'
+        ORDER BY child.relname
+    LOOP
+        v_month := to_date(right(r.name, 7), 'YYYY_MM');
+        CONTINUE WHEN v_month >= v_cutoff;
+        EXECUTE format('SELECT EXISTS (SELECT 1 FROM public.%I WHERE status = ''pending'')', r.name) INTO v_pending;
+        CONTINUE WHEN v_pending;
+        EXECUTE format(
+            'INSERT INTO public.payment_archive (kind, month, row_count, completed_amount, rows)
+             SELECT %L, %L, count(*), COALESCE(sum(amount) FILTER (WHERE status = ''completed''), 0),
+                    COALESCE(jsonb_agg(to_jsonb(t) ORDER BY t.created_at), ''[]''::jsonb)
+             FROM public.%I t
+             ON CONFLICT (kind, month) DO UPDATE
+             SET row_count = public.payment_archive.row_count + EXCLUDED.row_count,
+                 completed_amount = public.payment_archive.completed_amount + EXCLUDED.completed_amount,
+                 rows = public.payment_archive.rows || EXCLUDED.rows,
+                 archived_at = NOW()',
+            r.kind, v_month, r.name);
+        EXECUTE format('DROP TABLE public.%I', r.name);
+        v_archived := v_archived + 1;
+    END LOOP;
+    PERFORM public.ensure_payment_partitions('transactions', NULL, p_months_ahead);
+    PERFORM public.ensure_payment_partitions('inspection_transactions', NULL, p_months_ahead);
+    RETURN v_archived;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Revenue now adds the archived months' settled totals to the hot partitions
+CREATE OR REPLACE FUNCTION public.admin_stats()
+RETURNS JSONB AS $$
+    SELECT jsonb_build_object(
+        'total_users', u.total, 'total_agents', u.agents,
+        'total_properties', p.total, 'approved_properties', p.approved, 'pending_properties', p.pending,
+        'total_inspections', i.total, 'pending_inspections', i.pending, 'completed_inspections', i.completed,
+        'pending_verifications', v.pending,
+        'token_revenue', t.revenue + a.token_revenue, 'inspection_revenue', it.revenue + a.inspection_revenue
+    )
+    FROM (SELECT count(*) AS total, count(*) FILTER (WHERE role = 'agent') AS agents FROM public.users) u,
+         (SELECT count(*) AS total,
+                 count(*) FILTER (WHERE status = 'approved') AS approved,
+                 count(*) FILTER (WHERE status = 'pending') AS pending
+          FROM public.properties) p,
+         (SELECT count(*) AS total,
+                 count(*) FILTER (WHERE status = 'pending') AS pending,
+                 count(*) FILTER (WHERE status = 'completed') AS completed
+          FROM public.inspections) i,
+         (SELECT count(*) AS pending FROM public.agent_verification_requests WHERE status = 'pending') v,
+         (SELECT COALESCE(sum(amount), 0)::int AS revenue FROM public.transactions WHERE status = 'completed') t,
+         (SELECT COALESCE(sum(amount), 0)::int AS revenue FROM public.inspection_transactions WHERE status = 'completed') it,
+         (SELECT COALESCE(sum(completed_amount) FILTER (WHERE kind = 'token'), 0)::int AS token_revenue,
+                 COALESCE(sum(completed_amount) FILTER (WHERE kind = 'inspection'), 0)::int AS inspection_revenue
+          FROM public.payment_archive) a
+$$ LANGUAGE sql STABLE;
+
+-- ============================================
+-- NOTIFICATION OUTBOX
+-- ============================================
+
+-- Emails owed to users, written by triggers in the same transaction as the state change
+-- that causes them, so an event is queued exactly when its change commits. The API's
+-- dispatcher claims due rows in batches and delivers them out of band.
+CREATE TABLE IF NOT EXISTS public.notification_outbox (
+    id BIGSERIAL PRIMARY KEY,
+    kind TEXT NOT NULL,
+    user_id UUID REFERENCES public.users(id) ON DELETE CASCADE,
+    recipient TEXT NOT NULL,
+    -- The entity the event is about; a batch keeps only the latest event per subject
+    subject_id TEXT NOT NULL,
+    payload JSONB NOT NULL DEFAULT '{}'::jsonb,
+    status TEXT NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'sending', 'sent', 'failed')),
+    attempts INTEGER NOT NULL DEFAULT 0,
+    -- When a pending row is next due, or when a claimed row's lease runs out
+    available_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    last_error TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    sent_at TIMESTAMPTZ
+);
+
+CREATE INDEX IF NOT EXISTS idx_notification_outbox_due ON public.notification_outbox(available_at, id)
+    WHERE status IN ('pending', 'sending');
+CREATE INDEX IF NOT EXISTS idx_notification_outbox_settled ON public.notification_outbox(created_at)
+    WHERE status IN ('sent', 'failed');
+
+ALTER TABLE public.notification_outbox ENABLE ROW LEVEL SECURITY;
+
+CREATE OR REPLACE FUNCTION public.enqueue_notification(p_kind TEXT, p_user_id UUID, p_subject_id TEXT, p_payload JSONB)
+RETURNS VOID AS $$
+    INSERT INTO public.notification_outbox (kind, user_id, recipient, subject_id, payload)
+    SELECT p_kind, u.id, u.email, p_subject_id, p_payload || jsonb_build_object('full_name', u.full_name)
+    FROM public.users u
+    WHERE u.id = p_user_id
+$$ LANGUAGE sql SECURITY DEFINER;
+
+CREATE OR REPLACE FUNCTION public.notify_listing_reviewed()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF NEW.status IN ('approved', 'rejected') AND NEW.status IS DISTINCT FROM OLD.status THEN
+        PERFORM public.enqueue_notification('listing_reviewed', NEW.uploaded_by_agent_id, NEW.id::text,
+            jsonb_build_object('property_id', NEW.id, 'title', NEW.title, 'status', NEW.status));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+DROP TRIGGER IF EXISTS properties_notify_reviewed ON public.properties;
+CREATE TRIGGER properties_notify_reviewed
+    AFTER UPDATE OF status ON public.properties
+    FOR EACH ROW EXECUTE FUNCTION public.notify_listing_reviewed();
+
+CREATE OR REPLACE FUNCTION public.notify_verification_reviewed()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF NEW.status IN ('approved', 'rejected') AND NEW.status IS DISTINCT FROM OLD.status THEN
+        PERFORM public.enqueue_notification('verification_reviewed', NEW.user_id, NEW.id::text,
+            jsonb_build_object('status', NEW.status));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+DROP TRIGGER IF EXISTS verification_notify_reviewed ON public.agent_verification_requests;
+CREATE TRIGGER verification_notify_reviewed
+    AFTER UPDATE OF status ON public.agent_verification_requests
+    FOR EACH ROW EXECUTE FUNCTION public.notify_verification_reviewed();
+
+-- TG_ARGV[0] is the payment type: token_purchase or inspection_fee
+CREATE OR REPLACE FUNCTION public.notify_payment_completed()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF NEW.status = 'completed' AND OLD.status <> 'completed' THEN
+        PERFORM public.enqueue_notification('payment_completed', NEW.user_id, NEW.reference,
+            jsonb_build_object('type', TG_ARGV[0], 'reference', NEW.reference, 'amount', NEW.amount,
+                               'tokens', to_jsonb(NEW) -> 'tokens_added', 'date', NOW()));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+DROP TRIGGER IF EXISTS transactions_notify_completed ON public.transactions;
+CREATE TRIGGER transactions_notify_completed
+    AFTER UPDATE OF status ON public.transactions
+    FOR EACH ROW EXECUTE FUNCTION public.notify_payment_completed('token_purchase');
+
+DROP TRIGGER IF EXISTS inspection_transactions_notify_completed ON public.inspection_transactions;
+CREATE TRIGGER inspection_transactions_notify_completed
+    AFTER UPDATE OF status ON public.inspection_transactions
+    FOR EACH ROW EXECUTE FUNCTION public.notify_payment_completed('inspection_fee');
+
+-- Manual assignment and the scheduler both set agent_id; the agent and the student each hear about it
+CREATE OR REPLACE FUNCTION public.notify_inspection_assigned()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_payload JSONB;
+BEGIN
+    IF NEW.agent_id IS NOT NULL AND NEW.agent_id IS DISTINCT FROM OLD.agent_id THEN
+        v_payload := jsonb_build_object('inspection_id', NEW.id, 'property_title', NEW.property_title,
+                                        'inspection_date', NEW.inspection_date, 'agent_name', NEW.agent_name,
+                                        'student_name', NEW.user_name);
+        PERFORM public.enqueue_notification('inspection_assigned', NEW.agent_id, NEW.id::text, v_payload);
+        PERFORM public.enqueue_notification('inspection_scheduled', NEW.user_id, NEW.id::text, v_payload);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+DROP TRIGGER IF EXISTS inspections_notify_assigned ON public.inspections;
+CREATE TRIGGER inspections_notify_assigned
+    AFTER UPDATE OF agent_id ON public.inspections
+    FOR EACH ROW EXECUTE FUNCTION public.notify_inspection_assigned();
+
+-- Claim up to p_limit due rows for one dispatcher. SKIP LOCKED lets several workers claim
+-- side by side; a claimed row is leased for p_lease_seconds and becomes due again if its
+-- dispatcher dies before finishing it.
+CREATE OR REPLACE FUNCTION public.claim_notifications(p_limit INTEGER DEFAULT 100, p_lease_seconds INTEGER DEFAULT 300)
+RETURNS SETOF public.notification_outbox AS $$
+    WITH due AS (
+        SELECT id FROM public.notification_outbox
+        WHERE status IN ('pending', 'sending') AND available_at <= NOW()
+        ORDER BY available_at, id
+        LIMIT p_limit
+        FOR UPDATE SKIP LOCKED
+    )
+    UPDATE public.notification_outbox o
+    SET status = 'sending', attempts = o.attempts + 1,
+        available_at = NOW() + make_interval(secs => p_lease_seconds)
+    FROM due
+    WHERE o.id = due.id
+    RETURNING o.*
+$$ LANGUAGE sql;
+
+-- Settle a claimed batch: p_sent were delivered (or folded into a delivered message),
+-- p_retry failed and back off exponentially until p_max_attempts, and p_release were
+-- held back by the rate limit and are due again at once without counting an attempt.
+CREATE OR REPLACE FUNCTION public.finish_notifications(
+    p_sent BIGINT[] DEFAULT '{}',
+    p_retry BIGINT[] DEFAULT '{}',
+    p_release BIGINT[] DEFAULT '{}',
+    p_error TEXT DEFAULT NULL,
+    p_max_attempts INTEGER DEFAULT 5,
+    p_backoff_seconds INTEGER DEFAULT 60
+)
+RETURNS VOID AS $$
+BEGIN
+    UPDATE public.notification_outbox
+    SET status = 'sent', sent_at = NOW(), last_error = NULL
+    WHERE id = ANY(p_sent);
+
+    UPDATE public.notification_outbox
+    SET status = CASE WHEN attempts >= p_max_attempts THEN 'failed' ELSE 'pending' END,
+        available_at = NOW() + make_interval(secs => p_backoff_seconds * 2 ^ (attempts - 1)),
+        last_error = p_error
+    WHERE id = ANY(p_retry);
+
+    UPDATE public.notification_outbox
+    SET status = 'pending', attempts = attempts - 1, available_at = NOW()
+    WHERE id = ANY(p_release);
+END;
+$$ LANGUAGE plpgsql;
+
+-- ============================================
+-- INSPECTION CALENDAR
+-- ============================================
+
+CREATE INDEX IF NOT EXISTS idx_inspections_agent_date ON public.inspections(agent_id, inspection_date);
+
+-- Inspections booked per agent and per listing per day (everything not cancelled), kept
+-- current by trigger so a month view reads at most ~31 rows from each table.
+CREATE TABLE IF NOT EXISTS public.agent_inspection_days (
+    agent_id UUID NOT NULL REFERENCES public.users(id) ON DELETE CASCADE,
+    inspection_date DATE NOT NULL,
+    booked INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (agent_id, inspection_date)
+);
+
+CREATE TABLE IF NOT EXISTS public.property_inspection_days (
+    property_id UUID NOT NULL REFERENCES public.properties(id) ON DELETE CASCADE,
+    inspection_date DATE NOT NULL,
+    booked INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (property_id, inspection_date)
+);
+
+ALTER TABLE public.agent_inspection_days ENABLE ROW LEVEL SECURITY;
+ALTER TABLE public.property_inspection_days ENABLE ROW LEVEL SECURITY;
+
+CREATE OR REPLACE FUNCTION public.bump_inspection_days(p_agent_id UUID, p_property_id UUID, p_date DATE, p_delta INTEGER)
+RETURNS VOID AS $$
+BEGIN
+    IF p_agent_id IS NOT NULL THEN
+        INSERT INTO public.agent_inspection_days (agent_id, inspection_date, booked)
+        VALUES (p_agent_id, p_date, GREATEST(p_delta, 0))
+        ON CONFLICT (agent_id, inspection_date)
+        DO UPDATE SET booked = GREATEST(public.agent_inspection_days.booked + p_delta, 0);
+    END IF;
+    INSERT INTO public.property_inspection_days (property_id, inspection_date, booked)
+    VALUES (p_property_id, p_date, GREATEST(p_delta, 0))
+    ON CONFLICT (property_id, inspection_date)
+    DO UPDATE SET booked = GREATEST(public.property_inspection_days.booked + p_delta, 0);
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+CREATE OR REPLACE FUNCTION public.track_inspection_days()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.status <> 'cancelled' THEN
+        PERFORM public.bump_inspection_days(OLD.agent_id, OLD.property_id, OLD.inspection_date, -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.status <> 'cancelled' THEN
+        PERFORM public.bump_inspection_days(NEW.agent_id, NEW.property_id, NEW.inspection_date, 1);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+DROP TRIGGER IF EXISTS inspection_days ON public.inspections;
+CREATE TRIGGER inspection_days
+    AFTER INSERT OR DELETE OR UPDATE OF status, agent_id, property_id, inspection_date ON public.inspections
+    FOR EACH ROW EXECUTE FUNCTION public.track_inspection_days();
+
+-- Backfill from existing inspections (recomputes the counts if the schema is re-run)
+INSERT INTO public.agent_inspection_days (agent_id, inspection_date, booked)
+SELECT agent_id, inspection_date, count(*)::int FROM public.inspections
+WHERE status <> 'cancelled' AND agent_id IS NOT NULL
+GROUP BY agent_id, inspection_date
+ON CONFLICT (agent_id, inspection_date) DO UPDATE SET booked = EXCLUDED.booked;
+
+INSERT INTO public.property_inspection_days (property_id, inspection_date, booked)
+SELECT property_id, inspection_date, count(*)::int FROM public.inspections
+WHERE status <> 'cancelled'
+GROUP BY property_id, inspection_date
+ON CONFLICT (property_id, inspection_date) DO UPDATE SET booked = EXCLUDED.booked;
+
+-- Days with bookings between p_from and p_to for an agent, or for a listing together with
+-- its agent's load (the agent's daily cap is what limits new bookings on the listing).
+CREATE OR REPLACE FUNCTION public.inspection_calendar(
+    p_from DATE,
+    p_to DATE,
+    p_agent_id UUID DEFAULT NULL,
+    p_property_id UUID DEFAULT NULL
+)
+RETURNS TABLE(inspection_date DATE, booked INTEGER, agent_booked INTEGER) AS $$
+    WITH agent_days AS (
+        SELECT d.inspection_date, d.booked
+        FROM public.agent_inspection_days d
+        WHERE d.agent_id = COALESCE(p_agent_id,
+                  (SELECT uploaded_by_agent_id FROM public.properties WHERE id = p_property_id))
+          AND d.inspection_date BETWEEN p_from AND p_to
+    ), property_days AS (
+        SELECT d.inspection_date, d.booked
+        FROM public.property_inspection_days d
+        WHERE p_property_id IS NOT NULL AND d.property_id = p_property_id
+          AND d.inspection_date BETWEEN p_from AND p_to
+    )
+    SELECT COALESCE(p.inspection_date, a.inspection_date),
+           CASE WHEN p_property_id IS NULL THEN COALESCE(a.booked, 0) ELSE COALESCE(p.booked, 0) END,
+           COALESCE(a.booked, 0)
+    FROM property_days p
+    FULL JOIN agent_days a ON a.inspection_date = p.inspection_date
+    ORDER BY 1
+$$ LANGUAGE sql STABLE;
+
+-- ============================================
+-- CAMPUSES
+-- ============================================
+
+-- One deployment serves several universities. Listings, inspections and saved searches
+-- belong to a campus, and the API filters every query on them by the request's campus
+-- (see backend/campus.py). Accounts, wallets and payments are shared by the campuses in
+-- a database; a campus routed to its own Supabase project runs this same schema there.
+--
+-- Rows stored before campuses existed are all LAUTECH's. The column default only
+-- backfills those and is then dropped; new rows get their campus from the API, from
+-- their listing (inspections, tombstones) or, for clients that don't send one (the web
+-- app inserts listings directly), from the set_default_campus trigger below.
+ALTER TABLE public.properties ADD COLUMN IF NOT EXISTS campus TEXT NOT NULL DEFAULT 'lautech';
+ALTER TABLE public.inspections ADD COLUMN IF NOT EXISTS campus TEXT NOT NULL DEFAULT 'lautech';
+ALTER TABLE public.saved_searches ADD COLUMN IF NOT EXISTS campus TEXT NOT NULL DEFAULT 'lautech';
+ALTER TABLE public.property_tombstones ADD COLUMN IF NOT EXISTS campus TEXT NOT NULL DEFAULT 'lautech';
+ALTER TABLE public.properties ALTER COLUMN campus DROP DEFAULT;
+ALTER TABLE public.inspections ALTER COLUMN campus DROP DEFAULT;
+ALTER TABLE public.saved_searches ALTER COLUMN campus DROP DEFAULT;
+ALTER TABLE public.property_tombstones ALTER COLUMN campus DROP DEFAULT;
+
+-- The campus a row lands on when its writer doesn't say. Set it to match the backend's
+-- DEFAULT_CAMPUS with: ALTER DATABASE postgres SET app.default_campus = '<campus>';
+CREATE OR REPLACE FUNCTION public.default_campus()
+RETURNS TEXT AS $$
+    SELECT COALESCE(NULLIF(current_setting('app.default_campus', true), ''), 'lautech')
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION public.set_default_campus()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF NEW.campus IS NULL THEN
+        NEW.campus := public.default_campus();
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS properties_default_campus ON public.properties;
+CREATE TRIGGER properties_default_campus
+    BEFORE INSERT ON public.properties
+    FOR EACH ROW EXECUTE FUNCTION public.set_default_campus();
+
+DROP TRIGGER IF EXISTS saved_searches_default_campus ON public.saved_searches;
+CREATE TRIGGER saved_searches_default_campus
+    BEFORE INSERT ON public.saved_searches
+    FOR EACH ROW EXECUTE FUNCTION public.set_default_campus();
+
+DROP TRIGGER IF EXISTS property_tombstones_default_campus ON public.property_tombstones;
+CREATE TRIGGER property_tombstones_default_campus
+    BEFORE INSERT ON public.property_tombstones
+    FOR EACH ROW EXECUTE FUNCTION public.set_default_campus();
+
+-- Campus-leading indexes, so each campus's feeds, queues and syncs read only its own
+-- rows however large the others grow. These are plain composite indexes rather than
+-- list partitions: properties.id is the target of foreign keys from unlocks,
+-- inspections and the view and calendar tables, and a partitioned table's keys must
+-- include the partition column.
+CREATE INDEX IF NOT EXISTS idx_properties_campus_status ON public.properties(campus, status, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_properties_campus_created ON public.properties(campus, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_properties_campus_agent ON public.properties(campus, uploaded_by_agent_id, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_properties_campus_approved_updated ON public.properties(campus, updated_at, id)
+    WHERE status = 'approved';
+CREATE INDEX IF NOT EXISTS idx_inspections_campus_created ON public.inspections(campus, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_inspections_campus_user ON public.inspections(campus, user_id, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_inspections_campus_unscheduled ON public.inspections(campus, inspection_date)
+    WHERE scheduled_at IS NULL AND payment_status = 'completed';
+CREATE INDEX IF NOT EXISTS idx_saved_searches_campus ON public.saved_searches(campus, id);
+CREATE INDEX IF NOT EXISTS idx_property_tombstones_campus ON public.property_tombstones(campus, removed_at);
+
+-- Superseded by the campus-leading versions above
+DROP INDEX IF EXISTS public.idx_properties_status;
+DROP INDEX IF EXISTS public.idx_properties_approved_updated;
+DROP INDEX IF EXISTS public.idx_inspections_unscheduled;
+
+-- An inspection always belongs to its listing's campus
+CREATE OR REPLACE FUNCTION public.set_inspection_campus()
+RETURNS TRIGGER AS $$
+BEGIN
+    SELECT p.campus INTO NEW.campus FROM public.properties p WHERE p.id = NEW.property_id;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS inspections_set_campus ON public.inspections;
+CREATE TRIGGER inspections_set_campus
+    BEFORE INSERT OR UPDATE OF property_id ON public.inspections
+    FOR EACH ROW EXECUTE FUNCTION public.set_inspection_campus();
+
+-- Feed caches are per campus: listing changes also publish their campus as the key
+DROP TRIGGER IF EXISTS properties_feed_invalidation ON public.properties;
+CREATE TRIGGER properties_feed_invalidation
+    AFTER INSERT OR UPDATE OR DELETE ON public.properties
+    FOR EACH ROW EXECUTE FUNCTION public.notify_cache_invalidation('campus');
+
+-- Tombstones carry the campus so each campus's sync only sees its own removals
+CREATE OR REPLACE FUNCTION public.track_property_removal()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        IF OLD.status = 'approved' THEN
+            INSERT INTO public.property_tombstones (property_id, campus) VALUES (OLD.id, OLD.campus)
+            ON CONFLICT (property_id) DO UPDATE SET removed_at = NOW();
+        END IF;
+        RETURN OLD;
+    END IF;
+    IF OLD.status = 'approved' AND NEW.status <> 'approved' THEN
+        INSERT INTO public.property_tombstones (property_id, campus) VALUES (NEW.id, NEW.campus)
+        ON CONFLICT (property_id) DO UPDATE SET removed_at = NOW();
+    ELSIF NEW.status = 'approved' AND OLD.status <> 'approved' THEN
+        DELETE FROM public.property_tombstones WHERE property_id = NEW.id;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- The campus-scoped versions of the feed, sync and stats functions replace the originals.
+-- The campus is a required argument: there is no campus a caller could safely default to.
+DROP FUNCTION IF EXISTS public.properties_near(DOUBLE PRECISION, DOUBLE PRECISION, DOUBLE PRECISION, TEXT, TEXT, INTEGER, INTEGER);
+DROP FUNCTION IF EXISTS public.properties_near(DOUBLE PRECISION, DOUBLE PRECISION, DOUBLE PRECISION, TEXT, TEXT, INTEGER, INTEGER, TEXT);
+DROP FUNCTION IF EXISTS public.property_changes(TIMESTAMPTZ, UUID, INTEGER);
+DROP FUNCTION IF EXISTS public.property_changes(TIMESTAMPTZ, UUID, INTEGER, TEXT);
+DROP FUNCTION IF EXISTS public.admin_stats();
+DROP FUNCTION IF EXISTS public.admin_stats(TEXT);
+
+CREATE OR REPLACE FUNCTION public.properties_near(
+    lat DOUBLE PRECISION,
+    lng DOUBLE PRECISION,
+    p_campus TEXT,
+    radius_m DOUBLE PRECISION DEFAULT NULL,
+    p_status TEXT DEFAULT 'approved',
+    p_property_type TEXT DEFAULT NULL,
+    p_min_price INTEGER DEFAULT NULL,
+    p_max_price INTEGER DEFAULT NULL
+)
+RETURNS SETOF JSONB AS $$
+    SELECT to_jsonb(p) || jsonb_build_object(
+        'distance_m', round(earth_distance(ll_to_earth(lat, lng), ll_to_earth(p.latitude, p.longitude)))
+    )
+    FROM public.properties p
+    WHERE p.latitude IS NOT NULL AND p.longitude IS NOT NULL
+      AND p.campus = p_campus
+      AND p.status = p_status
+      AND (p_property_type IS NULL OR p.property_type = p_property_type)
+      AND (p_min_price IS NULL OR p.price >= p_min_price)
+      AND (p_max_price IS NULL OR p.price <= p_max_price)
+      AND (radius_m IS NULL OR (
+          earth_box(ll_to_earth(lat, lng), radius_m) @> ll_to_earth(p.latitude, p.longitude)
+          AND earth_distance(ll_to_earth(lat, lng), ll_to_earth(p.latitude, p.longitude)) <= radius_m
+      ))
+    ORDER BY ll_to_earth(p.latitude, p.longitude) <-> ll_to_earth(lat, lng)
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION public.property_changes(
+    p_campus TEXT,
+    p_since TIMESTAMPTZ DEFAULT NULL,
+    p_after_id UUID DEFAULT NULL,
+    p_limit INTEGER DEFAULT 500
+)
+RETURNS JSONB AS $$
+    WITH candidates AS (
+        SELECT p.*
+        FROM public.properties p
+        WHERE p.campus = p_campus AND p.status = 'approved'
+          AND (p_since IS NULL
+               OR (p.updated_at, p.id) > (p_since, COALESCE(p_after_id, '00000000-0000-0000-0000-000000000000'::uuid)))
+        ORDER BY p.updated_at, p.id
+        LIMIT p_limit + 1
+    ), page AS (
+        SELECT * FROM candidates ORDER BY updated_at, id LIMIT p_limit
+    ), bounds AS (
+        SELECT (SELECT count(*) FROM candidates) > p_limit AS has_more,
+               (SELECT max(updated_at) FROM page) AS page_end
+    )
+    SELECT jsonb_build_object(
+        'upserts', COALESCE((SELECT jsonb_agg(to_jsonb(page) ORDER BY page.updated_at, page.id) FROM page), '[]'::jsonb),
+        'removals', COALESCE((
+            SELECT jsonb_agg(t.property_id ORDER BY t.removed_at)
+            FROM public.property_tombstones t, bounds b
+            WHERE p_since IS NOT NULL AND t.campus = p_campus AND t.removed_at > p_since
+              AND (NOT b.has_more OR t.removed_at <= b.page_end)
+        ), '[]'::jsonb),
+        'has_more', (SELECT has_more FROM bounds),
+        'server_time', NOW()
+    )
+$$ LANGUAGE sql STABLE;
+
+-- Listing and inspection counts are the campus's; accounts, verifications and revenue
+-- are shared by every campus in the database
+CREATE OR REPLACE FUNCTION public.admin_stats(p_campus TEXT)
+RETURNS JSONB AS $$
+    SELECT jsonb_build_object(
+        'total_users', u.total, 'total_agents', u.agents,
+        'total_properties', p.total, 'approved_properties', p.approved, 'pending_properties', p.pending,
+        'total_inspections', i.total, 'pending_inspections', i.pending, 'completed_inspections', i.completed,
+        'pending_verifications', v.pending,
+        'token_revenue', t.revenue + a.token_revenue, 'inspection_revenue', it.revenue + a.inspection_revenue
+    )
+    FROM (SELECT count(*) AS total, count(*) FILTER (WHERE role = 'agent') AS agents FROM public.users) u,
+         (SELECT count(*) AS total,
+                 count(*) FILTER (WHERE status = 'approved') AS approved,
+                 count(*) FILTER (WHERE status = 'pending') AS pending
+          FROM public.properties WHERE campus = p_campus) p,
+         (SELECT count(*) AS total,
+                 count(*) FILTER (WHERE status = 'pending') AS pending,
+                 count(*) FILTER (WHERE status = 'completed') AS completed
+          FROM public.inspections WHERE campus = p_campus) i,
+         (SELECT count(*) AS pending FROM public.agent_verification_requests WHERE status = 'pending') v,
+         (SELECT COALESCE(sum(amount), 0)::int AS revenue FROM public.transactions WHERE status = 'completed') t,
+         (SELECT COALESCE(sum(amount), 0)::int AS revenue FROM public.inspection_transactions WHERE status = 'completed') it,
+         (SELECT COALESCE(sum(completed_amount) FILTER (WHERE kind = 'token'), 0)::int AS token_revenue,
+                 COALESCE(sum(completed_amount) FILTER (WHERE kind = 'inspection'), 0)::int AS inspection_revenue
+          FROM public.payment_archive) a
+$$ LANGUAGE sql STABLE;
+
+-- Agents the inspection scheduler may send to a campus's viewings: every active agent
+-- with an approved listing there, found through the campus-leading agent index
+CREATE OR REPLACE FUNCTION public.campus_agents(p_campus TEXT)
+RETURNS TABLE(id UUID, full_name TEXT) AS $$
+    SELECT u.id, u.full_name
+    FROM public.users u
+    WHERE u.role = 'agent' AND NOT u.suspended
+      AND EXISTS (SELECT 1 FROM public.properties p
+                  WHERE p.campus = p_campus AND p.uploaded_by_agent_id = u.id AND p.status = 'approved')
+$$ LANGUAGE sql STABLE;
+
 -- ============================================
 -- ADMIN SETUP: After registering, run:
 -- UPDATE public.users SET role = 'admin' WHERE email = 'your-admin@email.com';
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# server.py and its helpers are imported as top-level modules from backend/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
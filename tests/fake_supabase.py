@@ -0,0 +1,259 @@
+"""In-memory stand-in for the supabase-py client that records every round trip.
+
+Implements the subset of the PostgREST query builder that server.py uses,
+with real filtering so handlers take their normal code paths. Each
+`execute()` (table query or RPC) is one database round trip; auth calls are
+recorded separately since they go to GoTrue rather than Postgres.
+"""
+import copy
+import uuid
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional
+
+
+class Result:
+    def __init__(self, data: Any, count: Optional[int] = None):
+        self.data = data
+        self.count = count
+
+
+def _matches(value, op, arg) -> bool:
+    if op == "eq":
+        return value == arg
+    if op == "neq":
+        return value != arg
+    if op == "in":
+        return value in arg
+    if op == "is":
+        return value is None if arg in (None, "null") else value is arg
+    if value is None:
+        return False
+    return {"gt": value > arg, "gte": value >= arg, "lt": value < arg, "lte": value <= arg}[op]
+
+
+def _terms(expr: str) -> List[str]:
+    """Split a PostgREST logic tree on its top-level commas."""
+    terms, depth, start = [], 0, 0
+    for i, char in enumerate(expr):
+        depth += {"(": 1, ")": -1}.get(char, 0)
+        if char == "," and depth == 0:
+            terms.append(expr[start:i])
+            start = i + 1
+    return terms + [expr[start:]]
+
+
+def _holds(row: dict, term: str) -> bool:
+    for combinator, test in (("and(", all), ("or(", any)):
+        if term.startswith(combinator):
+            return test(_holds(row, t) for t in _terms(term[len(combinator):-1]))
+    column, op, arg = term.split(".", 2)
+    return _matches(row.get(column), op, arg.strip('"'))
+
+
+class FakeQuery:
+    def __init__(self, db: "FakeSupabase", table: str):
+        self.db = db
+        self.table = table
+        self.op = "select"
+        self.payload = None
+        self.filters = []
+        self.orders = []
+        self.window = None
+        self.single_row = False
+        self.count = None
+        self.on_conflict = None
+        self.ignore_duplicates = False
+
+    def select(self, columns: str = "*", count: Optional[str] = None):
+        self.count = count
+        return self
+
+    def insert(self, payload):
+        self.op, self.payload = "insert", payload
+        return self
+
+    def upsert(self, payload, on_conflict: str = "id", ignore_duplicates: bool = False, **_kwargs):
+        self.op, self.payload, self.on_conflict = "upsert", payload, on_conflict
+        self.ignore_duplicates = ignore_duplicates
+        return self
+
+    def update(self, payload):
+        self.op, self.payload = "update", payload
+        return self
+
+    def delete(self):
+        self.op = "delete"
+        return self
+
+    def _filter(self, column, op, arg):
+        self.filters.append((column, op, arg))
+        return self
+
+    def eq(self, column, value):
+        return self._filter(column, "eq", value)
+
+    def neq(self, column, value):
+        return self._filter(column, "neq", value)
+
+    def gt(self, column, value):
+        return self._filter(column, "gt", value)
+
+    def gte(self, column, value):
+        return self._filter(column, "gte", value)
+
+    def lt(self, column, value):
+        return self._filter(column, "lt", value)
+
+    def lte(self, column, value):
+        return self._filter(column, "lte", value)
+
+    def in_(self, column, values):
+        return self._filter(column, "in", list(values))
+
+    def is_(self, column, value):
+        return self._filter(column, "is", value)
+
+    def or_(self, filters: str):
+        return self._filter(None, "or", filters)
+
+    def order(self, column, desc: bool = False, **_kwargs):
+        self.orders.append((column, desc))
+        return self
+
+    def limit(self, n: int):
+        self.window = (0, n)
+        return self
+
+    def range(self, start: int, end: int):
+        self.window = (start, end - start + 1)
+        return self
+
+    def single(self):
+        self.single_row = True
+        return self
+
+    maybe_single = single
+
+    def _selected(self, rows):
+        return [r for r in rows if all(
+            _holds(r, f"or({arg})") if op == "or" else _matches(r.get(c), op, arg) for c, op, arg in self.filters)]
+
+    def execute(self) -> Result:
+        self.db.record("table", self.table, self.op)
+        rows = self.db.tables.setdefault(self.table, [])
+
+        if self.op in ("insert", "upsert"):
+            new_rows = self.payload if isinstance(self.payload, list) else [self.payload]
+            written = []
+            for row in new_rows:
+                row = {"id": str(uuid.uuid4()), **copy.deepcopy(row)}
+                keys = self.on_conflict.split(",") if self.op == "upsert" else []
+                existing = next((r for r in rows if keys and all(r.get(k) == row.get(k) for k in keys)), None)
+                if existing is not None:
+                    if not self.ignore_duplicates:
+                        existing.update(row)
+                        written.append(existing)
+                else:
+                    rows.append(row)
+                    written.append(row)
+            return Result(copy.deepcopy(written))
+
+        matched = self._selected(rows)
+        if self.op == "update":
+            for row in matched:
+                row.update(copy.deepcopy(self.payload))
+            return Result(copy.deepcopy(matched))
+        if self.op == "delete":
+            self.db.tables[self.table] = [r for r in rows if r not in matched]
+            return Result(copy.deepcopy(matched))
+
+        for column, desc in reversed(self.orders):
+            matched = sorted(matched, key=lambda r: (r.get(column) is None, r.get(column) or ""), reverse=desc)
+        total = len(matched)
+        if self.window:
+            start, size = self.window
+            matched = matched[start:start + size]
+        data = copy.deepcopy(matched)
+        if self.single_row:
+            data = data[0] if data else None
+        return Result(data, total if self.count else None)
+
+
+class FakeRpc:
+    def __init__(self, db: "FakeSupabase", name: str, params: dict):
+        self.db = db
+        self.name = name
+        self.params = params
+
+    def execute(self) -> Result:
+        self.db.record("rpc", self.name, "call")
+        handler = self.db.rpcs.get(self.name)
+        return Result(handler(self.db, self.params) if handler else None)
+
+
+class FakeAuth:
+    """Bearer tokens are simply user ids."""
+
+    def __init__(self, db: "FakeSupabase"):
+        self.db = db
+        self.admin = SimpleNamespace(create_user=self.create_user)
+
+    def _create(self, email: str, full_name: Optional[str], role: Optional[str]) -> str:
+        """Add the rows the handle_new_user trigger creates; a trigger write is not a round trip."""
+        if any(u.get("email") == email for u in self.db.tables.get("users", [])):
+            raise Exception("User already registered")
+        user_id = str(uuid.uuid4())
+        self.db.tables.setdefault("users", []).append({
+            "id": user_id, "email": email, "full_name": full_name or email.split("@")[0],
+            "role": "agent" if role == "agent" else "user", "suspended": False,
+        })
+        self.db.tables.setdefault("wallets", []).append({"user_id": user_id, "token_balance": 0, "ledger_seq": 0})
+        return user_id
+
+    def _session(self, user_id: str):
+        return SimpleNamespace(user=SimpleNamespace(id=user_id), session=SimpleNamespace(access_token=user_id))
+
+    def get_user(self, token: str):
+        self.db.record("auth", "get_user", "call")
+        return self._session(token)
+
+    def sign_up(self, credentials: dict):
+        self.db.record("auth", "sign_up", "call")
+        full_name = credentials.get("options", {}).get("data", {}).get("full_name")
+        return self._session(self._create(credentials["email"], full_name, None))
+
+    def create_user(self, attributes: dict):
+        self.db.record("auth", "admin.create_user", "call")
+        user_id = self._create(attributes["email"], attributes.get("user_metadata", {}).get("full_name"),
+                               attributes.get("app_metadata", {}).get("role"))
+        return SimpleNamespace(user=SimpleNamespace(id=user_id))
+
+    def sign_in_with_password(self, credentials: dict):
+        self.db.record("auth", "sign_in_with_password", "call")
+        user = next((u for u in self.db.tables.get("users", []) if u.get("email") == credentials["email"]), None)
+        return self._session(user["id"]) if user else SimpleNamespace(user=None, session=None)
+
+    def close(self):
+        pass
+
+
+class FakeSupabase:
+    def __init__(self, rpcs: Optional[Dict[str, Callable[["FakeSupabase", dict], Any]]] = None):
+        self.tables: Dict[str, List[dict]] = {}
+        self.rpcs = rpcs or {}
+        self.calls: List[tuple] = []
+        self.auth = FakeAuth(self)
+
+    def record(self, kind: str, target: str, op: str) -> None:
+        self.calls.append((kind, target, op))
+
+    @property
+    def round_trips(self) -> List[tuple]:
+        """Database round trips (table queries and RPCs), excluding auth."""
+        return [c for c in self.calls if c[0] != "auth"]
+
+    def table(self, name: str) -> FakeQuery:
+        return FakeQuery(self, name)
+
+    def rpc(self, name: str, params: dict) -> FakeRpc:
+        return FakeRpc(self, name, params)
@@ -0,0 +1,106 @@
+import asyncio
+import json
+import os
+import re
+from pathlib import Path
+
+import pytest
+
+import server
+from cache import TTLCache, InvalidationBus
+from tests.test_query_budgets import USER, seed
+
+asyncpg = pytest.importorskip("asyncpg")
+
+# e.g. postgresql://postgres@localhost/postgres; the test creates and drops its own table
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+SCHEMA = Path(__file__).resolve().parent.parent / "supabase_schema.sql"
+
+
+def notify_function_sql():
+    match = re.search(r"CREATE OR REPLACE FUNCTION public\.notify_cache_invalidation\(\).*?\$\$ LANGUAGE plpgsql;",
+                      SCHEMA.read_text(), re.S)
+    return match.group(0)
+
+
+def test_ttl_cache_expires_and_evicts_lru():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+
+    cache.ttl = -1
+    cache.set("d", 4)
+    assert cache.get("d") is None
+
+
+def test_eviction_during_a_fill_keeps_the_old_row_out(monkeypatch):
+    db = seed(1)
+    monkeypatch.setattr(server.supabase_admin, "_client", db)
+    server.wallet_cache.clear()
+    read_wallet = db.rpcs["wallet_state"]
+
+    def racing_read(db, params):
+        wallet = read_wallet(db, params)
+        # The balance changes and its notification arrives while the old row is in flight
+        db.tables["wallets"][2]["token_balance"] = 4
+        server.invalidation_bus.handle(json.dumps({"table": "wallets", "key": params["p_user"]}))
+        return wallet
+
+    monkeypatch.setitem(db.rpcs, "wallet_state", racing_read)
+    assert server.get_wallet_row(USER)["token_balance"] == 5
+    assert server.wallet_cache.get(USER) is None
+
+    monkeypatch.setitem(db.rpcs, "wallet_state", read_wallet)
+    assert server.get_wallet_row(USER)["token_balance"] == 4
+    assert server.wallet_cache.get(USER)["token_balance"] == 4
+
+    # Of two overlapping fills only the later one is kept
+    cache = TTLCache(maxsize=10, ttl=60)
+    first, second = cache.fill_token("k"), cache.fill_token("k")
+    cache.set("k", "old", first)
+    cache.set("k", "new", second)
+    assert cache.get("k") == "new"
+
+
+@pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL not set")
+def test_notify_trigger_evicts_cached_rows():
+    async def scenario():
+        conn = await asyncpg.connect(TEST_DATABASE_URL)
+        await conn.execute("CREATE SCHEMA IF NOT EXISTS public")
+        await conn.execute(notify_function_sql())
+        await conn.execute("DROP TABLE IF EXISTS wallets_cache_test")
+        await conn.execute("CREATE TABLE wallets_cache_test (user_id TEXT PRIMARY KEY, token_balance INT)")
+        await conn.execute(
+            "CREATE TRIGGER wallets_cache_test_invalidation AFTER INSERT OR UPDATE OR DELETE ON wallets_cache_test "
+            "FOR EACH ROW EXECUTE FUNCTION public.notify_cache_invalidation('user_id')"
+        )
+        await conn.execute("INSERT INTO wallets_cache_test VALUES ('u1', 5), ('u2', 7)")
+
+        cache = TTLCache(maxsize=100, ttl=300)
+        bus = InvalidationBus(TEST_DATABASE_URL, {"wallets_cache_test": [cache]}, reconnect_delay=0.1)
+        listener = asyncio.create_task(bus.run())
+        try:
+            while not bus.connected:
+                await asyncio.sleep(0.01)
+            cache.set("u1", {"token_balance": 5})
+            cache.set("u2", {"token_balance": 7})
+
+            await conn.execute("UPDATE wallets_cache_test SET token_balance = 4 WHERE user_id = 'u1'")
+            for _ in range(100):
+                if cache.get("u1") is None:
+                    break
+                await asyncio.sleep(0.01)
+
+            assert cache.get("u1") is None
+            assert cache.get("u2") == {"token_balance": 7}
+        finally:
+            listener.cancel()
+            await asyncio.gather(listener, return_exceptions=True)
+            await conn.execute("DROP TABLE wallets_cache_test")
+            await conn.close()
+
+    asyncio.run(scenario())
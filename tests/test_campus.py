@@ -0,0 +1,110 @@
+import asyncio
+
+import httpx
+
+import server
+from db import LazyClient
+from tests.test_query_budgets import AGENT, USER, seed
+
+
+def install(monkeypatch):
+    # property-0/1 and inspection-0 are LAUTECH's; property-2/3 and inspection-1..3 are Unilorin's
+    db = seed(4)
+    for row in db.tables["properties"][2:] + db.tables["inspections"][1:]:
+        row["campus"] = "unilorin"
+    monkeypatch.setattr(server.supabase, "_client", db)
+    monkeypatch.setattr(server.supabase_admin, "_client", db)
+    monkeypatch.setattr(server.campuses, "names", ["lautech", "unilorin", "ui"])
+    for cache in (server.user_cache, server.property_cache, server.feed_caches):
+        cache.clear()
+    return db
+
+
+async def request(method, path, campus=None, token=None, **kwargs):
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    if campus:
+        headers["X-Campus"] = campus
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://test") as client:
+        return await client.request(method, path, headers=headers, **kwargs)
+
+
+def ids(response):
+    return [row["id"] for row in response.json()]
+
+
+def test_campuses_sharing_a_database_only_see_their_own_rows(monkeypatch):
+    db = install(monkeypatch)
+    assert sorted(ids(asyncio.run(request("GET", "/api/properties")))) == ["property-0", "property-1"]
+    assert sorted(ids(asyncio.run(request("GET", "/api/properties", "unilorin")))) == ["property-2", "property-3"]
+    # The query string works too, for callers that can't set headers (payment webhooks)
+    assert sorted(ids(asyncio.run(request("GET", "/api/properties", params={"campus": "unilorin"})))) == [
+        "property-2", "property-3"]
+    assert asyncio.run(request("GET", "/api/properties", "harvard")).status_code == 400
+
+    # Feeds are cached per campus, and a listing from elsewhere is not found even when cached
+    assert set(server.feed_caches) == {"lautech", "unilorin"}
+    assert asyncio.run(request("GET", "/api/properties/property-2/public", "unilorin")).status_code == 200
+    assert asyncio.run(request("GET", "/api/properties/property-2/public")).status_code == 404
+    assert ids(asyncio.run(request("GET", "/api/inspections", "unilorin", USER))) == [
+        "inspection-1", "inspection-2", "inspection-3"]
+
+    # Writes are stamped with the campus and invalidate only that campus's feed
+    response = asyncio.run(request("POST", "/api/properties", "unilorin", AGENT, json={
+        "title": "Room", "description": "Tiled", "price": 90000, "location": "Tanke", "property_type": "room",
+        "images": [], "contact_name": "Agent", "contact_phone": "0800"}))
+    new_id = response.json()["property_id"]
+    assert next(p for p in db.tables["properties"] if p["id"] == new_id)["campus"] == "unilorin"
+    assert set(server.feed_caches) == {"lautech"}
+    asyncio.run(request("GET", "/api/properties", "unilorin"))
+    asyncio.run(request("POST", f"/api/properties/{new_id}/approve", "unilorin", "admin-0", json={"status": "approved"}))
+    assert set(server.feed_caches) == {"lautech"}
+    # Updates can't reach another campus's listing
+    asyncio.run(request("PUT", "/api/properties/property-0", "unilorin", AGENT, json={"price": 1}))
+    assert db.tables["properties"][0]["price"] == 100000
+
+
+def test_campus_with_its_own_database_is_routed_there(monkeypatch):
+    shared = install(monkeypatch)
+    own = seed(1)
+    own.tables["properties"][0].update(id="ui-property", campus="ui")
+    client = LazyClient("https://ui.supabase.test", "key")
+    client._client = own
+    monkeypatch.setitem(server.supabase.databases, "ui", client)
+    monkeypatch.setitem(server.supabase_admin.databases, "ui", client)
+    shared.calls.clear()
+
+    assert ids(asyncio.run(request("GET", "/api/properties", "ui"))) == ["ui-property"]
+    assert asyncio.run(request("GET", "/api/auth/me", "ui", USER)).status_code == 200
+    assert shared.calls == []
+    assert server.supabase_admin.database_campuses() == ["lautech", "ui"]
+
+    # Jobs that maintain a database run once against each
+    compacted = []
+    monkeypatch.setattr(server, "compact_wallet_ledger",
+                        lambda: compacted.append((server.campuses.current(), server.supabase_admin.get())))
+    asyncio.run(server.across(server.compact_wallet_ledger, server.supabase_admin.database_campuses)())
+    assert compacted == [("lautech", shared), ("ui", own)]
+
+
+def test_payment_callbacks_reach_the_campus_database_named_in_the_reference(monkeypatch):
+    shared = install(monkeypatch)
+    own = seed(1)
+    client = LazyClient("https://ui.supabase.test", "key")
+    client._client = own
+    monkeypatch.setitem(server.supabase_admin.databases, "ui", client)
+
+    # A purchase made on UI is recorded in UI's database under a reference naming the campus
+    response = asyncio.run(request("POST", "/api/tokens/purchase", "ui", USER, json={
+        "quantity": 2, "email": "user-0@example.com", "phone_number": "0800"}))
+    reference = response.json()["reference"]
+    assert server.reference_campus(reference) == "ui"
+    assert [t["reference"] for t in shared.tables["transactions"]] == ["TOKEN-0", "TOKEN-1", "TOKEN-2", "TOKEN-3"]
+
+    # Korapay calls back with no campus header
+    asyncio.run(request("POST", "/api/webhooks/koralpay", json={
+        "event": "charge.success", "data": {"reference": reference, "korapay_reference": "KPY-1"}}))
+    assert next(t for t in own.tables["transactions"] if t["reference"] == reference)["status"] == "completed"
+    assert ("rpc", "wallet_apply", "call") in own.calls
+    assert ("rpc", "update_payment_status", "call") not in shared.calls
+    # References issued before campuses existed keep settling against the default database
+    assert server.reference_campus("TOKEN-20270101-ABCD1234") == "lautech"
@@ -0,0 +1,91 @@
+import gzip
+import json
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from compression import CompressedBody, CompressionMiddleware, negotiate, compress, brotli
+
+
+def listing(i):
+    return {
+        "id": f"00000000-0000-0000-0000-{i:012d}",
+        "title": f"Self contain {i} near LAUTECH main gate",
+        "description": "Tiled floor, prepaid meter, borehole water, fenced compound with security.",
+        "price": 120000 + i * 500,
+        "location": "Under G, Ogbomoso",
+        "property_type": "hostel",
+        "images": [f"https://cdn.example.com/property-images/{i}/1.jpg"],
+        "status": "approved",
+    }
+
+
+def feed(n):
+    return json.dumps([listing(i) for i in range(n)], separators=(",", ":")).encode()
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, minimum_size=1024)
+
+    @app.get("/small")
+    async def small():
+        return {"ok": True}
+
+    @app.get("/large")
+    async def large():
+        return [listing(i) for i in range(50)]
+
+    return TestClient(app)
+
+
+def test_negotiate_prefers_brotli_and_honours_q_values():
+    assert negotiate("gzip, deflate, br") == ("br" if brotli else "gzip")
+    assert negotiate("gzip;q=1.0, br;q=0") == "gzip"
+    assert negotiate("identity") is None
+    assert negotiate("") is None
+
+
+def test_middleware_skips_small_bodies_and_compresses_large(client):
+    small = client.get("/small", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in small.headers
+
+    large = client.get("/large", headers={"Accept-Encoding": "gzip"})
+    assert large.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in large.headers["vary"]
+    assert len(large.json()) == 50
+
+
+def test_cached_body_compresses_once_per_encoding():
+    body = CompressedBody(feed(100))
+    first = body.response("gzip")
+    second = body.response("gzip")
+    assert first.headers["content-encoding"] == "gzip"
+    assert first.body is second.body
+    assert gzip.decompress(first.body) == body.body
+    assert "content-encoding" not in body.response(None).headers
+
+
+def test_compression_cost_vs_bytes_saved_benchmark():
+    """Prints CPU time per compression and bytes saved across feed sizes."""
+    encodings = ["gzip"] + (["br"] if brotli else [])
+    print(f"\n{'listings':>8} {'raw KB':>8} " + " ".join(
+        f"{e + (' cached' if c else ' live'):>22}" for e in encodings for c in (False, True)))
+    for n in (1, 10, 100, 1000):
+        raw = feed(n)
+        cells = []
+        for encoding in encodings:
+            for cached in (False, True):
+                rounds = max(1, 2000 // n)
+                start = time.perf_counter()
+                for _ in range(rounds):
+                    out = compress(raw, encoding, cached=cached)
+                ms = (time.perf_counter() - start) * 1000 / rounds
+                saved = 100 * (1 - len(out) / len(raw))
+                cells.append(f"{ms:8.2f}ms {saved:5.1f}% saved")
+        print(f"{n:>8} {len(raw) / 1024:>8.1f} " + " ".join(f"{c:>22}" for c in cells))
+        if len(raw) >= 1024:
+            assert len(compress(raw, "gzip")) < len(raw)
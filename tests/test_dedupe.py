@@ -0,0 +1,112 @@
+import asyncio
+import io
+import random
+import time
+
+import httpx
+import numpy as np
+from PIL import Image, ImageFilter
+
+from dedupe import DuplicateIndex, dhash, fetch_image_hashes, IMAGE_MAX_DISTANCE
+
+AREAS = ["Under G", "Stadium", "Adenike", "Yoaco", "Aroje", "Takie", "Sabo", "Apake", "Randa"]
+FEATURES = ["tiled floor", "prepaid meter", "borehole water", "fenced compound", "wardrobe", "kitchen cabinet",
+            "pop ceiling", "security gate", "running water", "parking space", "ceramic toilet", "shower",
+            "water heater", "balcony", "burglary proof", "cross ventilation", "quiet street", "new building",
+            "good road", "generator house", "wifi ready", "study table", "ceiling fan", "two windows",
+            "large compound", "caretaker on site", "no curfew", "gated estate", "wash hand basin", "store room"]
+STREETS = ["Oyo road", "Ilorin road", "Ogbomoso-Iseyin road", "Church street", "Market street",
+           "Alhaji Bello close", "Adebayo street", "Oke Ado lane", "Railway line", "Odo Oba road"]
+
+
+def listing(i, rng):
+    return {
+        "id": f"p{i}",
+        "title": f"{rng.choice(['Self contain', 'Single room', 'Room and parlour', 'Flat'])} "
+                 f"{rng.choice(['at', 'off', 'near', 'along'])} {rng.choice(STREETS)}",
+        "description": f"{', '.join(rng.sample(FEATURES, rng.randint(3, 7)))}. "
+                       f"{rng.randint(2, 40)} minutes to LAUTECH. Landlord: {rng.randint(1000, 9999)}.",
+        "location": f"{rng.randint(1, 120)} {rng.choice(STREETS)}, {rng.choice(AREAS)}",
+    }
+
+
+def image_bytes(seed, size=(320, 240), fmt="PNG", blur=0):
+    rng = np.random.default_rng(seed)
+    # Smooth random gradients look more like photos than white noise does
+    small = rng.integers(0, 255, (6, 8, 3), dtype=np.uint8)
+    img = Image.fromarray(small).resize(size, Image.Resampling.BICUBIC)
+    if blur:
+        img = img.filter(ImageFilter.GaussianBlur(blur))
+    buffer = io.BytesIO()
+    img.save(buffer, format=fmt, quality=70) if fmt == "JPEG" else img.save(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+def test_reworded_repost_is_flagged_and_unrelated_listing_is_not():
+    rng = random.Random(5)
+    index = DuplicateIndex()
+    for i in range(2000):
+        index.add(listing(i, rng))
+
+    original = {
+        "id": "orig", "title": "Self contain with POP ceiling",
+        "description": "Tiled floor, prepaid meter, borehole water, fenced compound with security. 5 minutes walk to LAUTECH main gate.",
+        "location": "Under G, Ogbomoso",
+    }
+    index.add(original)
+    repost = {**original, "id": "repost", "title": "Self contain with POP ceiling!!",
+              "description": original["description"].replace("5 minutes", "6 minutes")}
+    match = index.find_text(repost)
+    assert match["duplicate_of"] == "orig" and match["duplicate_score"] >= 0.7
+
+    unrelated = {"id": "other", "title": "Two bedroom flat", "description": "Newly built, spacious, water heater.",
+                 "location": "Apake, Ogbomoso"}
+    assert index.find_text(unrelated) is None or index.find_text(unrelated)["duplicate_of"] != "orig"
+
+    index.remove("orig")
+    assert index.find_text(repost) is None
+
+
+def test_resized_recompressed_image_is_flagged():
+    original = dhash(image_bytes(1))
+    copy = dhash(image_bytes(1, size=(640, 480), fmt="JPEG", blur=1))
+    different = dhash(image_bytes(2))
+    assert bin(int(original, 16) ^ int(copy, 16)).count("1") <= IMAGE_MAX_DISTANCE
+
+    index = DuplicateIndex()
+    index.add_images("orig", [original, dhash(image_bytes(3))])
+    assert index.find_images("repost", [copy])["duplicate_of"] == "orig"
+    assert index.find_images("other", [different]) is None
+    # A listing never matches its own images
+    assert index.find_images("orig", [original]) is None
+
+
+def test_fetch_image_hashes_skips_broken_images():
+    images = {"/a.png": image_bytes(1), "/b.png": b"not an image"}
+
+    def handler(request):
+        body = images.get(request.url.path)
+        return httpx.Response(200, content=body) if body else httpx.Response(404)
+
+    hashes = asyncio.run(fetch_image_hashes(
+        ["http://cdn.test/a.png", "http://cdn.test/b.png", "http://cdn.test/missing.png"],
+        transport=httpx.MockTransport(handler)))
+    assert hashes == [dhash(images["/a.png"])]
+
+
+def test_lookup_latency_at_scale():
+    rng = random.Random(9)
+    listings = [listing(i, rng) for i in range(100_000)]
+    index = DuplicateIndex()
+    start = time.perf_counter()
+    index.rebuild(listings)
+    build = time.perf_counter() - start
+
+    probes = [{**listing(i, rng), "id": f"probe{i}"} for i in range(500)]
+    start = time.perf_counter()
+    for probe in probes:
+        index.find_text(probe)
+    per_lookup = (time.perf_counter() - start) / len(probes)
+
+    print(f"\nbuilt {len(index)} listings in {build:.1f}s; lookup {per_lookup * 1000:.3f} ms")
+    assert per_lookup < 0.005
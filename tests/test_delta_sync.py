@@ -0,0 +1,77 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import pytest
+
+import server
+from tests.fake_supabase import FakeSupabase
+
+NOW = datetime(2027, 3, 1, 12, tzinfo=timezone.utc)
+
+
+def property_changes(db, params):
+    """The SQL function's paging contract over an in-memory table and tombstone list."""
+    since = datetime.fromisoformat(params["p_since"]) if params["p_since"] else None
+    after = (since, params["p_after_id"] or "") if since else None
+    rows = sorted((p for p in db.tables["properties"] if p["status"] == "approved"),
+                  key=lambda p: (p["updated_at"], p["id"]))
+    rows = [p for p in rows if after is None or (datetime.fromisoformat(p["updated_at"]), p["id"]) > after]
+    page, has_more = rows[:params["p_limit"]], len(rows) > params["p_limit"]
+    page_end = datetime.fromisoformat(page[-1]["updated_at"]) if page else None
+    removals = [t["property_id"] for t in db.tables["property_tombstones"]
+                if since and datetime.fromisoformat(t["removed_at"]) > since
+                and (not has_more or datetime.fromisoformat(t["removed_at"]) <= page_end)]
+    return {"upserts": page, "removals": removals, "has_more": has_more, "server_time": NOW.isoformat()}
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    db = FakeSupabase({"property_changes": property_changes})
+    db.tables["properties"] = [{
+        "id": f"p{i:02d}", "status": "approved",
+        "updated_at": (NOW - timedelta(hours=10) + timedelta(minutes=i // 2)).isoformat(),
+    } for i in range(7)]
+    db.tables["property_tombstones"] = []
+    monkeypatch.setattr(server.supabase_admin, "_client", db)
+    monkeypatch.setattr(server, "SYNC_PAGE_SIZE", 3)
+    return db
+
+
+def changes(since=None):
+    async def get():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://test") as client:
+            return await client.get("/api/properties/changes", params={"since": since} if since else {})
+    return asyncio.run(get())
+
+
+def sync(cursor=None):
+    upserts, removals = [], []
+    while True:
+        page = changes(cursor).json()
+        upserts += [row["id"] for row in page["upserts"]]
+        removals += page["removals"]
+        cursor = page["next_cursor"]
+        if not page["has_more"]:
+            return upserts, removals, cursor
+
+
+def test_initial_sync_pages_through_the_feed_then_only_changes_follow(fake_db):
+    upserts, removals, cursor = sync()
+    assert upserts == [f"p{i:02d}" for i in range(7)] and removals == []
+
+    assert sync(cursor)[:2] == ([], [])
+
+    later = (NOW + timedelta(minutes=1)).isoformat()
+    fake_db.tables["properties"][2]["updated_at"] = later
+    fake_db.tables["properties"][5]["status"] = "pending"
+    fake_db.tables["property_tombstones"].append({"property_id": "p05", "removed_at": later})
+    upserts, removals, _ = sync(cursor)
+    assert upserts == ["p02"] and removals == ["p05"]
+
+
+def test_stale_or_malformed_cursors_are_rejected(fake_db):
+    stale = server.encode_cursor([(datetime.now(timezone.utc) - timedelta(days=400)).isoformat(), None])
+    assert changes(stale).status_code == 410
+    assert changes(server.encode_cursor(["yesterday", None])).status_code == 400
+    assert changes("garbage").status_code == 400
@@ -0,0 +1,66 @@
+import asyncio
+
+import httpx
+
+import server
+from tests.test_query_budgets import ADMIN, AGENT, USER, seed
+
+
+def install(monkeypatch):
+    db = seed(4)
+    # property-0 and property-1 belong to AGENT; another agent takes one of property-1's viewings
+    db.tables["users"].append({"id": "agent-1", "role": "agent", "email": "agent-1@example.com",
+                               "full_name": "Agent-1", "suspended": False, "created_at": "2026-01-01"})
+    dates = ["2030-03-02", "2030-03-02", "2030-03-04", "2030-03-02"]
+    for inspection, day, property_id in zip(db.tables["inspections"], dates, ["property-0", "property-1"] * 2):
+        inspection.update(inspection_date=day, property_id=property_id)
+    db.tables["inspections"][2]["status"] = "cancelled"
+    db.tables["inspections"][3]["agent_id"] = "agent-1"
+    monkeypatch.setattr(server.supabase, "_client", db)
+    monkeypatch.setattr(server.supabase_admin, "_client", db)
+    monkeypatch.setattr(server, "INSPECTION_DAILY_CAP", 3)
+    for cache in (server.user_cache, server.property_cache):
+        cache.clear()
+    return db
+
+
+async def get(path, token, **params):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://test") as client:
+        return await client.get(path, params=params, headers={"Authorization": f"Bearer {token}"})
+
+
+def test_property_calendar_shows_its_bookings_and_its_agents_room(monkeypatch):
+    install(monkeypatch)
+    response = asyncio.run(get("/api/properties/property-1/inspection-calendar", USER,
+                               start="2030-03-01", end="2030-03-05"))
+    assert response.status_code == 200
+    body = response.json()
+    assert body["daily_capacity"] == 3
+    assert [(d["date"], d["booked"], d["available"]) for d in body["days"]] == [
+        ("2030-03-01", 0, 3),
+        # property-1 has two viewings on the 2nd, but only one is AGENT's; AGENT has two that day
+        ("2030-03-02", 2, 1),
+        ("2030-03-03", 0, 3),
+        # Cancelled bookings free their slot
+        ("2030-03-04", 0, 3),
+        ("2030-03-05", 0, 3),
+    ]
+
+
+def test_agent_calendar_and_range_validation(monkeypatch):
+    install(monkeypatch)
+    # An agent always gets their own calendar
+    days = asyncio.run(get("/api/inspections/calendar", AGENT, agent_id="agent-1",
+                           start="2030-03-02", end="2030-03-02")).json()["days"]
+    assert days == [{"date": "2030-03-02", "booked": 2, "available": 1}]
+    days = asyncio.run(get("/api/inspections/calendar", ADMIN, agent_id="agent-1",
+                           start="2030-03-02", end="2030-03-02")).json()["days"]
+    assert days == [{"date": "2030-03-02", "booked": 1, "available": 2}]
+
+    assert asyncio.run(get("/api/inspections/calendar", ADMIN)).status_code == 400
+    assert asyncio.run(get("/api/inspections/calendar", AGENT, start="March")).status_code == 400
+    assert asyncio.run(get("/api/inspections/calendar", AGENT, start="2030-03-05", end="2030-03-01")).status_code == 400
+    assert asyncio.run(get("/api/inspections/calendar", AGENT, start="2030-01-01", end="2030-12-31")).status_code == 400
+
+    assigned = asyncio.run(get("/api/inspections/assigned", AGENT, start="2030-03-03", end="2030-03-31")).json()
+    assert [i["id"] for i in assigned] == ["inspection-2"]
@@ -0,0 +1,118 @@
+import random
+import time
+
+from matching import IntervalTree, SearchMatcher, terms
+
+from geo import GAZETTEER
+
+TYPES = ["self_contain", "single_room", "room_and_parlour", "flat", "hostel", "shared_apartment"]
+AREAS = list(GAZETTEER)
+WORDS = ["tiled", "prepaid", "borehole", "fenced", "wardrobe", "kitchen"]
+
+
+def maybe(rng, value, probability):
+    return value if rng.random() < probability else None
+
+
+def random_search(rng, i):
+    # Most students pin a room type, a budget and an area; a few leave filters open
+    low = maybe(rng, rng.randrange(50_000, 400_000, 10_000), 0.7)
+    high = maybe(rng, (low or rng.randrange(50_000, 400_000, 10_000)) + rng.randrange(20_000, 150_000, 10_000), 0.95)
+    return {
+        "id": f"s{i}",
+        "user_id": f"u{i % 500}",
+        "property_type": maybe(rng, rng.choice(TYPES), 0.95),
+        "min_price": low,
+        "max_price": high,
+        "location": maybe(rng, rng.choice(AREAS), 0.9),
+        "keywords": maybe(rng, rng.choice(WORDS), 0.3),
+    }
+
+
+def random_listing(rng, i):
+    return {
+        "id": f"p{i}",
+        "title": f"{rng.choice(WORDS)} room",
+        "description": " ".join(rng.sample(WORDS, 2)),
+        "price": rng.randrange(40_000, 600_000, 5_000),
+        "location": f"{rng.choice(AREAS)}, Ogbomoso",
+        "property_type": rng.choice(TYPES),
+    }
+
+
+def brute_force(searches, listing):
+    text = terms(f"{listing['title']} {listing['description']} {listing['location']}")
+    hits = set()
+    for s in searches.values():
+        if s["property_type"] and s["property_type"] != listing["property_type"]:
+            continue
+        if s["min_price"] is not None and listing["price"] < s["min_price"]:
+            continue
+        if s["max_price"] is not None and listing["price"] > s["max_price"]:
+            continue
+        if not terms(s["location"]) <= terms(listing["location"]):
+            continue
+        if not terms(s["keywords"]) <= text:
+            continue
+        hits.add(s["id"])
+    return hits
+
+
+def test_interval_tree_stab_matches_linear_scan():
+    rng = random.Random(3)
+    intervals = []
+    for i in range(2000):
+        start = rng.choice([float("-inf"), rng.uniform(0, 100)])
+        end = rng.choice([float("inf"), (0 if start == float("-inf") else start) + rng.uniform(0, 30)])
+        intervals.append((start, end, i))
+    tree = IntervalTree(intervals)
+    for point in [rng.uniform(-10, 140) for _ in range(300)] + [0, 50, 100]:
+        expected = {key for start, end, key in intervals if start <= point <= end}
+        assert set(tree.stab(point)) == expected
+
+
+def test_matcher_agrees_with_brute_force_through_adds_and_removes():
+    rng = random.Random(7)
+    searches = {f"s{i}": random_search(rng, i) for i in range(3000)}
+    matcher = SearchMatcher()
+    matcher.rebuild(list(searches.values()))
+
+    for step in range(400):
+        # Interleave incremental changes with matching, across several tree rebuilds
+        if step % 3 == 0:
+            victim = rng.choice(list(searches))
+            matcher.remove(victim)
+            del searches[victim]
+        elif step % 3 == 1:
+            search = random_search(rng, 10_000 + step)
+            searches[search["id"]] = search
+            matcher.add(search)
+        else:
+            # Re-saving an existing search replaces its filters
+            search = {**random_search(rng, 0), "id": rng.choice(list(searches))}
+            searches[search["id"]] = search
+            matcher.add(search)
+
+        listing = random_listing(rng, step)
+        assert {s["id"] for s in matcher.match(listing)} == brute_force(searches, listing)
+
+
+def test_match_avoids_scanning_every_search():
+    rng = random.Random(11)
+    searches = [random_search(rng, i) for i in range(50_000)]
+    matcher = SearchMatcher()
+    matcher.rebuild(searches)
+    listings = [random_listing(rng, i) for i in range(200)]
+
+    start = time.perf_counter()
+    for listing in listings:
+        matcher.match(listing)
+    per_match = (time.perf_counter() - start) / len(listings)
+
+    start = time.perf_counter()
+    for listing in listings[:20]:
+        brute_force({s["id"]: s for s in searches}, listing)
+    per_scan = (time.perf_counter() - start) / 20
+
+    print(f"\nmatch {per_match * 1000:.2f} ms vs full scan {per_scan * 1000:.2f} ms over {len(searches)} searches")
+    assert per_match < per_scan
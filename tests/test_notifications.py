@@ -0,0 +1,104 @@
+import json
+
+import httpx
+
+from notifications import NotificationDispatcher, ResendTransport, SMTPTransport, coalesce
+from tests.smtp_sink import SMTPSink
+
+SENDER = "Rentora <noreply@rentora.ng>"
+
+
+class Outbox:
+    """claim/finish with the semantics of the SQL functions, over a dict of rows."""
+
+    def __init__(self, events):
+        self.rows = {i: {"id": i, "kind": kind, "recipient": to, "subject_id": subject, "payload": payload,
+                         "status": "pending", "attempts": 0, "last_error": None}
+                     for i, (kind, to, subject, payload) in enumerate(events, 1)}
+
+    def claim(self, limit):
+        due = [row for row in self.rows.values() if row["status"] == "pending"][:limit]
+        for row in due:
+            row["status"], row["attempts"] = "sending", row["attempts"] + 1
+        return [dict(row) for row in due]
+
+    def finish(self, sent, retry, release, error):
+        for i in sent:
+            self.rows[i]["status"] = "sent"
+        for i in retry:
+            self.rows[i]["status"], self.rows[i]["last_error"] = "failed", error
+        for i in release:
+            self.rows[i]["status"], self.rows[i]["attempts"] = "pending", self.rows[i]["attempts"] - 1
+
+    def status(self):
+        return {i: row["status"] for i, row in self.rows.items()}
+
+
+def listing(title, status):
+    return {"title": title, "status": status, "full_name": "Ade"}
+
+
+def test_batch_is_coalesced_and_sent_over_one_connection():
+    outbox = Outbox([
+        ("listing_reviewed", "agent@example.com", "p1", listing("Room at Under G", "approved")),
+        ("listing_reviewed", "agent@example.com", "p2", listing("Flat at Stadium", "approved")),
+        ("listing_reviewed", "agent@example.com", "p1", listing("Room at Under G", "rejected")),
+        ("payment_completed", "student@example.com", "TOKEN-1",
+         {"type": "token_purchase", "reference": "TOKEN-1", "amount": 1000, "tokens": 2, "full_name": "Bola"}),
+        ("verification_reviewed", "bounce@example.com", "v1", {"status": "approved", "full_name": "Chi"}),
+    ])
+    with SMTPSink() as sink:
+        dispatcher = NotificationDispatcher(SMTPTransport(sink.host, sink.port, starttls=False),
+                                            outbox.claim, outbox.finish, SENDER)
+        stats = dispatcher.run_once()
+
+    assert stats == {"rows": 5, "sent": 2, "failed": 1, "deferred": 0}
+    assert len(sink.messages) == 2 and len(sink.connections) == 1
+    agent = next(m for m in sink.messages if m["To"] == "agent@example.com")
+    assert agent["Subject"] == "2 of your listings were reviewed"
+    body = agent.get_body(("plain",)).get_content()
+    # Only the latest event for p1 survives
+    assert body.count("Room at Under G") == 1 and '"Room at Under G" was rejected' in body
+    assert '"Flat at Stadium" was approved' in body
+    assert outbox.status() == {1: "sent", 2: "sent", 3: "sent", 4: "sent", 5: "failed"}
+    assert "bounce@example.com" in outbox.rows[5]["last_error"]
+
+
+def test_rate_limit_releases_the_overflow_without_counting_an_attempt():
+    now = [0.0]
+    outbox = Outbox([("payment_completed", f"user{i}@example.com", f"T{i}",
+                      {"type": "inspection_fee", "reference": f"T{i}", "amount": 2000}) for i in range(3)])
+    sent = []
+
+    class Recorder:
+        def send(self, messages):
+            sent.extend(m["To"] for m in messages)
+            return [None] * len(messages)
+
+    dispatcher = NotificationDispatcher(Recorder(), outbox.claim, outbox.finish, SENDER,
+                                        rate_per_minute=2, clock=lambda: now[0])
+    assert dispatcher.run_once()["deferred"] == 1
+    assert len(sent) == 2 and outbox.rows[3]["status"] == "pending" and outbox.rows[3]["attempts"] == 0
+
+    # The bucket is empty, so nothing is claimed until it refills
+    assert dispatcher.run_once()["rows"] == 0
+    now[0] = 30
+    assert dispatcher.run_once()["sent"] == 1
+    assert sent == ["user0@example.com", "user1@example.com", "user2@example.com"]
+
+
+def test_resend_batches_and_reports_failed_chunks():
+    calls = []
+
+    def handler(request):
+        calls.append(json.loads(request.content))
+        return httpx.Response(500 if len(calls) == 2 else 200, json={})
+
+    rows = [{"id": i, "kind": "verification_reviewed", "recipient": f"user{i}@example.com", "subject_id": str(i),
+             "payload": {"status": "rejected"}} for i in range(150)]
+    messages = [message for message, _ in coalesce(rows, SENDER)]
+    errors = ResendTransport("re_test", transport=httpx.MockTransport(handler)).send(messages)
+
+    assert [len(batch) for batch in calls] == [100, 50]
+    assert calls[0][0]["to"] == ["user0@example.com"] and "not approved" in calls[0][0]["text"]
+    assert errors[:100] == [None] * 100 and all(errors[100:])
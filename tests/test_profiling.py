@@ -0,0 +1,95 @@
+import asyncio
+import json
+import pstats
+import time
+
+import httpx
+from fastapi import FastAPI
+
+from profiling import SamplingProfiler, ProfilingMiddleware, AWAIT_FRAME
+
+
+def blocking_supabase_call():
+    # Stands in for a synchronous supabase-py call made from an async handler
+    time.sleep(0.05)
+
+
+def build_app(profiler, sample_rate=0.0):
+    app = FastAPI()
+
+    @app.get("/slow")
+    async def slow():
+        blocking_supabase_call()
+        await asyncio.to_thread(time.sleep, 0.05)
+        return {"ok": True}
+
+    async def authorize(headers):
+        return headers.get("authorization") == "Bearer admin"
+
+    app.add_middleware(ProfilingMiddleware, profiler=profiler, authorize=authorize, sample_rate=sample_rate)
+    return app
+
+
+async def get(app, headers=None):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        return await client.get("/slow", headers=headers or {})
+
+
+def test_disabled_requests_do_not_sample():
+    profiler = SamplingProfiler(interval=0.002)
+    app = build_app(profiler)
+
+    response = asyncio.run(get(app))
+    assert "x-profile-id" not in response.headers
+    # Header from a non-admin is ignored
+    response = asyncio.run(get(app, {"X-Profile": "1", "Authorization": "Bearer user"}))
+    assert "x-profile-id" not in response.headers
+    assert not profiler.sampling
+    assert len(profiler.profiles) == 0
+
+
+def test_profile_captures_blocking_and_awaited_time():
+    profiler = SamplingProfiler(interval=0.002)
+    app = build_app(profiler)
+
+    response = asyncio.run(get(app, {"X-Profile": "1", "Authorization": "Bearer admin"}))
+    profile = profiler.get(response.headers["x-profile-id"])
+    assert profile is not None and profile.samples > 0
+
+    functions = {frame[2]: seconds for stack, (_count, seconds) in profile.stacks.items() for frame in stack}
+    assert "blocking_supabase_call" in functions
+    waiting = sum(seconds for stack, (_count, seconds) in profile.stacks.items() if stack[-1] == AWAIT_FRAME)
+    assert waiting > 0.02
+    # Wall-clock: sampled time covers the whole request
+    total = sum(seconds for _count, seconds in profile.stacks.values())
+    assert total > 0.08
+
+    speedscope = json.loads(json.dumps(profile.to_speedscope()))
+    frames = speedscope["shared"]["frames"]
+    assert any(f["name"] == "blocking_supabase_call" for f in frames)
+    sampled = speedscope["profiles"][0]
+    assert len(sampled["samples"]) == len(sampled["weights"])
+    assert all(i < len(frames) for stack in sampled["samples"] for i in stack)
+
+
+def test_pstats_export_loads(tmp_path):
+    profiler = SamplingProfiler(interval=0.002)
+    asyncio.run(get(build_app(profiler, sample_rate=1.0)))
+    profile = profiler.profiles[-1]
+
+    path = tmp_path / "request.prof"
+    path.write_bytes(profile.to_pstats())
+    stats = pstats.Stats(str(path))
+    names = {func[2] for func in stats.stats}
+    assert "blocking_supabase_call" in names
+    assert stats.total_tt > 0
+
+
+def test_ring_is_bounded():
+    profiler = SamplingProfiler(interval=0.002, ring_size=3)
+    app = build_app(profiler, sample_rate=1.0)
+    for _ in range(5):
+        asyncio.run(get(app))
+    assert len(profiler.profiles) == 3
+    # Finished profiles drop their frame references
+    assert all(p.finished for p in profiler.profiles)
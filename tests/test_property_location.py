@@ -0,0 +1,38 @@
+import asyncio
+
+import httpx
+
+import server
+from tests.test_query_budgets import AGENT, seed
+
+
+def install(monkeypatch):
+    db = seed(1)
+    db.tables["properties"][0].update(latitude=8.2, longitude=4.3)
+    monkeypatch.setattr(server.supabase, "_client", db)
+    monkeypatch.setattr(server.supabase_admin, "_client", db)
+    for cache in (server.user_cache, server.property_cache, server.feed_caches):
+        cache.clear()
+    return db
+
+
+async def request(method, path, token=None, **kwargs):
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://test") as client:
+        return await client.request(method, path, headers=headers, **kwargs)
+
+
+def test_location_edits_keep_the_pin_unless_the_gazetteer_knows_the_place(monkeypatch):
+    db = install(monkeypatch)
+    listing = db.tables["properties"][0]
+    asyncio.run(request("PUT", "/api/properties/property-0", AGENT, json={"location": "Behind the new hostel"}))
+    assert (listing["latitude"], listing["longitude"]) == (8.2, 4.3)
+    asyncio.run(request("PUT", "/api/properties/property-0", AGENT, json={"location": "Stadium road"}))
+    assert (listing["latitude"], listing["longitude"]) == (8.1552, 4.2563)
+
+
+def test_coordinates_and_radius_are_validated(monkeypatch):
+    install(monkeypatch)
+    assert asyncio.run(request("PUT", "/api/properties/property-0", AGENT, json={"latitude": 91})).status_code == 422
+    assert asyncio.run(request("PUT", "/api/properties/property-0", AGENT, json={"longitude": -181})).status_code == 422
+    assert asyncio.run(request("GET", "/api/properties", params={"radius": 500})).status_code == 400
@@ -0,0 +1,60 @@
+import asyncio
+
+import httpx
+
+import server
+from tests.test_query_budgets import ADMIN, seed
+
+
+def install(monkeypatch):
+    db = seed(2)
+    monkeypatch.setattr(server.supabase, "_client", db)
+    monkeypatch.setattr(server.supabase_admin, "_client", db)
+    server.user_cache.clear()
+    return db
+
+
+async def post(path, body, token=None):
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://test") as client:
+        return await client.post(path, json=body, headers=headers)
+
+
+def test_registration_is_one_auth_call(monkeypatch):
+    db = install(monkeypatch)
+    response = asyncio.run(post("/api/auth/register",
+                                {"email": "ada@example.com", "password": "secret123", "full_name": "Ada"}))
+    assert response.status_code == 200
+    assert db.calls == [("auth", "sign_up", "call")]
+    user_id = response.json()["user"]["id"]
+    # Profile and wallet come from the handle_new_user trigger
+    assert any(u["id"] == user_id and u["full_name"] == "Ada" for u in db.tables["users"])
+    assert any(w["user_id"] == user_id for w in db.tables["wallets"])
+
+
+def test_bulk_provisioning_creates_accounts_with_wallets(monkeypatch):
+    db = install(monkeypatch)
+    create_user = db.auth.create_user
+
+    def flaky(attributes):
+        if attributes["email"] == "broken@example.com":
+            raise Exception("Rate limit exceeded")
+        return create_user(attributes)
+
+    monkeypatch.setattr(db.auth.admin, "create_user", flaky)
+    accounts = [{"email": f"agent{i}@example.com", "full_name": f"Agent {i}"} for i in range(300)]
+    accounts += [{"email": "AGENT0@example.com", "full_name": "Duplicate"},
+                 {"email": "user-0@example.com", "full_name": "Existing"},
+                 {"email": "broken@example.com", "full_name": "Broken"}]
+    body = asyncio.run(post("/api/users/bulk", {"role": "agent", "accounts": accounts}, ADMIN)).json()
+
+    assert len(body["created"]) == 300
+    assert body["skipped"] == ["user-0@example.com"]
+    assert body["failed"] == [{"email": "broken@example.com", "error": "Rate limit exceeded"}]
+    ids = {c["id"] for c in body["created"]}
+    created = {u["id"]: u for u in db.tables["users"] if u["id"] in ids}
+    assert len(created) == 300 and all(u["role"] == "agent" for u in created.values())
+    assert len({w["user_id"] for w in db.tables["wallets"]} & set(created)) == 300
+    assert len(db.round_trips) == 2
+
+    assert asyncio.run(post("/api/users/bulk", {"role": "admin", "accounts": accounts[:1]}, ADMIN)).status_code == 400
@@ -0,0 +1,304 @@
+"""Database round-trip budgets for every route in api_router.
+
+Each route runs against a recording fake client seeded with `n` rows per
+collection, once small and once large. A route fails if it makes more round
+trips than its budget, or if its count grows with the number of stored rows
+(an N+1). Routes that legitimately scale with request input declare
+`per_item`, and their body is built from `n` as well.
+
+Caches are cleared before every request, so budgets are cold-cache worst
+cases. Auth calls go to GoTrue, not Postgres, and are not counted.
+"""
+import asyncio
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from typing import Callable, Optional
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.routing import APIRoute
+
+import server
+from reconcile import KorapayClient
+from tests.fake_supabase import FakeSupabase
+
+SMALL, LARGE = 2, 10
+
+ADMIN, AGENT, USER = "admin-0", "agent-0", "user-0"
+IDS = {
+    "property_id": "property-0",
+    "request_id": "verification-0",
+    "inspection_id": "inspection-0",
+    "user_id": USER,
+    "reference": "TOKEN-0",
+    "profile_id": "missing",
+    "search_id": "search-0",
+}
+
+
+@dataclass
+class Route:
+    role: Optional[str]
+    budget: int
+    body: Optional[Callable[[int], object]] = None
+    per_item: int = 0
+    status: int = 200
+    query: str = ""
+
+
+ROUTES = {
+    ("POST", "/api/auth/register"): Route(None, 0, lambda n: {"email": "new@example.com", "password": "secret123", "full_name": "New"}),
+    ("POST", "/api/auth/login"): Route(None, 1, lambda n: {"email": "user-0@example.com", "password": "secret123"}),
+    ("GET", "/api/auth/me"): Route(USER, 2),
+    ("POST", "/api/agent-verification/request"): Route(
+        USER, 2, lambda n: {"id_card_url": "https://x/id.jpg", "selfie_url": "https://x/s.jpg", "address": "Under G"}, status=400),
+    ("GET", "/api/agent-verification/my-request"): Route(USER, 2),
+    ("GET", "/api/agent-verification/pending"): Route(ADMIN, 2),
+    ("GET", "/api/agent-verification/all"): Route(ADMIN, 2),
+    ("POST", "/api/agent-verification/{request_id}/review"): Route(ADMIN, 4, lambda n: {"status": "approved"}),
+    ("POST", "/api/properties"): Route(AGENT, 2, lambda n: {
+        "title": "Self contain", "description": "Tiled", "price": 150000, "location": "Under G",
+        "property_type": "self_contain", "images": [], "contact_name": "Agent", "contact_phone": "0800"}),
+    ("POST", "/api/properties/bulk"): Route(AGENT, 2, lambda n: {"properties": [{
+        "title": f"Self contain {i}", "description": "Tiled", "price": 150000, "location": "Under G",
+        "property_type": "self_contain", "images": [], "contact_name": "Agent", "contact_phone": "0800"}
+        for i in range(n)]}),
+    ("GET", "/api/properties"): Route(None, 1),
+    ("GET", "/api/properties/changes"): Route(None, 1),
+    ("GET", "/api/properties/my-listings"): Route(AGENT, 2),
+    ("GET", "/api/properties/pending"): Route(ADMIN, 2),
+    ("GET", "/api/properties/all"): Route(ADMIN, 2),
+    ("GET", "/api/properties/{property_id}"): Route(USER, 3),
+    ("GET", "/api/properties/{property_id}/public"): Route(None, 1),
+    ("GET", "/api/properties/{property_id}/views"): Route(AGENT, 3),
+    ("GET", "/api/properties/{property_id}/similar"): Route(None, 0),
+    ("GET", "/api/properties/{property_id}/inspection-calendar"): Route(USER, 3),
+    ("PUT", "/api/properties/{property_id}"): Route(AGENT, 3, lambda n: {"price": 160000}),
+    ("DELETE", "/api/properties/{property_id}"): Route(ADMIN, 2),
+    ("POST", "/api/properties/{property_id}/approve"): Route(ADMIN, 3, lambda n: {"status": "approved"}),
+    ("POST", "/api/saved-searches"): Route(USER, 3, lambda n: {"property_type": "self_contain", "max_price": 200000}),
+    ("GET", "/api/saved-searches"): Route(USER, 2),
+    ("DELETE", "/api/saved-searches/{search_id}"): Route(USER, 2),
+    ("GET", "/api/saved-searches/notifications"): Route(USER, 2),
+    ("POST", "/api/saved-searches/notifications/read"): Route(USER, 2),
+    ("GET", "/api/wallet"): Route(USER, 2),
+    ("GET", "/api/wallet/{user_id}"): Route(ADMIN, 2),
+    ("POST", "/api/tokens/purchase"): Route(USER, 2, lambda n: {"quantity": 2, "email": "user-0@example.com", "phone_number": "0800"}),
+    ("POST", "/api/properties/{property_id}/unlock"): Route(USER, 2, status=400),
+    ("GET", "/api/unlocks"): Route(USER, 3),
+    ("POST", "/api/inspections"): Route(USER, 4, lambda n: {
+        "property_id": "property-0", "inspection_date": "2030-01-01", "phone_number": "0800",
+        "email": "user-0@example.com"}),
+    ("GET", "/api/inspections"): Route(USER, 2),
+    ("GET", "/api/inspections/assigned"): Route(AGENT, 2),
+    ("GET", "/api/inspections/calendar"): Route(AGENT, 2),
+    ("GET", "/api/inspections/all"): Route(ADMIN, 2),
+    ("PUT", "/api/inspections/{inspection_id}"): Route(ADMIN, 4, lambda n: {"status": "assigned", "agent_id": AGENT}),
+    ("POST", "/api/inspections/schedule"): Route(ADMIN, 5),
+    ("GET", "/api/inspections/{inspection_id}/agent-contact"): Route(USER, 3),
+    ("GET", "/api/agent/summary"): Route(AGENT, 2),
+    ("GET", "/api/transactions"): Route(USER, 3),
+    ("GET", "/api/transactions/all"): Route(ADMIN, 3),
+    ("GET", "/api/users"): Route(ADMIN, 2),
+    ("POST", "/api/users/bulk"): Route(ADMIN, 2, lambda n: {"role": "agent", "accounts": [
+        {"email": f"new-{i}@example.com", "full_name": f"New {i}"} for i in range(n)] + [
+        {"email": "user-0@example.com", "full_name": "Existing"}]}),
+    ("GET", "/api/users/{user_id}"): Route(ADMIN, 2),
+    ("PUT", "/api/users/{user_id}/role"): Route(ADMIN, 2, lambda n: {"user_id": USER, "role": "agent"}),
+    ("PUT", "/api/users/{user_id}/suspend"): Route(ADMIN, 2, lambda n: {"user_id": USER, "suspended": True}),
+    ("GET", "/api/admin/stats"): Route(ADMIN, 2),
+    ("POST", "/api/webhooks/koralpay"): Route(None, 2, lambda n: {
+        "event": "charge.success", "data": {"reference": "TOKEN-0", "korapay_reference": "KPY-0"}}),
+    ("POST", "/api/payments/verify/{reference}"): Route(USER, 2),
+    ("POST", "/api/payments/reconcile"): Route(ADMIN, 3),
+    ("POST", "/api/payments/simulate/{reference}"): Route(None, 3),
+    ("POST", "/api/storage/upload-url"): Route(USER, 1),
+    ("GET", "/api/admin/profiles"): Route(ADMIN, 1),
+    ("GET", "/api/admin/profiles/{profile_id}"): Route(ADMIN, 1, status=404),
+    ("GET", "/api/"): Route(None, 0),
+    ("GET", "/api/campuses"): Route(None, 0),
+    ("GET", "/api/health"): Route(None, 0),
+    ("GET", "/api/health/live"): Route(None, 0),
+    ("GET", "/api/health/ready"): Route(None, 1, status=503),
+}
+
+
+def wallet_state(db, params):
+    return next((dict(w) for w in db.tables["wallets"] if w["user_id"] == params["p_user"]), None)
+
+
+def find_payment(db, reference):
+    for kind, table in (("token", "transactions"), ("inspection", "inspection_transactions")):
+        for row in db.tables[table]:
+            if row["reference"] == reference:
+                return kind, row
+    return None, None
+
+
+def update_payment_status(db, params):
+    kind, row = find_payment(db, params["p_reference"])
+    if row is None or (row["status"] == "completed" if params["p_status"] == "completed" else row["status"] != "pending"):
+        return None
+    row["status"] = params["p_status"]
+    return {**row, "kind": kind}
+
+
+def payment_by_reference(db, params):
+    kind, row = find_payment(db, params["p_reference"])
+    return {**row, "kind": kind} if row else None
+
+
+def inspection_calendar(db, params):
+    """What the per-day aggregate tables hold, computed from the inspections themselves."""
+    def booked(key, value):
+        days = {}
+        for i in db.tables["inspections"]:
+            if i[key] == value and i["status"] != "cancelled" and params["p_from"] <= i["inspection_date"] <= params["p_to"]:
+                days[i["inspection_date"]] = days.get(i["inspection_date"], 0) + 1
+        return days
+
+    agent_id = params["p_agent_id"] or next(
+        p["uploaded_by_agent_id"] for p in db.tables["properties"] if p["id"] == params["p_property_id"])
+    agent_days = booked("agent_id", agent_id)
+    own_days = booked("property_id", params["p_property_id"]) if params["p_property_id"] else agent_days
+    return [{"inspection_date": day, "booked": own_days.get(day, 0), "agent_booked": agent_days.get(day, 0)}
+            for day in sorted(set(agent_days) | set(own_days))]
+
+
+RPCS = {
+    "inspection_calendar": inspection_calendar,
+    "payment_by_reference": payment_by_reference,
+    "update_payment_status": update_payment_status,
+    "wallet_state": wallet_state,
+    "wallet_apply": lambda db, params: {"applied": True, "duplicate": False, "insufficient": False, "balance": 1},
+    "agent_summary": lambda db, params: {
+        **next((s for s in db.tables["agent_stats"] if s["agent_id"] == params["p_agent"]), {}),
+        "inspections_upcoming": sum(
+            1 for i in db.tables["inspections"] if i["agent_id"] == params["p_agent"]
+            and i["status"] in ("pending", "assigned") and i["inspection_date"] >= date.today().isoformat())},
+    "agent_inspection_load": lambda db, params: [],
+    "campus_agents": lambda db, params: [
+        {"id": u["id"], "full_name": u["full_name"]} for u in db.tables["users"]
+        if u["role"] == "agent" and not u["suspended"] and any(
+            p["uploaded_by_agent_id"] == u["id"] and p["status"] == "approved" and p["campus"] == params["p_campus"]
+            for p in db.tables["properties"])],
+    "assign_inspections": lambda db, params: len(params["assignments"]),
+    "properties_near": lambda db, params: [
+        p for p in db.tables["properties"] if p["status"] == "approved" and p["campus"] == params["p_campus"]],
+    "admin_stats": lambda db, params: {"total_users": len(db.tables["users"])},
+    "property_changes": lambda db, params: {
+        "upserts": [p for p in db.tables["properties"] if p["status"] == "approved" and p["campus"] == params["p_campus"]],
+        "removals": [], "has_more": False, "server_time": datetime.now(timezone.utc).isoformat()},
+    "search_users": lambda db, params: [
+        {**u, "match_rank": 0} for u in db.tables["users"]][:params["p_limit"]],
+}
+
+
+def seed(n: int) -> FakeSupabase:
+    db = FakeSupabase(RPCS)
+    now = datetime.now(timezone.utc)
+    old = (now - timedelta(hours=2)).isoformat()
+    users = [{"id": ADMIN, "role": "admin"}, {"id": AGENT, "role": "agent"}]
+    users += [{"id": f"user-{i}", "role": "user"} for i in range(n)]
+    db.tables["users"] = [
+        {**u, "email": f"{u['id']}@example.com", "full_name": u["id"].title(), "phone": "0800",
+         "suspended": False, "created_at": old}
+        for u in users
+    ]
+    db.tables["wallets"] = [{"user_id": u["id"], "token_balance": 5, "ledger_seq": 0} for u in users]
+    db.tables["properties"] = [{
+        "id": f"property-{i}", "title": f"Listing {i}", "description": "Tiled", "price": 100000 + i,
+        "location": "Under G", "property_type": "self_contain", "images": [], "contact_name": "Agent",
+        "contact_phone": "0800", "uploaded_by_agent_id": AGENT, "uploaded_by_agent_name": "Agent-0",
+        "status": "approved", "campus": "lautech", "created_at": old,
+    } for i in range(n)]
+    db.tables["unlocks"] = [
+        {"id": f"unlock-{i}", "user_id": USER, "property_id": f"property-{i}", "unlocked_at": old} for i in range(n)
+    ]
+    db.tables["inspections"] = [{
+        "id": f"inspection-{i}", "user_id": USER, "user_name": "User-0", "user_email": "user-0@example.com",
+        "user_phone": "0800", "property_id": f"property-{i}", "property_title": f"Listing {i}",
+        "agent_id": AGENT, "agent_name": "Agent-0", "inspection_date": "2030-01-01", "status": "pending",
+        "payment_status": "completed", "payment_reference": f"INSP-{i}", "scheduled_at": None, "campus": "lautech",
+        "created_at": old,
+    } for i in range(n)]
+    db.tables["transactions"] = [{
+        "id": f"tx-{i}", "user_id": USER, "reference": f"TOKEN-{i}", "amount": 1000, "tokens_added": 1,
+        "status": "pending", "koralpay_reference": None, "created_at": old,
+    } for i in range(n)]
+    db.tables["inspection_transactions"] = [{
+        "id": f"itx-{i}", "inspection_id": f"inspection-{i}", "user_id": USER, "reference": f"INSP-{i}",
+        "amount": 2000, "status": "pending", "koralpay_reference": None, "created_at": old,
+    } for i in range(n)]
+    db.tables["agent_verification_requests"] = [{
+        "id": f"verification-{i}", "user_id": f"user-{i}", "status": "pending", "created_at": old,
+    } for i in range(n)]
+    db.tables["saved_searches"] = [{
+        "id": f"search-{i}", "user_id": USER if i == 0 else f"user-{i}", "property_type": "self_contain",
+        "min_price": None, "max_price": 500000, "location": "under g", "keywords": None, "campus": "lautech",
+        "created_at": old,
+    } for i in range(n)]
+    db.tables["agent_stats"] = [{"agent_id": AGENT, "listings_approved": n}]
+    return db
+
+
+def fake_korapay() -> KorapayClient:
+    app = FastAPI()
+
+    @app.get("/charges/{reference}")
+    async def get_charge(reference: str):
+        return {"status": True, "data": {"reference": reference, "status": "processing"}}
+
+    return KorapayClient("sk_test", "http://korapay.test", transport=httpx.ASGITransport(app=app))
+
+
+@pytest.fixture
+def recording_db(monkeypatch):
+    """Swap server's Supabase clients for a fresh seeded recorder; returns a factory taking `n`."""
+    monkeypatch.setattr(server, "korapay_client", fake_korapay())
+
+    def install(n: int) -> FakeSupabase:
+        db = seed(n)
+        monkeypatch.setattr(server.supabase, "_client", db)
+        monkeypatch.setattr(server.supabase_admin, "_client", db)
+        server.search_matchers.current().rebuild(db.tables["saved_searches"])
+        for cache in (server.user_cache, server.wallet_cache, server.property_cache, server.feed_caches,
+                      server.unlock_cache):
+            cache.clear()
+        return db
+
+    return install
+
+
+async def call(method: str, path: str, route: Route, n: int):
+    headers = {"Authorization": f"Bearer {route.role}"} if route.role else {}
+    body = route.body(n) if route.body else None
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://test") as client:
+        return await client.request(method, path.format(**IDS) + route.query, json=body, headers=headers)
+
+
+def measure(recording_db, method: str, path: str, route: Route, n: int) -> list:
+    db = recording_db(n)
+    response = asyncio.run(call(method, path, route, n))
+    assert response.status_code == route.status, f"{method} {path}: {response.status_code} {response.text}"
+    return db.round_trips
+
+
+def test_every_route_has_a_budget():
+    routes = {(method, r.path) for r in server.api_router.routes if isinstance(r, APIRoute) for method in r.methods}
+    assert routes - set(ROUTES) == set(), "declare a query budget for new routes"
+    assert set(ROUTES) - routes == set(), "remove budgets for deleted routes"
+
+
+@pytest.mark.parametrize("method,path", list(ROUTES), ids=[f"{m} {p}" for m, p in ROUTES])
+def test_route_stays_within_query_budget(recording_db, method, path):
+    route = ROUTES[(method, path)]
+    small = measure(recording_db, method, path, route, SMALL)
+    large = measure(recording_db, method, path, route, LARGE)
+
+    limit = route.budget + route.per_item * LARGE
+    assert len(large) <= limit, f"{method} {path} made {len(large)} round trips (budget {limit}): {large}"
+    growth = len(large) - len(small)
+    assert growth <= route.per_item * (LARGE - SMALL), (
+        f"{method} {path} query count grows with stored rows ({len(small)} -> {len(large)}); likely an N+1: {large}")
@@ -0,0 +1,74 @@
+import time
+
+from db import LazyClient, ReplicaRouter
+
+
+class FakeBuilder:
+    def update(self, data):
+        return self
+
+    def select(self, columns):
+        return self
+
+
+class FakeClient:
+    def table(self, name):
+        return FakeBuilder()
+
+    def rpc(self, name, params):
+        return FakeBuilder()
+
+
+def make_router(replicas=2):
+    primary = LazyClient("https://primary.test", "key", read_rpcs={"wallet_state"})
+    primary._client = FakeClient()
+    router = ReplicaRouter(primary, [f"https://replica{i}.test" for i in range(replicas)], "key", 10)
+    return router
+
+
+def test_reads_round_robin_across_healthy_replicas():
+    router = make_router()
+    router.begin_request()
+    picks = [router.reader() for _ in range(4)]
+    assert picks == [router.replicas[0], router.replicas[1]] * 2
+
+    router.healthy[0] = False
+    assert {id(router.reader()) for _ in range(3)} == {id(router.replicas[1])}
+
+    router.healthy[1] = False
+    assert router.reader() is router.primary
+
+
+def test_write_pins_request_and_user_to_primary():
+    router = make_router()
+    state = router.begin_request()
+    router.set_user("u1")
+    router.primary.table("wallets").update({"token_balance": 1})
+    assert state["wrote"]
+    assert router.reader() is router.primary
+
+    # A later request by the same user on this worker still reads its write
+    router.begin_request()
+    assert router.reader("u1") is router.primary
+    assert router.reader("u2") is not router.primary
+
+
+def test_write_rpcs_pin_the_request_and_read_rpcs_do_not():
+    router = make_router()
+    state = router.begin_request()
+    router.primary.rpc("wallet_state", {"p_user": "u1"})
+    assert not state["wrote"]
+    router.primary.rpc("assign_inspections", {"assignments": []})
+    assert state["wrote"] and router.reader() is router.primary
+
+
+def test_cookie_window_pins_reads_on_other_workers():
+    router = make_router()
+    router.begin_request(primary_until=time.time() + 5)
+    assert router.reader() is router.primary
+
+
+def test_without_replicas_everything_reads_primary():
+    router = make_router(replicas=0)
+    router.begin_request()
+    assert router.reader() is router.primary
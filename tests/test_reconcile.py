@@ -0,0 +1,72 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import httpx
+from fastapi import FastAPI, HTTPException
+
+import server
+from reconcile import KorapayClient, classify, verify_many, SUCCESS, FAILED, PENDING, MISSING
+from tests.test_query_budgets import seed
+
+
+def fake_korapay(charges, in_flight):
+    """Minimal stand-in for Korapay's GET /charges/{reference}."""
+    app = FastAPI()
+
+    @app.get("/charges/{reference}")
+    async def get_charge(reference: str):
+        in_flight["now"] += 1
+        in_flight["max"] = max(in_flight["max"], in_flight["now"])
+        await asyncio.sleep(0.01)
+        in_flight["now"] -= 1
+        if reference == "BROKEN":
+            raise HTTPException(status_code=500, detail="upstream error")
+        if reference not in charges:
+            raise HTTPException(status_code=404, detail="Charge not found")
+        return {"status": True, "data": {"reference": reference, "status": charges[reference]}}
+
+    return app
+
+
+def test_verify_many_against_fake_korapay():
+    charges = {f"TOKEN-{i}": "success" if i % 2 else "processing" for i in range(20)}
+    charges["TOKEN-FAIL"] = "failed"
+    in_flight = {"now": 0, "max": 0}
+    client = KorapayClient("sk_test", "http://korapay.test", transport=httpx.ASGITransport(app=fake_korapay(charges, in_flight)))
+
+    references = list(charges) + ["UNKNOWN", "BROKEN"]
+    results = asyncio.run(verify_many(client, references, concurrency=4))
+
+    assert in_flight["max"] <= 4
+    assert "BROKEN" not in results
+    assert classify(results["TOKEN-1"]) == SUCCESS
+    assert classify(results["TOKEN-0"]) == PENDING
+    assert classify(results["TOKEN-FAIL"]) == FAILED
+    assert classify(results["UNKNOWN"]) == MISSING
+
+
+def test_reconciler_settles_and_closes_every_row_across_page_boundaries(monkeypatch):
+    db = seed(5)
+    # Every payment shares one created_at, so pages can only be told apart by id
+    abandoned = (datetime.now(timezone.utc) - timedelta(days=2)).isoformat()
+    for row in db.tables["transactions"] + db.tables["inspection_transactions"]:
+        row["created_at"] = abandoned
+    for inspection in db.tables["inspections"]:
+        inspection["payment_status"] = "pending"
+    charges = {"TOKEN-0": "success", "TOKEN-3": "success", "TOKEN-1": "failed", "TOKEN-2": "processing",
+               "INSP-4": "success", "INSP-0": "failed"}
+    client = KorapayClient("sk_test", "http://korapay.test",
+                           transport=httpx.ASGITransport(app=fake_korapay(charges, {"now": 0, "max": 0})))
+    monkeypatch.setattr(server.supabase_admin, "_client", db)
+    monkeypatch.setattr(server, "korapay_client", client)
+    monkeypatch.setattr(server, "RECONCILE_PAGE_SIZE", 2)
+
+    summary = asyncio.run(server.reconcile_pending_payments())
+
+    assert summary == {"settled": 3, "failed": 2, "expired": 5}
+    assert {t["reference"]: t["status"] for t in db.tables["transactions"]} == {
+        "TOKEN-0": "completed", "TOKEN-1": "failed", "TOKEN-2": "expired", "TOKEN-3": "completed", "TOKEN-4": "expired"}
+    assert [c for c in db.calls if c[1] == "wallet_apply"] == [("rpc", "wallet_apply", "call")] * 2
+    inspections = {i["id"]: (i["payment_status"], i["status"]) for i in db.tables["inspections"]}
+    assert inspections["inspection-4"] == ("completed", "assigned")
+    assert inspections["inspection-0"] == inspections["inspection-1"] == ("failed", "cancelled")
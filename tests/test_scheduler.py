@@ -0,0 +1,23 @@
+import server
+from tests.test_query_budgets import AGENT, seed
+
+
+def add_agent(db, agent_id, campus, suspended=False):
+    db.tables["users"].append({"id": agent_id, "role": "agent", "full_name": agent_id.title(), "suspended": suspended})
+    db.tables["properties"].append({"id": f"{agent_id}-listing", "uploaded_by_agent_id": agent_id,
+                                    "status": "approved", "campus": campus})
+
+
+def test_overflow_goes_to_idle_agents_on_the_campus(monkeypatch):
+    db = seed(4)
+    add_agent(db, "agent-idle", "lautech")
+    add_agent(db, "agent-elsewhere", "unilorin")
+    add_agent(db, "agent-suspended", "lautech", suspended=True)
+    assigned = []
+    monkeypatch.setitem(db.rpcs, "assign_inspections", lambda db, params: assigned.extend(params["assignments"]))
+    monkeypatch.setattr(server.supabase_admin, "_client", db)
+    monkeypatch.setattr(server, "INSPECTION_DAILY_CAP", 2)
+
+    # All four viewings are on one day and start with the listing agent, who can take two
+    assert server.run_inspection_scheduler() == {"assigned": 4, "unassigned": 0}
+    assert sorted(a["agent_id"] for a in assigned) == [AGENT, AGENT, "agent-idle", "agent-idle"]
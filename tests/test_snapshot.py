@@ -0,0 +1,142 @@
+import asyncio
+import json
+import time
+from datetime import timedelta
+
+import httpx
+import pytest
+
+import server
+from similarity import SimilarityIndex
+from snapshot import CatalogueSnapshot
+from tests.fake_supabase import FakeSupabase
+from tests.test_delta_sync import NOW, property_changes
+from tests.test_query_budgets import seed
+
+
+@pytest.fixture
+def snapshot(monkeypatch, tmp_path):
+    snapshot = CatalogueSnapshot(tmp_path / "catalogue-lautech.snap")
+    monkeypatch.setitem(server.catalogue_snapshots, "lautech", snapshot)
+    server.feed_caches.clear()
+    server.property_cache.clear()
+    yield snapshot
+    server.feed_caches.clear()
+
+
+async def get(path, **params):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://test") as client:
+        return await client.get(path, params=params)
+
+
+def test_snapshot_round_trips_through_disk(tmp_path):
+    listings = [{"id": f"p{i}", "title": f"Room {i} ₦", "price": i} for i in range(3)]
+    CatalogueSnapshot(tmp_path / "s.snap").write(listings, ["2027-01-01T00:00:00+00:00", None])
+
+    # A new process maps the file without parsing the listings
+    cold = CatalogueSnapshot(tmp_path / "s.snap")
+    assert not cold.loaded and cold.load()
+    assert cold.feed_body() == json.dumps(listings, separators=(",", ":")).encode()
+    assert cold.get("p1") == listings[1] and cold.get("p9") is None
+    assert cold.cursor == ["2027-01-01T00:00:00+00:00", None] and cold.age() < 5
+
+    (tmp_path / "bad.snap").write_bytes(b"not a snapshot\n[]")
+    assert not CatalogueSnapshot(tmp_path / "bad.snap").load()
+    assert not CatalogueSnapshot(tmp_path / "missing.snap").load()
+
+
+def test_public_reads_fall_back_to_the_snapshot(monkeypatch, snapshot):
+    db = seed(3)
+    db.tables["properties"][2]["property_type"] = "flat"
+    monkeypatch.setattr(server.supabase, "_client", db)
+    monkeypatch.setattr(server.supabase_admin, "_client", db)
+    server.refresh_catalogue_snapshot()
+    live = asyncio.run(get("/api/properties"))
+    assert "X-Snapshot-Age" not in live.headers
+
+    def down(*args):
+        raise ConnectionError("database unreachable")
+
+    monkeypatch.setattr(db, "table", down)
+    monkeypatch.setattr(db, "rpc", down)
+    server.feed_caches.clear()
+    stale = asyncio.run(get("/api/properties"))
+    assert stale.status_code == 200 and stale.json() == live.json()
+    assert int(stale.headers["X-Snapshot-Age"]) >= 0 and stale.headers["Cache-Control"] == "no-store"
+    assert [p["id"] for p in asyncio.run(get("/api/properties", property_type="flat")).json()] == ["property-2"]
+
+    listing = asyncio.run(get("/api/properties/property-1/public"))
+    assert listing.status_code == 200 and "X-Snapshot-Age" in listing.headers
+    assert listing.json()["contact_phone"] == "***LOCKED***"
+    assert asyncio.run(get("/api/properties/missing/public")).status_code == 404
+
+    # Cold start with the database down: the similarity index comes from the snapshot
+    monkeypatch.setitem(server.similar_indexes, "lautech", SimilarityIndex())
+    server.rebuild_similarity_index()
+    assert len(server.similar_indexes["lautech"]) == 3
+
+
+def test_slow_database_is_answered_from_the_snapshot(monkeypatch, snapshot):
+    db = seed(2)
+    monkeypatch.setattr(server.supabase, "_client", db)
+    monkeypatch.setattr(server.supabase_admin, "_client", db)
+    server.refresh_catalogue_snapshot()
+    table = db.table
+
+    def slow(name):
+        time.sleep(0.3)
+        return table(name)
+
+    monkeypatch.setattr(db, "table", slow)
+    monkeypatch.setattr(server, "SNAPSHOT_LATENCY_BUDGET_SECONDS", 0.05)
+    response = asyncio.run(get("/api/properties"))
+    assert "X-Snapshot-Age" in response.headers
+    assert [p["id"] for p in response.json()] == ["property-0", "property-1"]
+
+
+def test_refresh_applies_changes_and_skips_rewrites_when_nothing_changed(monkeypatch, snapshot):
+    db = FakeSupabase({"property_changes": property_changes})
+    db.tables["properties"] = [{
+        "id": f"p{i:02d}", "status": "approved", "created_at": f"2027-01-0{i + 1}",
+        "updated_at": (NOW - timedelta(hours=10 - i)).isoformat(),
+    } for i in range(5)]
+    db.tables["property_tombstones"] = []
+    monkeypatch.setattr(server.supabase_admin, "_client", db)
+    monkeypatch.setattr(server, "SYNC_PAGE_SIZE", 2)
+
+    server.refresh_catalogue_snapshot()
+    assert [p["id"] for p in snapshot.listings()] == ["p04", "p03", "p02", "p01", "p00"]
+    written = snapshot.path.stat().st_mtime_ns
+
+    server.refresh_catalogue_snapshot()
+    assert snapshot.path.stat().st_mtime_ns == written
+
+    later = (NOW + timedelta(minutes=1)).isoformat()
+    db.tables["properties"][1].update(status="pending", updated_at=later)
+    db.tables["property_tombstones"].append({"property_id": "p01", "removed_at": later})
+    db.tables["properties"][3].update(title="Renovated", updated_at=later)
+    server.refresh_catalogue_snapshot()
+    assert [p["id"] for p in snapshot.listings()] == ["p04", "p03", "p02", "p00"]
+    assert snapshot.get("p03")["title"] == "Renovated"
+
+
+def test_only_an_unreachable_database_falls_back_to_the_snapshot(monkeypatch, snapshot):
+    db = seed(2)
+    monkeypatch.setattr(server.supabase, "_client", db)
+    monkeypatch.setattr(server.supabase_admin, "_client", db)
+    server.refresh_catalogue_snapshot()
+    revalidations = []
+    monkeypatch.setattr(server, "revalidate_snapshot", lambda: revalidations.append(1))
+
+    missing = asyncio.run(get("/api/properties/property-9/public"))
+    assert missing.status_code == 404 and "X-Snapshot-Age" not in missing.headers
+
+    def broken(name):
+        raise ValueError("malformed filter")
+
+    monkeypatch.setattr(db, "table", broken)
+    with pytest.raises(ValueError):
+        asyncio.run(get("/api/properties/property-0/public"))
+    with pytest.raises(ValueError):
+        asyncio.run(get("/api/properties"))
+    assert revalidations == []
@@ -0,0 +1,47 @@
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+
+# Regression budgets for cold starts on autoscaled/serverless deploys
+IMPORT_BUDGET_SECONDS = float(os.environ.get("IMPORT_BUDGET_SECONDS", "1.5"))
+COLD_START_BUDGET_SECONDS = float(os.environ.get("COLD_START_BUDGET_SECONDS", "3.0"))
+
+
+def run_fresh(code):
+    """Run `code` in a new interpreter from backend/ and return (seconds, stdout)."""
+    env = {**os.environ, "SUPABASE_URL": "", "SUPABASE_SERVICE_KEY": ""}
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, env=env,
+                            capture_output=True, text=True, check=True)
+    return time.perf_counter() - start, result.stdout.strip()
+
+
+def test_import_does_not_load_supabase():
+    elapsed, loaded = run_fresh("import sys, server; print('supabase' in sys.modules)")
+    assert loaded == "False"
+    assert elapsed < IMPORT_BUDGET_SECONDS, f"import took {elapsed:.2f}s"
+
+
+def test_cold_start_to_first_response():
+    elapsed, status = run_fresh(
+        "from fastapi.testclient import TestClient\n"
+        "import server\n"
+        "with TestClient(server.app) as client:\n"
+        "    print(client.get('/api/health/live').status_code)\n"
+    )
+    assert status == "200"
+    assert elapsed < COLD_START_BUDGET_SECONDS, f"cold start took {elapsed:.2f}s"
+
+
+def test_readiness_reports_unconfigured_database():
+    _, status = run_fresh(
+        "from fastapi.testclient import TestClient\n"
+        "import server\n"
+        "with TestClient(server.app) as client:\n"
+        "    print(client.get('/api/health/ready').status_code)\n"
+    )
+    assert status == "503"
@@ -0,0 +1,38 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import httpx
+
+import server
+from tests.test_query_budgets import ADMIN, seed
+
+
+async def get(**params):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://test") as client:
+        response = await client.get("/api/transactions/all", params=params,
+                                    headers={"Authorization": f"Bearer {ADMIN}"})
+        assert response.status_code == 200, response.text
+        return response.json()
+
+
+def test_all_transactions_are_returned_unless_a_window_or_page_is_asked_for(monkeypatch):
+    db = seed(5)
+    now = datetime.now(timezone.utc)
+    # Two-year-old history, and three payments sharing one timestamp
+    for i, row in enumerate(db.tables["transactions"]):
+        row["created_at"] = (now - timedelta(days=700)).isoformat() if i < 2 else now.isoformat()
+    monkeypatch.setattr(server.supabase, "_client", db)
+    monkeypatch.setattr(server.supabase_admin, "_client", db)
+
+    everything = asyncio.run(get())
+    assert len(everything["token_transactions"]) == 5 and "next_cursor" not in everything
+    assert len(asyncio.run(get(days=90))["token_transactions"]) == 3
+
+    pages, cursor = [], None
+    while True:
+        page = asyncio.run(get(limit=2, **({"cursor": cursor} if cursor else {})))
+        pages.append([t["id"] for t in page["token_transactions"]])
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+    assert pages == [["tx-4", "tx-3"], ["tx-2", "tx-1"], ["tx-0"]]
@@ -0,0 +1,111 @@
+import asyncio
+import math
+import random
+from datetime import datetime, timezone
+
+import httpx
+import pytest
+
+import server
+from tests.fake_supabase import FakeSupabase
+from trending import WEIGHTS, TrendingRanker
+
+HOUR = 3600
+NOW = 1_800_000_000.0
+
+
+def random_events(rng, count, start, end):
+    return sorted(((f"p{rng.randrange(200)}", rng.choice(["unlock", "inspection", "view"]), rng.uniform(start, end), 1)
+                   for _ in range(count)), key=lambda e: e[2])
+
+
+def brute_force(events, now, half_life_hours=48):
+    scores = {}
+    for property_id, kind, at, count in events:
+        age = max(now - at, 0)
+        scores[property_id] = scores.get(property_id, 0) + WEIGHTS[kind] * count * 0.5 ** (age / (half_life_hours * HOUR))
+    return scores
+
+
+def test_incremental_updates_match_a_full_rebuild():
+    rng = random.Random(4)
+    events = random_events(rng, 5000, NOW - 20 * 24 * HOUR, NOW)
+    incremental = TrendingRanker()
+    history = [e for e in events if e[2] < NOW - 24 * HOUR]
+    incremental.rebuild(history, now=NOW - 24 * HOUR)
+    # Feed the last day in batches, as the periodic job would
+    for tick in range(1, 25):
+        tick_end = NOW - 24 * HOUR + tick * HOUR
+        incremental.update([e for e in events if tick_end - HOUR <= e[2] < tick_end], now=tick_end)
+
+    expected = brute_force(events, NOW)
+    actual = incremental.scores(NOW)
+    assert set(actual) == set(expected)
+    assert all(math.isclose(actual[p], expected[p], rel_tol=1e-9) for p in expected)
+
+    rebuilt = TrendingRanker()
+    rebuilt.rebuild(events, now=NOW)
+    assert rebuilt._positions == incremental._positions
+
+
+def test_view_buckets_only_count_growth():
+    ranker = TrendingRanker()
+    today, yesterday = "2027-01-15", "2027-01-14"
+    now = datetime(2027, 1, 15, 18, tzinfo=timezone.utc).timestamp()
+    ranker.rebuild([], [{"property_id": "a", "day": yesterday, "views": 10},
+                        {"property_id": "a", "day": today, "views": 4}], now=now)
+    # Yesterday's views are dated to its midday, 30 hours before now
+    expected = 10 * 0.5 ** (30 / 48) + 4
+    assert math.isclose(ranker.scores(now)["a"], expected)
+
+    ranker.update([], [{"property_id": "a", "day": today, "views": 6}], now=now)
+    assert math.isclose(ranker.scores(now)["a"], expected + 2)
+    ranker.update([], [{"property_id": "a", "day": today, "views": 6}], now=now)
+    assert math.isclose(ranker.scores(now)["a"], expected + 2)
+
+
+def test_rank_puts_trending_first_and_keeps_default_order_for_the_rest():
+    ranker = TrendingRanker()
+    ranker.rebuild([("c", "unlock", NOW - HOUR, 1), ("b", "view", NOW - HOUR, 1),
+                    ("c", "inspection", NOW - 100 * HOUR, 1)], now=NOW)
+    rows = [{"id": i} for i in ["a", "b", "c", "d"]]
+    assert [row["id"] for row in ranker.rank(rows)] == ["c", "b", "a", "d"]
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    db = FakeSupabase()
+    db.tables["properties"] = [{"id": f"p{i}", "status": "approved", "campus": "lautech",
+                                "created_at": f"2027-01-0{i + 1}T00:00:00+00:00"} for i in range(4)]
+    monkeypatch.setattr(server.supabase_admin, "_client", db)
+    monkeypatch.setattr(server, "trending", TrendingRanker())
+    server.feed_caches.clear()
+    yield db
+    server.feed_caches.clear()
+
+
+async def get(params):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://test") as client:
+        return await client.get("/api/properties", params=params)
+
+
+def test_trending_sort_costs_the_same_single_query(fake_db):
+    server.trending.rebuild([("p1", "unlock", NOW, 1), ("p2", "view", NOW, 1)], now=NOW)
+    response = asyncio.run(get({"sort": "trending"}))
+    assert [row["id"] for row in response.json()] == ["p1", "p2", "p3", "p0"]
+    assert len(fake_db.round_trips) == 1
+    assert asyncio.run(get({"sort": "popular"})).status_code == 400
+
+
+def test_event_watermark_keeps_events_sharing_its_timestamp(monkeypatch, fake_db):
+    monkeypatch.setattr(server, "trending_watermarks", {})
+    at = "2027-01-05T12:00:00+00:00"
+    fake_db.tables["unlocks"] = [{"id": f"u{i}", "property_id": f"p{i}", "unlocked_at": at} for i in range(3)]
+    source = ("unlocks", "unlocked_at", "unlock")
+
+    assert len(server.load_trending_events(source, ["2027-01-01T00:00:00+00:00", None])) == 3
+    # Written in the same instant as the last event already read
+    fake_db.tables["unlocks"].append({"id": "u3", "property_id": "p3", "unlocked_at": at})
+    events = server.load_trending_events(source, server.trending_watermarks[("lautech", "unlocks")])
+    assert [e[0] for e in events] == ["p3"]
+    assert server.load_trending_events(source, server.trending_watermarks[("lautech", "unlocks")]) == []
@@ -0,0 +1,68 @@
+import asyncio
+import json
+
+import httpx
+
+import server
+from tests.test_query_budgets import USER, fake_korapay, seed
+
+
+def install(monkeypatch, n=5):
+    db = seed(n)
+    monkeypatch.setattr(server.supabase, "_client", db)
+    monkeypatch.setattr(server.supabase_admin, "_client", db)
+    monkeypatch.setattr(server, "korapay_client", fake_korapay())
+    for cache in (server.user_cache, server.wallet_cache, server.property_cache, server.unlock_cache):
+        cache.clear()
+    return db
+
+
+async def call(method, path):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://test") as client:
+        return await client.request(method, path, headers={"Authorization": f"Bearer {USER}"})
+
+
+def unlock_queries(db):
+    return [trip for trip in db.round_trips if trip[1] == "unlocks"]
+
+
+def test_detail_reads_unlocks_once_per_user(monkeypatch):
+    db = install(monkeypatch)
+    first = asyncio.run(call("GET", "/api/properties/property-0")).json()
+    assert first["contact_unlocked"] and first["contact_phone"] != "***LOCKED***"
+    assert len(unlock_queries(db)) == 1
+
+    db.calls.clear()
+    for i in range(1, 4):
+        asyncio.run(call("GET", f"/api/properties/property-{i}"))
+    assert unlock_queries(db) == []
+
+
+def test_unlock_updates_the_cached_set(monkeypatch):
+    db = install(monkeypatch)
+    db.tables["unlocks"] = []
+    locked = asyncio.run(call("GET", "/api/properties/property-1")).json()
+    assert not locked["contact_unlocked"] and locked["contact_phone"] == "***LOCKED***"
+
+    assert asyncio.run(call("POST", "/api/properties/property-1/unlock")).status_code == 200
+    db.calls.clear()
+    unlocked = asyncio.run(call("GET", "/api/properties/property-1")).json()
+    assert unlocked["contact_unlocked"] and unlocked["contact_phone"] != "***LOCKED***"
+    assert db.round_trips == []
+    assert asyncio.run(call("POST", "/api/properties/property-1/unlock")).status_code == 400
+
+    # An unlock written by another worker evicts the entry through the invalidation bus
+    server.invalidation_bus.handle(json.dumps({"table": "unlocks", "key": USER}))
+    assert server.unlock_cache.get(USER) is None
+
+
+def test_unlock_that_lost_a_race_succeeds_without_a_second_row(monkeypatch):
+    db = install(monkeypatch)
+    db.tables["unlocks"] = []
+    server.get_unlocked_ids(USER)
+    # A concurrent request unlocked the listing after this worker cached the empty set
+    db.tables["unlocks"].append({"id": "unlock-raced", "user_id": USER, "property_id": "property-1"})
+
+    response = asyncio.run(call("POST", "/api/properties/property-1/unlock"))
+    assert response.status_code == 200 and response.json()["contact_phone"] != "***LOCKED***"
+    assert [u["id"] for u in db.tables["unlocks"]] == ["unlock-raced"]
@@ -0,0 +1,65 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import httpx
+
+import server
+from tests.fake_supabase import FakeSupabase
+
+ADMIN = "admin-0"
+
+
+def search_users(db, params):
+    """Keyset semantics of the SQL function, without the text matching."""
+    rows = [u for u in db.tables["users"]
+            if (params["p_role"] is None or u["role"] == params["p_role"])
+            and (params["p_suspended"] is None or u["suspended"] == params["p_suspended"])]
+    rows.sort(key=lambda u: (u["created_at"], u["id"]), reverse=True)
+    if params["p_after_id"] is not None:
+        after = (params["p_after_created_at"], params["p_after_id"])
+        rows = [u for u in rows if (u["created_at"], u["id"]) < after]
+    return [{**u, "match_rank": 0} for u in rows[:params["p_limit"]]]
+
+
+def install(monkeypatch, count):
+    db = FakeSupabase({"search_users": search_users})
+    now = datetime.now(timezone.utc)
+    db.tables["users"] = [{"id": ADMIN, "role": "admin", "email": "admin@example.com", "full_name": "Admin",
+                           "suspended": False, "created_at": now.isoformat()}]
+    db.tables["users"] += [{
+        "id": f"user-{i:03d}", "role": "agent" if i % 3 == 0 else "user", "email": f"user{i}@example.com",
+        "full_name": f"User {i}", "suspended": i % 7 == 0,
+        # Pairs share a timestamp so the id tiebreak matters
+        "created_at": (now - timedelta(minutes=i // 2 + 1)).isoformat(),
+    } for i in range(count)]
+    monkeypatch.setattr(server.supabase, "_client", db)
+    monkeypatch.setattr(server.supabase_admin, "_client", db)
+    server.user_cache.clear()
+    return db
+
+
+async def get(path, **params):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://test") as client:
+        return await client.get(path, params=params, headers={"Authorization": f"Bearer {ADMIN}"})
+
+
+def test_cursor_walks_every_matching_user_once(monkeypatch):
+    db = install(monkeypatch, 25)
+    seen, cursor = [], None
+    while True:
+        params = {"role": "user", "limit": 4, **({"cursor": cursor} if cursor else {})}
+        page = asyncio.run(get("/api/users", **params)).json()
+        seen += [u["id"] for u in page["users"]]
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+    expected = [u["id"] for u in search_users(db, {"p_role": "user", "p_suspended": None, "p_after_id": None,
+                                                    "p_limit": 100})]
+    assert seen == expected and len(set(seen)) == len(seen)
+
+
+def test_invalid_search_parameters_are_rejected(monkeypatch):
+    install(monkeypatch, 3)
+    assert asyncio.run(get("/api/users", cursor="not-a-cursor")).status_code == 400
+    assert asyncio.run(get("/api/users", role="owner")).status_code == 400
+    assert asyncio.run(get("/api/users", limit=0)).status_code == 400
@@ -0,0 +1,72 @@
+import asyncio
+import random
+
+import pytest
+
+from views import BloomFilter, ViewCounter
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_bloom_filter_false_positive_rate_is_near_target():
+    bloom = BloomFilter(10_000, 0.01)
+    for i in range(10_000):
+        bloom.add(f"member-{i}")
+    assert all(f"member-{i}" in bloom for i in range(10_000))
+    false_positives = sum(f"other-{i}" in bloom for i in range(20_000))
+    assert false_positives / 20_000 < 0.02
+    # ~9.6 bits per key at 1%
+    assert len(bloom.bits) < 10_000 * 10 / 8 + 8
+
+
+def test_repeat_views_within_the_window_count_once():
+    clock = Clock()
+    counter = ViewCounter(window=60, clock=clock)
+    assert counter.record("p1", "alice")
+    assert not counter.record("p1", "alice")
+    assert counter.record("p1", "bob")
+    assert counter.record("p2", "alice")
+
+    # Still remembered one window later, forgotten after two
+    clock.now = 90
+    assert not counter.record("p1", "alice")
+    clock.now = 250
+    assert counter.record("p1", "alice")
+    assert counter.drain() == {"p1": 3, "p2": 1}
+    assert counter.pending == 0
+
+
+def test_filter_rotates_early_when_full():
+    counter = ViewCounter(window=3600, capacity=100, clock=Clock())
+    for i in range(1000):
+        counter.record("p1", f"viewer-{i}")
+    # Each filter only ever holds `capacity` keys, so false positives stay bounded
+    assert counter._current.count <= 100
+    assert counter.pending > 950
+
+
+def test_failed_flush_keeps_counts_for_the_next_one():
+    counter = ViewCounter(clock=Clock())
+    rng = random.Random(1)
+    for i in range(500):
+        counter.record(f"p{rng.randrange(20)}", f"viewer-{i}")
+    expected = dict(counter._counts)
+
+    def broken(counts):
+        raise ConnectionError("database unavailable")
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(counter.flush(broken))
+    counter.record("p0", "late-viewer")
+    expected["p0"] = expected.get("p0", 0) + 1
+
+    written = []
+    assert asyncio.run(counter.flush(written.append)) == sum(expected.values())
+    assert written == [expected]
+    assert asyncio.run(counter.flush(written.append)) == 0 and len(written) == 1
@@ -0,0 +1,55 @@
+import asyncio
+import json
+import os
+import time
+import uuid
+
+import pytest
+
+asyncpg = pytest.importorskip("asyncpg")
+
+# Scratch database with supabase_schema.sql applied (the test creates and removes its own user)
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+
+pytestmark = pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL not set")
+
+CREDITS = 300
+DEBITS = 400
+REPLAYS = 100
+POOL_SIZE = 20
+
+
+async def apply(pool, user_id, delta, ref):
+    raw = await pool.fetchval("SELECT public.wallet_apply($1, $2, $3, 'bench')", user_id, delta, ref)
+    return json.loads(raw)
+
+
+def test_concurrent_credits_and_debits_benchmark():
+    async def scenario():
+        pool = await asyncpg.create_pool(TEST_DATABASE_URL, min_size=POOL_SIZE, max_size=POOL_SIZE)
+        user_id = uuid.uuid4()
+        await pool.execute("INSERT INTO auth.users (id, email) VALUES ($1, $2)", user_id, f"{user_id}@bench.test")
+        try:
+            ops = [(1, f"bench-credit-{i}") for i in range(CREDITS)]
+            ops += [(-1, f"bench-debit-{i}") for i in range(DEBITS)]
+            ops += [(1, f"bench-credit-{i}") for i in range(REPLAYS)]
+
+            start = time.perf_counter()
+            results = await asyncio.gather(*(apply(pool, user_id, delta, ref) for delta, ref in ops))
+            elapsed = time.perf_counter() - start
+            print(f"\nwallet_apply: {len(ops)} ops in {elapsed:.2f}s ({len(ops) / elapsed:.0f} ops/s, pool={POOL_SIZE})")
+
+            applied_debits = sum(1 for (delta, _), r in zip(ops, results) if delta < 0 and r["applied"])
+            duplicates = sum(1 for r in results if r["duplicate"])
+            assert duplicates == REPLAYS
+            assert all(r["balance"] >= 0 for r in results)
+
+            state = json.loads(await pool.fetchval("SELECT public.wallet_state($1)", user_id))
+            assert state["token_balance"] == CREDITS - applied_debits
+            ledger_sum = await pool.fetchval("SELECT sum(delta) FROM public.wallet_ledger WHERE user_id = $1", user_id)
+            assert ledger_sum == state["token_balance"]
+        finally:
+            await pool.execute("DELETE FROM auth.users WHERE id = $1", user_id)
+            await pool.close()
+
+    asyncio.run(scenario())